@@ -0,0 +1,171 @@
+"""
+Общие помощники для замеров производительности.
+Замеры выполняются на БД из settings.DATABASE_URL, поэтому запускать их стоит на отдельной базе.
+"""
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable
+
+import ormar
+import sqlalchemy
+
+import models
+import settings
+
+# Количество строк, к которому приводятся замеры
+ROWS_SCALE = 10_000
+
+FIRST_NAMES = ['Иван', 'Петр', 'Сергей', 'Анна', 'Мария', 'Ольга', 'Алексей', 'Елена']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов']
+SURNAMES = ['Иванович', 'Петрович', 'Сергеевич', 'Алексеевич', 'Андреевна', 'Олеговна']
+
+
+def run[T](coroutine: Awaitable[T]) -> T:
+    return settings.LOOP.run_until_complete(coroutine)
+
+
+async def measure[T](callback: Callable[[], Awaitable[T]], repeat: int = 3) -> tuple[float, T]:
+    """
+    Выполняет корутину несколько раз и возвращает лучшее время.
+    :param callback: Функция, возвращающая корутину
+    :param repeat: Количество повторов
+    :return: лучшее время в секундах и результат последнего запуска
+    """
+
+    best = float('inf')
+    result = None
+
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        result = await callback()
+        best = min(best, time.perf_counter() - started_at)
+
+    return best, result
+
+
+def estimate_rows_bytes(rows: list[Any]) -> int:
+    """
+    Оценивает объем данных, переданных СУБД: MySQL передает значения в текстовом протоколе,
+    поэтому считаем длину строкового представления каждого значения.
+    """
+
+    total = 0
+    for row in rows:
+        for value in row._mapping.values():
+            if value is None:
+                continue
+            total += len(value) if isinstance(value, bytes) else len(str(value).encode())
+
+    return total
+
+
+def per_scale(value: float, rows_count: int) -> float:
+    return value * ROWS_SCALE / max(rows_count, 1)
+
+
+def get_projection_columns(model: type[ormar.Model], fields: list[str]) -> list[sqlalchemy.Column]:
+    """
+    Переводит поля проекции ormar (`field`, `relation__field`) в столбцы таблиц SQLAlchemy.
+    """
+
+    columns = []
+    for field in fields:
+        current_model = model
+        *relations, name = field.split('__')
+        for relation in relations:
+            current_model = current_model.ormar_config.model_fields[relation].to
+
+        column_name = current_model.get_column_alias(name)
+        columns.append(current_model.ormar_config.table.c[column_name].label(field))
+
+    return columns
+
+
+async def seed_patients(count: int) -> list[int]:
+    """
+    Заполняет БД синтетическими пациентами со всеми документами.
+    :param count: Количество пациентов
+    :return: ID созданных пациентов
+    """
+
+    offset = await models.database.fetch_val(
+        sqlalchemy.select(sqlalchemy.func.count()).select_from(models.Patient.ormar_config.table)
+    )
+
+    passports, insurances, med_cards, patients = [], [], [], []
+    for index in range(offset, offset + count):
+        passports.append({
+            'serial': 1000 + index % 9000,
+            'number': 100000 + index % 900000,
+            'issued_by': 'ГУ МВД России по г. Москве',
+            'issued_date': date(2015, 1, 1) + timedelta(days=index % 3000),
+            'date_of_birth': date(1950, 1, 1) + timedelta(days=index % 20000),
+            'gender': random.choice(list(models.Gender)).name,
+            'address': 'г. Москва, ул. Тверская, д. 1, кв. ' + str(index),
+        })
+        insurances.append({
+            'number': 10_000_000 + index,
+            'date_of_issue': date(2020, 1, 1),
+            'date_expires': date(2030, 1, 1) + timedelta(days=index % 365),
+        })
+        med_cards.append({
+            'date_of_issue': date.today(),
+        })
+
+    await _insert_many(models.Passport, passports)
+    await _insert_many(models.Insurance, insurances)
+    await _insert_many(models.MedCard, med_cards)
+
+    passport_ids = await _last_ids(models.Passport, count)
+    insurance_ids = await _last_ids(models.Insurance, count)
+    med_card_ids = await _last_ids(models.MedCard, count)
+
+    for index in range(count):
+        patients.append({
+            'first_name': random.choice(FIRST_NAMES),
+            'last_name': random.choice(LAST_NAMES),
+            'surname': random.choice(SURNAMES),
+            'photo_url': 'https://example.com/photos/' + 'x' * 100,
+            'phone_number': f'7916{random.randint(0, 9_999_999):07d}',
+            'email': f'patient{offset + index}@example.com',
+            'passport': passport_ids[index],
+            'insurance': insurance_ids[index],
+            'med_card': med_card_ids[index],
+        })
+
+    await _insert_many(models.Patient, patients)
+    return await _last_ids(models.Patient, count)
+
+
+async def seed_appointments(count: int, patient_ids: list[int]) -> None:
+    """
+    Заполняет БД синтетическими приемами для указанных пациентов.
+    """
+
+    diagnosis, _ = await models.Diagnosis.objects.get_or_create(name='ОРВИ')
+    now = datetime.now(tz=settings.TIMEZONE)
+
+    await _insert_many(models.Appointment, [
+        {
+            'diagnosis': diagnosis.id,
+            'patient': patient_ids[index % len(patient_ids)],
+            'date_created': now,
+            'date_to_come': now + timedelta(minutes=15 * (index - count // 2)),
+            'status': random.choice(list(models.AppointmentStatuses)).name,
+        } for index in range(count)
+    ])
+
+
+async def _insert_many(model: type[ormar.Model], rows: list[dict], batch_size: int = 5000) -> None:
+    table = model.ormar_config.table
+    for start in range(0, len(rows), batch_size):
+        await models.database.execute_many(table.insert(), rows[start:start + batch_size])
+
+
+async def _last_ids(model: type[ormar.Model], count: int) -> list[int]:
+    table = model.ormar_config.table
+    rows = await models.database.fetch_all(
+        sqlalchemy.select(table.c.id).order_by(table.c.id.desc()).limit(count)
+    )
+    return [row.id for row in reversed(rows)]
@@ -0,0 +1,29 @@
+"""
+Поиск вероятных дублей по всему реестру.
+
+Запуск: python -m benchmarks.duplicates [--seed 100000]
+"""
+import argparse
+import time
+
+from benchmarks.common import run, seed_patients
+from modules.duplicates import find_duplicate_patients
+
+
+async def main(seed: int) -> None:
+    if seed:
+        await seed_patients(seed)
+
+    started_at = time.perf_counter()
+    pairs = await find_duplicate_patients()
+    elapsed = time.perf_counter() - started_at
+
+    print(f'Найдено пар вероятных дублей: {len(pairs)} за {elapsed:.2f} с')
+    for pair in pairs[:20]:
+        print(f'  {pair.first_id} ~ {pair.second_id} (расстояние {pair.distance})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0, help='Сколько синтетических пациентов добавить перед поиском')
+    run(main(parser.parse_args().seed))
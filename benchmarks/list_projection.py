@@ -0,0 +1,95 @@
+"""
+Замер проекционных запросов списков против полной выборки.
+
+Запуск: python -m benchmarks.list_projection [--seed 10000]
+"""
+import argparse
+
+import ormar
+import sqlalchemy
+
+import models
+from benchmarks.common import (
+    run,
+    measure,
+    estimate_rows_bytes,
+    per_scale,
+    get_projection_columns,
+    seed_patients,
+    seed_appointments,
+)
+from modules.appointments import get_all_appointments, get_appointments_list, APPOINTMENT_LIST_FIELDS
+from modules.patient import get_patients, get_patients_list, PATIENT_LIST_FIELDS
+
+
+def full_patients_query() -> sqlalchemy.sql.Select:
+    patients = models.Patient.ormar_config.table
+    passports = models.Passport.ormar_config.table
+    insurances = models.Insurance.ormar_config.table
+    med_cards = models.MedCard.ormar_config.table
+
+    return sqlalchemy.select(patients, passports, insurances, med_cards).select_from(
+        patients
+        .join(passports, patients.c.passport == passports.c.id)
+        .join(insurances, patients.c.insurance == insurances.c.id)
+        .join(med_cards, patients.c.med_card == med_cards.c.id)
+    )
+
+
+def full_appointments_query() -> sqlalchemy.sql.Select:
+    appointments = models.Appointment.ormar_config.table
+    patients = models.Patient.ormar_config.table
+    diagnoses = models.Diagnosis.ormar_config.table
+
+    return sqlalchemy.select(appointments, patients, diagnoses).select_from(
+        appointments
+        .join(patients, appointments.c.patient == patients.c.id)
+        .outerjoin(diagnoses, appointments.c.diagnosis == diagnoses.c.id)
+    )
+
+
+def projected_query(query: sqlalchemy.sql.Select, model: type[ormar.Model], fields: list[str]) -> sqlalchemy.sql.Select:
+    return query.with_only_columns(*get_projection_columns(model, fields))
+
+
+async def compare(title: str, full_query, projected, load_full, load_projected) -> None:
+    full_rows = await models.database.fetch_all(full_query)
+    projected_rows = await models.database.fetch_all(projected)
+    rows_count = len(full_rows)
+
+    full_time, _ = await measure(load_full)
+    projected_time, _ = await measure(load_projected)
+
+    full_bytes = per_scale(estimate_rows_bytes(full_rows), rows_count)
+    projected_bytes = per_scale(estimate_rows_bytes(projected_rows), rows_count)
+
+    print(f'{title} ({rows_count} строк, значения приведены к 10 000 строк)')
+    print(f'  передано байт:  {full_bytes:>14,.0f} -> {projected_bytes:>14,.0f} ({projected_bytes / max(full_bytes, 1):.0%})')
+    print(f'  загрузка, мс:   {per_scale(full_time, rows_count) * 1000:>14,.1f} -> {per_scale(projected_time, rows_count) * 1000:>14,.1f}')
+
+
+async def main(seed: int) -> None:
+    if seed:
+        patient_ids = await seed_patients(seed)
+        await seed_appointments(seed, patient_ids)
+
+    await compare(
+        'Пациенты',
+        full_patients_query(),
+        projected_query(full_patients_query(), models.Patient, PATIENT_LIST_FIELDS),
+        get_patients,
+        get_patients_list,
+    )
+    await compare(
+        'Приемы',
+        full_appointments_query(),
+        projected_query(full_appointments_query(), models.Appointment, APPOINTMENT_LIST_FIELDS),
+        get_all_appointments,
+        get_appointments_list,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0, help='Сколько синтетических пациентов и приемов добавить перед замером')
+    run(main(parser.parse_args().seed))
@@ -0,0 +1,44 @@
+"""
+Замер облегченных моделей чтения (SQLAlchemy Core + именованные кортежи) против ormar.
+
+Запуск: python -m benchmarks.read_models [--seed 100000]
+"""
+import argparse
+
+from benchmarks.common import run, measure, seed_patients, seed_appointments
+from modules.appointments import get_all_appointments, get_appointments_list
+from modules.patient import get_patients, get_patients_list
+from modules.read_models import get_appointment_records, get_patient_records
+
+
+async def compare(title: str, loaders: dict) -> None:
+    print(title)
+    baseline = None
+
+    for name, loader in loaders.items():
+        elapsed, rows = await measure(loader, repeat=2)
+        baseline = baseline or elapsed
+        print(f'  {name:<28} {len(rows):>8} строк  {elapsed * 1000:>10,.1f} мс  x{baseline / elapsed:.1f}')
+
+
+async def main(seed: int) -> None:
+    if seed:
+        patient_ids = await seed_patients(seed)
+        await seed_appointments(seed, patient_ids)
+
+    await compare('Приемы', {
+        'ormar (все поля)': get_all_appointments,
+        'ormar (проекция)': get_appointments_list,
+        'Core (записи)': get_appointment_records,
+    })
+    await compare('Пациенты', {
+        'ormar (все поля)': get_patients,
+        'ormar (проекция)': get_patients_list,
+        'Core (записи)': get_patient_records,
+    })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0, help='Сколько синтетических пациентов и приемов добавить перед замером')
+    run(main(parser.parse_args().seed))
@@ -0,0 +1,51 @@
+"""
+Замер пропускной способности отправки напоминаний через SMTP.
+Сообщения синтетические и БД не используется; нужен локальный SMTP-сервер:
+python -m aiosmtpd -n -l localhost:1025
+
+Запуск: python -m benchmarks.reminders [--messages 2000] [--concurrency 20]
+"""
+import argparse
+import asyncio
+import time
+
+import settings
+from modules.reminders import ReminderDispatcher, ReminderMessage, SmtpTransport
+
+
+async def send_messages(messages_count: int, concurrency: int) -> tuple[float, int]:
+    transport = SmtpTransport()
+    dispatcher = ReminderDispatcher([transport], concurrency=concurrency, retry_backoff=0.1)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    messages = [
+        ReminderMessage(index, f'patient{index}@example.com', 'Напоминание о приеме', 'Текст напоминания')
+        for index in range(messages_count)
+    ]
+
+    started_at = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(
+            dispatcher.send_with_retry(transport, message, semaphore) for message in messages
+        ))
+    finally:
+        transport.close()
+
+    failed = sum(result.error is not None for result in results)
+    return time.perf_counter() - started_at, failed
+
+
+def main(messages_count: int, concurrency: int) -> None:
+    duration, failed = settings.LOOP.run_until_complete(send_messages(messages_count, concurrency))
+    print(
+        f'Отправлено {messages_count - failed} из {messages_count} за {duration:.2f} с '
+        f'({(messages_count - failed) / duration * 60:,.0f} в минуту), ошибок: {failed}'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000, help='Количество сообщений')
+    parser.add_argument('--concurrency', type=int, default=settings.REMINDER_CONCURRENCY, help='Одновременных отправок')
+    arguments = parser.parse_args()
+    main(arguments.messages, arguments.concurrency)
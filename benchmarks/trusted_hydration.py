@@ -0,0 +1,104 @@
+"""
+Замер стоимости сборки сущностей из строк БД: с валидацией ormar/pydantic и в доверенном режиме.
+Строки синтетические, поэтому замер отражает только гидратацию, без обращения к СУБД.
+
+Запуск: python -m benchmarks.trusted_hydration [--rows 10000]
+"""
+import argparse
+import time
+from datetime import date
+
+import ormar
+
+import models
+from benchmarks.common import ROWS_SCALE, FIRST_NAMES, LAST_NAMES, SURNAMES, per_scale
+from modules.projection import hydrate_projection
+
+
+def passport_row(index: int) -> dict:
+    return {
+        'id': index + 1,
+        'serial': 1000 + index % 9000,
+        'number': 100000 + index % 900000,
+        'issued_by': 'ГУ МВД России по г. Москве',
+        'issued_date': date(2015, 1, 1),
+        'date_of_birth': date(1980, 1, 1),
+        'gender': models.Gender.MALE,
+        'address': 'г. Москва, ул. Тверская, д. 1',
+    }
+
+
+def patient_row(index: int) -> dict:
+    row = {
+        'id': index + 1,
+        'first_name': FIRST_NAMES[index % len(FIRST_NAMES)],
+        'last_name': LAST_NAMES[index % len(LAST_NAMES)],
+        'surname': SURNAMES[index % len(SURNAMES)],
+        'photo_url': '',
+        'phone_number': '79161234567',
+        'email': f'patient{index}@example.com',
+    }
+    row.update({f'passport__{key}': value for key, value in passport_row(index).items()})
+    row.update({
+        'insurance__id': index + 1,
+        'insurance__number': 10_000_000 + index,
+        'insurance__date_of_issue': date(2020, 1, 1),
+        'insurance__date_expires': date(2030, 1, 1),
+        'med_card__id': index + 1,
+        'med_card__date_of_issue': date(2024, 1, 1),
+    })
+    return row
+
+
+def user_row(index: int) -> dict:
+    return {
+        'id': index + 1,
+        'username': f'user{index}',
+        'first_name': FIRST_NAMES[index % len(FIRST_NAMES)],
+        'last_name': LAST_NAMES[index % len(LAST_NAMES)],
+        'password': 'x' * 64,
+    }
+
+
+def nest(row: dict) -> dict:
+    nested = {}
+    for key, value in row.items():
+        name, _, related_key = key.partition('__')
+        if related_key:
+            nested.setdefault(name, {})[related_key] = value
+        else:
+            nested[name] = value
+    return nested
+
+
+def compare(title: str, model: type[ormar.Model], rows: list[dict]) -> None:
+    nested_rows = [nest(row) for row in rows]
+
+    started_at = time.perf_counter()
+    for row in nested_rows:
+        model(**row)
+    validated = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for row in rows:
+        hydrate_projection(model, row)
+    trusted = time.perf_counter() - started_at
+
+    validated_ms = per_scale(validated, len(rows)) * 1000
+    trusted_ms = per_scale(trusted, len(rows)) * 1000
+    print(
+        f'{title:<30} с валидацией {validated_ms:>9,.1f} мс  доверенно {trusted_ms:>9,.1f} мс  '
+        f'экономия {validated_ms - trusted_ms:>9,.1f} мс на {ROWS_SCALE} строк'
+    )
+
+
+def main(rows_count: int) -> None:
+    compare('Пациент + документы', models.Patient, [patient_row(index) for index in range(rows_count)])
+    compare('Паспорт', models.Passport, [passport_row(index) for index in range(rows_count)])
+    compare('Пользователь', models.User, [user_row(index) for index in range(rows_count)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=ROWS_SCALE, help='Количество синтетических строк')
+    main(parser.parse_args().rows)
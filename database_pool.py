@@ -0,0 +1,153 @@
+"""
+Пул подключений к БД с настраиваемыми размерами и показателями работы.
+
+Размеры пула, время ожидания свободного подключения и пересоздание старых
+подключений задаются в settings. Ожидание подключения измеряется и попадает
+в гистограмму, показатели периодически пишутся в лог одной строкой.
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+
+import databases
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+# Границы интервалов гистограммы ожидания подключения (в миллисекундах)
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolMetrics:
+    """
+    Показатели пула подключений.
+    """
+
+    def __init__(self):
+        self.acquired = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        # Последний интервал - ожидание дольше самой большой границы
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def observe_wait(self, seconds: float) -> None:
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        self.wait_histogram[bisect_left(WAIT_BUCKETS_MS, seconds * 1000)] += 1
+
+    def as_dict(self) -> dict:
+        labels = [f'<={bucket}ms' for bucket in WAIT_BUCKETS_MS] + [f'>{WAIT_BUCKETS_MS[-1]}ms']
+
+        return {
+            'acquired': self.acquired,
+            'timeouts': self.timeouts,
+            'in_use': self.in_use,
+            'waiting': self.waiting,
+            'average_wait': self.total_wait / self.acquired if self.acquired else 0.0,
+            'max_wait': self.max_wait,
+            'wait_histogram': dict(zip(labels, self.wait_histogram)),
+        }
+
+
+class InstrumentedDatabase(databases.Database):
+    """
+    Database, ограничивающий ожидание подключения из пула и собирающий показатели пула.
+    """
+
+    def __init__(self, url: str, acquire_timeout: float | None = None, **options):
+        super().__init__(url, **options)
+        self.acquire_timeout = acquire_timeout
+        self.pool_metrics = PoolMetrics()
+
+        create_connection = self._backend.connection
+        self._backend.connection = lambda: self._instrument_connection(create_connection())
+
+    def _instrument_connection(self, connection):
+        acquire = connection.acquire
+        release = connection.release
+        metrics = self.pool_metrics
+
+        async def instrumented_acquire() -> None:
+            started_at = time.perf_counter()
+            metrics.waiting += 1
+            try:
+                await asyncio.wait_for(acquire(), self.acquire_timeout)
+            except asyncio.TimeoutError:
+                metrics.timeouts += 1
+                raise Exception(
+                    'Нет свободного подключения к БД, повторите попытку позже.'
+                ) from None
+            finally:
+                metrics.waiting -= 1
+
+            metrics.observe_wait(time.perf_counter() - started_at)
+            metrics.acquired += 1
+            metrics.in_use += 1
+
+        async def instrumented_release() -> None:
+            try:
+                await release()
+            finally:
+                metrics.in_use -= 1
+
+        connection.acquire = instrumented_acquire
+        connection.release = instrumented_release
+        return connection
+
+    def get_pool_size(self) -> tuple[int, int]:
+        """
+        Размер пула по данным драйвера.
+        :return: (всего подключений, свободных подключений)
+        """
+
+        pool = getattr(self._backend, '_pool', None)
+        if pool is None:
+            return 0, 0
+
+        return pool.size, pool.freesize
+
+
+def get_pool_options() -> dict:
+    """
+    Параметры пула подключений из settings.
+    """
+
+    return {
+        'acquire_timeout': settings.DATABASE_POOL_ACQUIRE_TIMEOUT,
+        'min_size': settings.DATABASE_POOL_MIN_SIZE,
+        'max_size': settings.DATABASE_POOL_MAX_SIZE,
+        'pool_recycle': settings.DATABASE_POOL_RECYCLE,
+    }
+
+
+def create_database(url: str = settings.DATABASE_URL) -> InstrumentedDatabase:
+    """
+    Подключение к БД с параметрами пула из settings.
+    """
+
+    return InstrumentedDatabase(url, **get_pool_options())
+
+
+def log_pool_metrics(database: InstrumentedDatabase, name: str = 'main') -> None:
+    size, free = database.get_pool_size()
+    metrics = database.pool_metrics.as_dict()
+
+    logger.info(
+        'Пул БД %s: подключений %d (свободно %d, занято %d, ожидают %d), выдано %d, таймаутов %d, '
+        'ожидание среднее %.1f мс, макс. %.1f мс, гистограмма %s',
+        name,
+        size,
+        free,
+        metrics['in_use'],
+        metrics['waiting'],
+        metrics['acquired'],
+        metrics['timeouts'],
+        metrics['average_wait'] * 1000,
+        metrics['max_wait'] * 1000,
+        ' '.join(f'{label}:{count}' for label, count in metrics['wait_histogram'].items() if count),
+    )
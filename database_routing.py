@@ -0,0 +1,190 @@
+"""
+Разделение чтения и записи между основной БД и репликой.
+
+Функции модулей, которые только читают данные для списков, помечаются
+декоратором replica_reads, и их запросы уходят на реплику. Запись, транзакции
+и все остальные чтения выполняются на основной БД.
+
+Реплика отстает от основной БД, поэтому после записи сессия какое-то время
+(REPLICA_STALENESS_WINDOW) читает только с основной БД и видит свои изменения.
+Сессия хранится в contextvar; обработчики событий об изменениях всегда читают
+с основной БД (primary_reads), так как событие приходит сразу после записи.
+"""
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+import settings
+from database_pool import InstrumentedDatabase, create_database, get_pool_options
+
+
+class ReadSession:
+    """
+    Состояние чтения сессии пользователя: время последней записи.
+    """
+
+    __slots__ = ('last_write_at',)
+
+    def __init__(self):
+        self.last_write_at: float | None = None
+
+    def note_write(self) -> None:
+        self.last_write_at = time.monotonic()
+
+    def has_recent_writes(self, window: float) -> bool:
+        return self.last_write_at is not None and time.monotonic() - self.last_write_at < window
+
+
+# Сессия, выполняющая запросы
+_read_session: ContextVar[ReadSession | None] = ContextVar('read_session', default=None)
+
+# Запросы текущей функции можно отправлять на реплику
+_prefer_replica: ContextVar[bool] = ContextVar('prefer_replica', default=False)
+
+# Все запросы читаются с основной БД
+_force_primary: ContextVar[bool] = ContextVar('force_primary', default=False)
+
+# Получение сессии, если она не задана через contextvar (например, сессия интерфейса)
+session_resolver: Callable[[], ReadSession | None] | None = None
+
+
+def get_read_session() -> ReadSession | None:
+    session = _read_session.get()
+    if session is None and session_resolver is not None:
+        session = session_resolver()
+
+    return session
+
+
+@contextmanager
+def read_session_scope(session: ReadSession) -> Iterator[ReadSession]:
+    token = _read_session.set(session)
+    try:
+        yield session
+    finally:
+        _read_session.reset(token)
+
+
+@contextmanager
+def primary_reads() -> Iterator[None]:
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def replica_reads(function):
+    """
+    Декоратор функций модулей, которые только читают данные и допускают небольшое отставание реплики.
+    """
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        token = _prefer_replica.set(True)
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            _prefer_replica.reset(token)
+
+    return wrapper
+
+
+class RoutingDatabase(InstrumentedDatabase):
+    """
+    Основная БД, отправляющая чтения функций replica_reads на реплику.
+    """
+
+    def __init__(
+            self,
+            url: str,
+            replica: InstrumentedDatabase,
+            staleness_window: float = settings.REPLICA_STALENESS_WINDOW,
+            **options,
+    ):
+        super().__init__(url, **options)
+        self.replica = replica
+        self.staleness_window = staleness_window
+
+    async def connect(self) -> None:
+        await super().connect()
+        await self.replica.connect()
+
+    async def disconnect(self) -> None:
+        await self.replica.disconnect()
+        await super().disconnect()
+
+    def is_in_transaction(self) -> bool:
+        connection = self._connection
+        return connection is not None and bool(connection._transaction_stack)
+
+    def should_use_replica(self) -> bool:
+        if _force_primary.get() or not _prefer_replica.get() or not self.replica.is_connected:
+            return False
+
+        if self.is_in_transaction():
+            return False
+
+        session = get_read_session()
+        return session is None or not session.has_recent_writes(self.staleness_window)
+
+    def note_write(self) -> None:
+        session = get_read_session()
+        if session is not None:
+            session.note_write()
+
+    async def fetch_all(self, query, values: dict = None):
+        if self.should_use_replica():
+            return await self.replica.fetch_all(query, values)
+
+        return await super().fetch_all(query, values)
+
+    async def fetch_one(self, query, values: dict = None):
+        if self.should_use_replica():
+            return await self.replica.fetch_one(query, values)
+
+        return await super().fetch_one(query, values)
+
+    async def fetch_val(self, query, values: dict = None, column=0):
+        if self.should_use_replica():
+            return await self.replica.fetch_val(query, values, column=column)
+
+        return await super().fetch_val(query, values, column=column)
+
+    async def iterate(self, query, values: dict = None):
+        rows = self.replica.iterate(query, values) if self.should_use_replica() else super().iterate(query, values)
+        async for row in rows:
+            yield row
+
+    async def execute(self, query, values: dict = None):
+        try:
+            return await super().execute(query, values)
+        finally:
+            self.note_write()
+
+    async def execute_many(self, query, values: list):
+        try:
+            return await super().execute_many(query, values)
+        finally:
+            self.note_write()
+
+    def transaction(self, **kwargs):
+        # Транзакции (в том числе с SELECT ... FOR UPDATE) считаются записью
+        self.note_write()
+        return super().transaction(**kwargs)
+
+
+def create_routing_database(
+        url: str = settings.DATABASE_URL,
+        replica_url: str | None = settings.DATABASE_REPLICA_URL,
+) -> InstrumentedDatabase:
+    """
+    Подключение к основной БД; если задана реплика - с отправкой чтений на нее.
+    """
+
+    if not replica_url:
+        return create_database(url)
+
+    return RoutingDatabase(url, replica=create_database(replica_url), **get_pool_options())
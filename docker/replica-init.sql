@@ -0,0 +1,9 @@
+-- Подключение реплики к основной БД (сервис mysql) с автоматическим позиционированием по GTID
+CHANGE REPLICATION SOURCE TO
+    SOURCE_HOST = 'mysql',
+    SOURCE_USER = 'root',
+    SOURCE_PASSWORD = '1234',
+    SOURCE_AUTO_POSITION = 1,
+    GET_SOURCE_PUBLIC_KEY = 1;
+
+START REPLICA;
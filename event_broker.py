@@ -0,0 +1,45 @@
+"""
+Простой брокер событий для запуска приложения в нескольких процессах
+(и локальная замена настоящего брокера при проверке).
+Каждая строка, полученная от клиента, рассылается всем остальным клиентам.
+
+Запуск: python event_broker.py [--host 127.0.0.1] [--port 8765]
+"""
+import argparse
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def run_broker(host: str, port: int) -> None:
+    clients: set[asyncio.StreamWriter] = set()
+
+    async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        clients.add(writer)
+        try:
+            while line := await reader.readline():
+                for client in list(clients):
+                    if client is not writer:
+                        client.write(line)
+        except ConnectionError:
+            pass
+        finally:
+            clients.discard(writer)
+            writer.close()
+
+    server = await asyncio.start_server(handle_client, host, port)
+    logger.info('Брокер событий слушает %s:%d', host, port)
+
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_broker(arguments.host, arguments.port))
@@ -0,0 +1,74 @@
+"""
+Цикл событий приложения (settings.LOOP) и его единственный владелец - отдельный поток.
+
+До запуска потока (подготовка приложения) корутины выполняются в главном потоке.
+После запуска обработчики интерфейса (потоки Flet), брокер событий и фоновые задачи
+только отправляют корутины в цикл, поэтому цикл никогда не запускается из двух потоков сразу.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Coroutine
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+_thread: threading.Thread | None = None
+
+
+def is_started() -> bool:
+    return _thread is not None and _thread.is_alive()
+
+
+def start_event_loop() -> None:
+    global _thread
+
+    if is_started():
+        return
+
+    _thread = threading.Thread(target=settings.LOOP.run_forever, name='app-loop', daemon=True)
+    _thread.start()
+
+
+def stop_event_loop(timeout: float = 10) -> None:
+    if not is_started():
+        return
+
+    settings.LOOP.call_soon_threadsafe(settings.LOOP.stop)
+    _thread.join(timeout)
+
+
+def run_sync[T](coroutine: Coroutine[Any, Any, T]) -> T:
+    """
+    Выполняет корутину в цикле приложения и ждет результат.
+    :param coroutine: Корутина
+    :return: результат корутины
+    """
+
+    if not is_started():
+        return settings.LOOP.run_until_complete(coroutine)
+
+    if threading.current_thread() is _thread:
+        coroutine.close()
+        raise RuntimeError('run_sync нельзя вызывать из цикла приложения, используйте await.')
+
+    return asyncio.run_coroutine_threadsafe(coroutine, settings.LOOP).result()
+
+
+def run_background(coroutine: Coroutine) -> concurrent.futures.Future:
+    """
+    Отправляет корутину в цикл приложения, не дожидаясь результата. Ошибки пишутся в лог.
+    :param coroutine: Корутина
+    :return: future результата
+    """
+
+    future = asyncio.run_coroutine_threadsafe(coroutine, settings.LOOP)
+
+    def log_exception(done: concurrent.futures.Future) -> None:
+        if not done.cancelled() and done.exception() is not None:
+            logger.error('Ошибка фоновой операции', exc_info=done.exception())
+
+    future.add_done_callback(log_exception)
+    return future
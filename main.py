@@ -1,9 +1,82 @@
 import asyncio
+import logging
+import time
+import weakref
+
+import databases
 import flet as ft
 
+import database_routing
 import models
+import settings
+from database_pool import log_pool_metrics
+from database_routing import ReadSession, RoutingDatabase
+from event_loop import run_background, start_event_loop, stop_event_loop
+from modules.background import scheduler
+from modules.events import event_bus, TcpBrokerBackend, get_broker_address
 from router import Router
 
+logger = logging.getLogger(__name__)
+
+# Состояние чтения (время последней записи) каждой сессии интерфейса
+read_sessions: weakref.WeakKeyDictionary[ft.Page, ReadSession] = weakref.WeakKeyDictionary()
+
+
+async def build_caches():
+    """
+    Строит фильтр уникальных ключей и индекс поиска. Выполняется в фоне, приложение уже принимает подключения:
+    пока фильтр не построен, любой ключ считается возможно существующим, а пока нет индекса - поиск идет по БД.
+    """
+
+    from modules.search import build_search_index
+    from modules.unique_keys import build_unique_keys_filter
+
+    started_at = time.perf_counter()
+    await build_unique_keys_filter()
+    await build_search_index()
+    logger.info('Фильтр уникальных ключей и индекс поиска построены за %.1f с', time.perf_counter() - started_at)
+
+
+async def log_database_pools(background_database: databases.Database):
+    log_pool_metrics(models.database)
+    if isinstance(models.database, RoutingDatabase):
+        log_pool_metrics(models.database.replica, name='replica')
+    log_pool_metrics(background_database, name='background')
+
+
+def start_background_tasks(periodic_jobs: bool = True):
+    """
+    Регистрирует и запускает периодические фоновые задачи.
+    :param periodic_jobs: Запускать ли задачи обработки данных (в веб-режиме - только в одном процессе)
+    """
+
+    scheduler.add_task('pool_metrics', settings.DATABASE_POOL_METRICS_INTERVAL, log_database_pools)
+    if periodic_jobs:
+        # Модули задач нужны только процессу, который их выполняет
+        from modules.archive import archive_closed_appointments
+        from modules.insurance import flag_expiring_appointments
+        from modules.no_shows import sweep_no_shows
+        from modules.reminders import send_appointment_reminders
+
+        scheduler.add_task('no_shows', settings.NO_SHOW_SWEEP_INTERVAL, sweep_no_shows)
+        scheduler.add_task('archive', settings.ARCHIVE_INTERVAL, archive_closed_appointments)
+        scheduler.add_task('insurance_expiry', settings.INSURANCE_EXPIRY_SWEEP_INTERVAL, flag_expiring_appointments)
+        scheduler.add_task('reminders', settings.REMINDER_INTERVAL, send_appointment_reminders)
+    scheduler.start()
+
+
+def get_page_read_session() -> ReadSession | None:
+    """
+    Сессия чтения текущей сессии интерфейса. Flet хранит страницу сессии в contextvar
+    потока обработчика, поэтому сессия определяется без передачи страницы в модули.
+    """
+
+    page = ft.context.page
+    if page is None:
+        return None
+
+    return read_sessions.setdefault(page, ReadSession())
+
 
 def main(page: ft.Page):
     page.title = 'Клиника от Саныча'
@@ -16,7 +89,12 @@ def main(page: ft.Page):
         right=10
     )
 
+    started_at = time.perf_counter()
     router = Router(page, initial_route='/login')
+    logger.info(
+        'Начальная страница отрисована за %.1f мс',
+        (time.perf_counter() - started_at) * 1000,
+    )
 
     page.add(
         router.body
@@ -26,5 +104,34 @@ def main(page: ft.Page):
     page.update()
 
 
+def run_app(view: ft.AppView | None = ft.AppView.FLET_APP, host: str = None, port: int = 0, background_tasks: bool = True):
+    """
+    Запускает приложение в текущем процессе.
+    :param view: Вид приложения (None - только веб-сервер, без окна и браузера)
+    :param host: Адрес веб-сервера
+    :param port: Порт веб-сервера
+    :param background_tasks: Запускать ли периодические задачи обработки данных
+    """
+
+    logging.basicConfig(level=settings.LOG_LEVEL)
+    database_routing.session_resolver = get_page_read_session
+    if settings.DEBUG:
+        from modules.loaders import install_n_plus_one_detector
+
+        install_n_plus_one_detector(models.database)
+    if settings.EVENT_BROKER_URL:
+        event_bus.set_backend(TcpBrokerBackend(*get_broker_address(settings.EVENT_BROKER_URL)))
+    start_background_tasks(periodic_jobs=background_tasks)
+    # Дальше цикл приложения работает только в своем потоке, обработчики отправляют в него корутины
+    start_event_loop()
+    run_background(build_caches())
+
+    try:
+        ft.app(target=main, view=view, host=host, port=port)
+    finally:
+        scheduler.stop()
+        stop_event_loop()
+
+
 if __name__ == '__main__':
-    ft.app(target=main)
+    run_app()
@@ -1,13 +1,17 @@
 import enum
+import logging
+import re
 from datetime import datetime, date
 import ormar
 import sqlalchemy
-import databases
-
 import settings
+from event_loop import run_sync
+from database_routing import create_routing_database
+
+logger = logging.getLogger(__name__)
 
 engine = sqlalchemy.create_engine(settings.DATABASE_URL)
-database = databases.Database(settings.DATABASE_URL)
+database = create_routing_database(settings.DATABASE_URL, settings.DATABASE_REPLICA_URL)
 metadata = sqlalchemy.MetaData(bind=engine)
 
 ormar_config = ormar.OrmarConfig(
@@ -22,6 +26,27 @@ def get_current_date() -> datetime:
     return datetime.now(tz=settings.TIMEZONE).now()
 
 
+def normalize_phone(phone_number: str | None) -> str | None:
+    """
+    Канонический ключ номера телефона: только цифры, российские номера - с кодом 7.
+    "+7 (916) 123-45-67", "8 916 123 45 67" и "9161234567" дают "79161234567".
+    :param phone_number: Номер телефона в любом формате
+    :return: ключ номера или None, если в номере нет цифр
+    """
+
+    digits = re.sub(r'\D+', '', phone_number or '')
+    if not digits:
+        return None
+
+    if len(digits) == 11 and digits[0] == '8':
+        return '7' + digits[1:]
+
+    if len(digits) == 10:
+        return '7' + digits
+
+    return digits
+
+
 class Gender(enum.Enum):
     """
     Enum для перечисления и валидации пола.
@@ -43,6 +68,15 @@ class AppointmentStatuses(enum.Enum):
     RECREATED = 5
 
 
+class ReminderStatuses(enum.Enum):
+    """
+    Enum для перечисления и валидации статуса отправки напоминания
+    """
+
+    SENT = 1
+    FAILED = 2
+
+
 class User(ormar.Model):
     """
     Сущность пользователя в БД
@@ -94,6 +128,10 @@ class Passport(ormar.Model):
 
     ormar_config = ormar_config.copy(
         tablename='passports',
+        constraints=[
+            # Уникальный индекс, а не ограничение: migrate_schema добавляет его и в уже существующую таблицу
+            ormar.IndexColumns('serial', 'number', name='ux_passports_serial_number', unique=True),
+        ],
     )
 
     id = ormar.Integer(
@@ -125,6 +163,7 @@ class Passport(ormar.Model):
 
     date_of_birth = ormar.Date(
         nullable=False,
+        index=True,
     )
 
     gender = ormar.Enum(
@@ -187,6 +226,7 @@ class Insurance(ormar.Model):
 
     date_expires = ormar.Date(
         nullable=False,
+        index=True,
     )
 
 
@@ -255,6 +295,12 @@ class Patient(ormar.Model):
         nullable=False,
     )
 
+    phone_key = ormar.String(
+        max_length=20,
+        nullable=True,
+        index=True,
+    )
+
     email = ormar.String(
         nullable=False,
         regex=r"^\S+@\S+\.\S+$",
@@ -293,6 +339,10 @@ class Appointment(ormar.Model):
 
     ormar_config = ormar_config.copy(
         tablename='appointments',
+        constraints=[
+            ormar.IndexColumns('date_to_come', 'status', name='ix_appointments_date_to_come_status'),
+            ormar.IndexColumns('patient', 'date_to_come', name='ix_appointments_patient_date_to_come'),
+        ],
     )
 
     id = ormar.Integer(
@@ -331,9 +381,286 @@ class Appointment(ormar.Model):
         default=AppointmentStatuses.IN_QUEUE,
     )
 
+    # Полис пациента истекает до даты приема
+    insurance_expired = ormar.Boolean(
+        default=False,
+        server_default='0',
+        nullable=False,
+    )
+
+
+class AppointmentReminder(ormar.Model):
+    """
+    Сущность напоминания о приеме, отправленного по одному каналу (email, sms)
+    """
+
+    ormar_config = ormar_config.copy(
+        tablename='appointment_reminders',
+        constraints=[
+            ormar.UniqueColumns('appointment', 'channel'),
+        ],
+    )
+
+    id = ormar.Integer(
+        primary_key=True,
+        autoincrement=True,
+        nullable=False,
+        minimum=1,
+    )
+
+    appointment = ormar.ForeignKey(
+        to=Appointment,
+        related_name='reminders',
+        on_delete=ormar.ReferentialAction.CASCADE,
+        on_update=ormar.ReferentialAction.CASCADE,
+        nullable=False,
+    )
+
+    channel = ormar.String(
+        max_length=20,
+        nullable=False,
+    )
+
+    status = ormar.Enum(
+        enum_class=ReminderStatuses,
+    )
+
+    attempts = ormar.Integer(
+        default=0,
+        nullable=False,
+    )
+
+    date_updated = ormar.DateTime(
+        default=get_current_date,
+        nullable=False,
+        timezone=True,
+    )
+
+    error = ormar.String(
+        max_length=255,
+        nullable=True,
+    )
+
+
+class ArchivedAppointment(ormar.Model):
+    """
+    Сущность закрытого приема, перенесенного в архив.
+    Таблица логически разбита по месяцам приема (archive_month = ГГГГММ).
+    """
+
+    ormar_config = ormar_config.copy(
+        tablename='appointments_archive',
+        constraints=[
+            ormar.IndexColumns('archive_month', 'status', name='ix_appointments_archive_month_status'),
+            ormar.IndexColumns('patient', 'date_to_come', name='ix_appointments_archive_patient_date_to_come'),
+        ],
+    )
+
+    # ID совпадает с ID приема в основной таблице
+    id = ormar.Integer(
+        primary_key=True,
+        autoincrement=False,
+        nullable=False,
+        minimum=1,
+    )
+
+    diagnosis = ormar.ForeignKey(
+        to=Diagnosis,
+        related_name='archived_appointments',
+        on_delete=ormar.ReferentialAction.CASCADE,
+        on_update=ormar.ReferentialAction.CASCADE,
+    )
+
+    date_created = ormar.DateTime(
+        nullable=False,
+        timezone=True,
+    )
+
+    date_to_come = ormar.DateTime(
+        nullable=False,
+        timezone=True,
+    )
+
+    patient = ormar.ForeignKey(
+        to=Patient,
+        related_name='archived_appointments',
+        on_delete=ormar.ReferentialAction.CASCADE,
+        on_update=ormar.ReferentialAction.CASCADE,
+        nullable=False,
+    )
+
+    status = ormar.Enum(
+        enum_class=AppointmentStatuses,
+    )
+
+    archive_month = ormar.Integer(
+        nullable=False,
+    )
+
+    date_archived = ormar.DateTime(
+        default=get_current_date,
+        nullable=False,
+        timezone=True,
+    )
+
+
+@ormar.pre_save(Patient)
+@ormar.pre_update(Patient)
+async def set_patient_phone_key(sender, instance: Patient, **kwargs):
+    instance.phone_key = normalize_phone(instance.phone_number)
+
+
+def backfill_phone_keys(connection: sqlalchemy.engine.Connection, batch_size: int = 1000) -> int:
+    """
+    Заполняет phone_key у пациентов, созданных до появления столбца.
+    Обновление идет пачками по возрастанию ID.
+    :param connection: Подключение, в котором обновляется схема
+    :param batch_size: Размер пачки
+    :return: количество обновленных пациентов
+    """
+
+    patients = Patient.ormar_config.table
+    updated = 0
+    last_id = 0
+
+    while True:
+        rows = connection.execute(
+            sqlalchemy.select(patients.c.id, patients.c.phone_number)
+            .where(patients.c.phone_key.is_(None), patients.c.id > last_id)
+            .order_by(patients.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            return updated
+
+        last_id = rows[-1][0]
+        values = [
+            {'patient_id': row[0], 'key': normalize_phone(row[1])}
+            for row in rows
+        ]
+        values = [value for value in values if value['key']]
+
+        if values:
+            connection.execute(
+                patients.update()
+                .where(patients.c.id == sqlalchemy.bindparam('patient_id'))
+                .values(phone_key=sqlalchemy.bindparam('key')),
+                values,
+            )
+            updated += len(values)
+
+
+# Заполнение столбцов, добавленных в существующие таблицы: (таблица, столбец) -> функция
+COLUMN_BACKFILLS = {
+    ('patients', 'phone_key'): backfill_phone_keys,
+}
+
+
+def remove_orphan_passports(connection: sqlalchemy.engine.Connection, duplicates: list[tuple]) -> None:
+    """
+    Удаляет паспорта с повторяющимися серией и номером, на которые не ссылается ни один пациент
+    (оставались, если создание пациента прерывалось после вставки паспорта).
+    :param connection: Подключение, в котором обновляется схема
+    :param duplicates: Повторяющиеся пары (серия, номер)
+    """
+
+    passports = Passport.ormar_config.table
+    patients = Patient.ormar_config.table
+
+    rows = connection.execute(
+        sqlalchemy.select(passports.c.id).where(
+            sqlalchemy.tuple_(passports.c.serial, passports.c.number).in_(duplicates),
+            ~sqlalchemy.exists().where(patients.c.passport == passports.c.id),
+        )
+    ).fetchall()
+    if not rows:
+        return
+
+    connection.execute(passports.delete().where(passports.c.id.in_([row[0] for row in rows])))
+    logger.warning('Удалено паспортов без пациента с повторяющимися серией и номером: %d', len(rows))
+
+
+# Очистка данных перед созданием уникального индекса в существующей таблице: имя индекса -> функция
+UNIQUE_INDEX_CLEANUPS = {
+    'ux_passports_serial_number': remove_orphan_passports,
+}
+
+
+def find_duplicate_keys(connection: sqlalchemy.engine.Connection, index: sqlalchemy.Index) -> list[tuple]:
+    columns = list(index.columns)
+    rows = connection.execute(
+        sqlalchemy.select(*columns).group_by(*columns).having(sqlalchemy.func.count() > 1)
+    ).fetchall()
+
+    return [tuple(row) for row in rows]
+
+
+def create_missing_index(connection: sqlalchemy.engine.Connection, index: sqlalchemy.Index) -> None:
+    """
+    Создает индекс, появившийся в модели, в существующей таблице.
+    Перед созданием уникального индекса удаляются мусорные повторы (UNIQUE_INDEX_CLEANUPS); если повторы
+    остались, индекс не создается. Ошибки пишутся в лог и не мешают запуску приложения.
+    """
+
+    try:
+        if index.unique:
+            duplicates = find_duplicate_keys(connection, index)
+            cleanup = UNIQUE_INDEX_CLEANUPS.get(index.name)
+            if duplicates and cleanup:
+                cleanup(connection, duplicates)
+                duplicates = find_duplicate_keys(connection, index)
+
+            if duplicates:
+                logger.error(
+                    'Уникальный индекс %s не создан: в таблице %s повторяются значения (%s), '
+                    'повторов %d, например %s. Исправьте данные и перезапустите приложение.',
+                    index.name,
+                    index.table.name,
+                    ', '.join(column.name for column in index.columns),
+                    len(duplicates),
+                    duplicates[:10],
+                )
+                return
+
+        index.create(bind=connection)
+    except sqlalchemy.exc.SQLAlchemyError:
+        logger.exception('Не удалось создать индекс %s', index.name)
+
+
+def migrate_schema():
+    """
+    Добавляет в уже существующие таблицы столбцы и индексы, появившиеся в моделях.
+    Добавленные столбцы заполняются один раз, сразу после добавления (COLUMN_BACKFILLS).
+    Индексы, которые не удалось создать, пропускаются (см. create_missing_index).
+    """
+
+    inspector = sqlalchemy.inspect(engine)
+
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                column_ddl = sqlalchemy.schema.CreateColumn(column).compile(dialect=engine.dialect)
+                connection.execute(sqlalchemy.text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}'
+                ))
+
+                backfill = COLUMN_BACKFILLS.get((table.name, column.name))
+                if backfill:
+                    backfill(connection)
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    create_missing_index(connection, index)
+
 
 async def run_database():
     await database.connect()
 
 metadata.create_all(bind=engine)
-settings.LOOP.run_until_complete(run_database())
+migrate_schema()
+run_sync(run_database())
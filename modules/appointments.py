@@ -1,8 +1,104 @@
 import datetime
+from typing import Awaitable, Callable, NamedTuple
 
+import ormar
+import sqlalchemy
+
+from database_routing import replica_reads
 import models
 import serializers
-from models import Appointment, AppointmentStatuses, Patient,  Diagnosis
+from models import Appointment, AppointmentStatuses, ArchivedAppointment, Patient,  Diagnosis
+from modules.events import event_bus, AppointmentsChanged, ChangeAction
+from modules.loaders import prefetch_related
+from modules.patient import get_patient
+from modules.projection import fetch_projection, fetch_trusted, hydrate_projection
+from modules.scheduling import slot_allocator, to_local_naive
+
+# Связи, загружаемые вместе с приемом
+APPOINTMENT_RELATED = ['diagnosis', 'patient']
+
+# Поля, отображаемые в таблицах приемов
+APPOINTMENT_LIST_FIELDS = [
+    'id',
+    'date_created',
+    'date_to_come',
+    'status',
+    'patient__id',
+    'patient__first_name',
+    'patient__last_name',
+    'patient__surname',
+    'diagnosis__id',
+    'diagnosis__name',
+]
+
+CLOSED_APPOINTMENT_STATUSES = [
+    AppointmentStatuses.CANCELED,
+    AppointmentStatuses.NOT_CAME,
+    AppointmentStatuses.COMPLETED,
+    AppointmentStatuses.RECREATED,
+]
+
+# Жизненный цикл приема: статус -> статусы, в которые его можно перевести.
+# Закрытые приемы редактировать нельзя.
+APPOINTMENT_TRANSITIONS: dict[AppointmentStatuses, set[AppointmentStatuses]] = {
+    AppointmentStatuses.IN_QUEUE: {
+        AppointmentStatuses.COMPLETED,
+        AppointmentStatuses.CANCELED,
+        AppointmentStatuses.NOT_CAME,
+        AppointmentStatuses.RECREATED,
+    },
+    AppointmentStatuses.COMPLETED: set(),
+    AppointmentStatuses.CANCELED: set(),
+    AppointmentStatuses.NOT_CAME: set(),
+    AppointmentStatuses.RECREATED: set(),
+}
+
+
+# Код ошибки MySQL: взаимная блокировка транзакций, одна из них откачена
+MYSQL_DEADLOCK_ERROR = 1213
+
+# Сколько раз выполнять транзакцию записи в слоты, откаченную из-за взаимной блокировки
+SLOT_WRITE_ATTEMPTS = 3
+
+
+class TransitionResult(NamedTuple):
+    # ID приемов, статус которых изменен
+    updated: list[int]
+    # ID приемов, которые не найдены или из текущего статуса не переводятся в новый
+    rejected: list[int]
+
+
+def get_source_statuses(status: AppointmentStatuses) -> list[AppointmentStatuses]:
+    """
+    Статусы, из которых прием можно перевести в указанный.
+    """
+
+    return [
+        source for source, targets in APPOINTMENT_TRANSITIONS.items()
+        if status in targets
+    ]
+
+
+def is_deadlock(error: Exception) -> bool:
+    return bool(error.args) and error.args[0] == MYSQL_DEADLOCK_ERROR
+
+
+async def in_slot_transaction[T](write: Callable[[], Awaitable[T]]) -> T:
+    """
+    Выполняет запись, занимающую места в слотах, в транзакции.
+    Две записи в один пустой слот блокируют один и тот же промежуток индекса и могут заблокировать
+    друг друга: MySQL откатывает одну из транзакций, и она выполняется заново (уже видя первую запись).
+    :param write: Запись (вызывается внутри транзакции)
+    :return: результат записи
+    """
+
+    for attempt in range(1, SLOT_WRITE_ATTEMPTS + 1):
+        try:
+            async with models.database.transaction():
+                return await write()
+        except Exception as error:
+            if not is_deadlock(error) or attempt == SLOT_WRITE_ATTEMPTS:
+                raise
 
 
 async def create_diagnosis():
@@ -14,9 +110,7 @@ async def create_appointment(data: serializers.AppointmentSerializer) -> Appoint
         id=data.diagnosis_id,
     )
 
-    patient = await Patient.objects.get(
-        id=data.patient_id,
-    )
+    patient = await get_patient(data.patient_id)
 
     if not diagnosis:
         raise Exception('Запрашиваемый Вами диагноз не найден.')
@@ -24,77 +118,346 @@ async def create_appointment(data: serializers.AppointmentSerializer) -> Appoint
     if not patient:
         raise Exception('Запрашиваемый Вами пациент не найден.')
 
-    appointment = await Appointment.objects.create(
-        diagnosis=diagnosis,
-        patient=patient,
-        date_to_come=data.date_to_come,
-        status=AppointmentStatuses.IN_QUEUE,
-    )
+    async def write() -> Appointment:
+        await slot_allocator.reserve(data.date_to_come)
+        return await Appointment.objects.create(
+            diagnosis=diagnosis,
+            # Пациент из общего кеша не связывается с новым приемом: передаем его отдельную копию
+            patient=hydrate_projection(Patient, {
+                'id': patient.id,
+                'first_name': patient.first_name,
+                'last_name': patient.last_name,
+                'surname': patient.surname,
+            }),
+            date_to_come=data.date_to_come,
+            status=AppointmentStatuses.IN_QUEUE,
+            insurance_expired=patient.insurance.date_expires < to_local_naive(data.date_to_come).date(),
+        )
+
+    appointment = await in_slot_transaction(write)
+    slot_allocator.occupy(data.date_to_come)
 
+    await event_bus.publish(AppointmentsChanged(ChangeAction.CREATED, (appointment.id,)))
     return appointment
 
 
-async def get_patient_active_appointments(patient: models.Patient) -> list[Appointment]:
-    return await Appointment.objects.select_related(['diagnosis', 'patient']).filter(
-        patient__id=patient.id,
-        status__in=[
-            AppointmentStatuses.IN_QUEUE,
-            AppointmentStatuses.RECREATED,
-        ]
-    ).all()
+async def fetch_appointments(queryset: ormar.QuerySet, trusted: bool = False) -> list[Appointment]:
+    """
+    Выполняет запрос приемов с пациентом и диагнозом.
+    :param queryset: Запрос приемов
+    :param trusted: Собрать сущности без повторной валидации строк БД
+    :return: список приемов
+    """
+
+    queryset = queryset.select_related(APPOINTMENT_RELATED)
+    if trusted:
+        return await fetch_trusted(Appointment, queryset, APPOINTMENT_RELATED)
 
+    return await queryset.all()
 
-async def get_all_appointments() -> list[Appointment]:
-    return await Appointment.objects.select_related(['diagnosis', 'patient']).all()
 
+async def get_patient_active_appointments(patient: models.Patient, trusted: bool = False) -> list[Appointment]:
+    return await fetch_appointments(
+        Appointment.objects.filter(
+            patient__id=patient.id,
+            status__in=[
+                AppointmentStatuses.IN_QUEUE,
+                AppointmentStatuses.RECREATED,
+            ]
+        ),
+        trusted=trusted,
+    )
 
-async def get_active_appointments() -> list[Appointment]:
-    return await Appointment.objects.select_related(['diagnosis', 'patient']).filter(
-        status__in=[
-            AppointmentStatuses.IN_QUEUE,
-        ]
-    ).all()
 
+@replica_reads
+async def get_all_appointments(trusted: bool = False) -> list[Appointment]:
+    return await fetch_appointments(Appointment.objects, trusted=trusted)
 
-async def recreate_appointment(appointment: Appointment, date_to_come: datetime.datetime) -> Appointment:
-    await appointment.update(
-        status=AppointmentStatuses.RECREATED,
+
+@replica_reads
+async def get_active_appointments(trusted: bool = False) -> list[Appointment]:
+    return await fetch_appointments(
+        Appointment.objects.filter(
+            status__in=[
+                AppointmentStatuses.IN_QUEUE,
+            ]
+        ),
+        trusted=trusted,
     )
 
-    new_appointment = await Appointment.objects.create(
-        patient=appointment.patient,
-        date_to_come=date_to_come,
-        diagnosis=appointment.diagnosis,
-        status=AppointmentStatuses.IN_QUEUE,
+
+async def _update_statuses(condition, status: AppointmentStatuses) -> list:
+    """
+    Блокирует приемы, подходящие под условие и таблицу переходов, и переводит их в новый статус
+    одним условным UPDATE. Вызывается внутри транзакции.
+    :return: строки (id, patient, diagnosis, date_to_come) обновленных приемов
+    """
+
+    appointments = Appointment.ormar_config.table
+    condition = sqlalchemy.and_(
+        condition,
+        appointments.c.status.in_(get_source_statuses(status)),
+    )
+
+    rows = await models.database.fetch_all(
+        sqlalchemy.select(
+            appointments.c.id,
+            appointments.c.patient,
+            appointments.c.diagnosis,
+            appointments.c.date_to_come,
+        )
+        .where(condition)
+        .with_for_update()
     )
 
-    return new_appointment
+    if rows:
+        await models.database.execute(
+            appointments.update().where(condition).values(status=status)
+        )
+
+    return [tuple(row[index] for index in range(4)) for row in rows]
+
+
+async def transition_appointments(appointment_ids: list[int], status: AppointmentStatuses) -> TransitionResult:
+    """
+    Переводит приемы в новый статус одним условным UPDATE ... WHERE status IN (...)
+    по таблице переходов APPOINTMENT_TRANSITIONS.
+    Строки, подходящие под условие, блокируются в той же транзакции (SELECT ... FOR UPDATE),
+    поэтому параллельная сессия не может изменить их статус между проверкой и обновлением.
+    :param appointment_ids: ID приемов
+    :param status: Новый статус
+    :return: ID обновленных и отклоненных приемов
+    """
+
+    appointment_ids = list(dict.fromkeys(appointment_ids))
+    if not appointment_ids or not get_source_statuses(status):
+        return TransitionResult([], appointment_ids)
+
+    appointments = Appointment.ormar_config.table
+    async with models.database.transaction():
+        rows = await _update_statuses(appointments.c.id.in_(appointment_ids), status)
+
+    updated = {row[0]: row[3] for row in rows}
+    if status != AppointmentStatuses.IN_QUEUE:
+        for date_to_come in updated.values():
+            slot_allocator.release(date_to_come)
+
+    result = TransitionResult(
+        [appointment_id for appointment_id in appointment_ids if appointment_id in updated],
+        [appointment_id for appointment_id in appointment_ids if appointment_id not in updated],
+    )
+    await event_bus.publish(AppointmentsChanged(ChangeAction.UPDATED, tuple(result.updated)))
+
+    return result
 
 
 async def update_appointment_status(appointment: Appointment, status: AppointmentStatuses) -> Appointment:
-    if appointment.status in [
-        AppointmentStatuses.RECREATED,
-        AppointmentStatuses.CANCELED,
-        AppointmentStatuses.COMPLETED,
-        AppointmentStatuses.NOT_CAME,
-    ]:
+    result = await transition_appointments([appointment.id], status)
+    if result.rejected:
         raise Exception(
             'Прием уже был закрыт/отменен/завершен, и редактировать его данные уже нельзя.'
         )
 
-    await appointment.update(
-        status=status
+    appointment.status = status
+    return appointment
+
+
+async def recreate_appointment(appointment: Appointment, date_to_come: datetime.datetime) -> Appointment:
+    """
+    Переносит прием: старый помечается RECREATED, создается новый IN_QUEUE.
+    Оба изменения выполняются в одной транзакции; пациент и диагноз берутся из строки старого приема.
+    :param appointment: Переносимый прием
+    :param date_to_come: Новое время приема
+    :return: новый прием
+    """
+
+    appointments = Appointment.ormar_config.table
+    date_created = models.get_current_date()
+
+    async def write() -> tuple[datetime.datetime, int]:
+        rows = await _update_statuses(
+            appointments.c.id == appointment.id,
+            AppointmentStatuses.RECREATED,
+        )
+        if not rows:
+            raise Exception(
+                'Прием уже был закрыт/отменен/завершен, и перенести его уже нельзя.'
+            )
+
+        # Старый прием уже не IN_QUEUE и в занятость слота не входит
+        await slot_allocator.reserve(date_to_come)
+
+        _, patient_id, diagnosis_id, old_date_to_come = rows[0]
+        new_appointment_id = await models.database.execute(
+            appointments.insert().values(
+                patient=patient_id,
+                diagnosis=diagnosis_id,
+                date_created=date_created,
+                date_to_come=date_to_come,
+                status=AppointmentStatuses.IN_QUEUE,
+            )
+        )
+        return old_date_to_come, new_appointment_id
+
+    old_date_to_come, new_appointment_id = await in_slot_transaction(write)
+
+    slot_allocator.occupy(date_to_come)
+    slot_allocator.release(old_date_to_come)
+    appointment.status = AppointmentStatuses.RECREATED
+
+    await event_bus.publish(AppointmentsChanged(ChangeAction.UPDATED, (appointment.id,)))
+    await event_bus.publish(AppointmentsChanged(ChangeAction.CREATED, (new_appointment_id,)))
+
+    return Appointment(
+        id=new_appointment_id,
+        patient=appointment.patient,
+        diagnosis=appointment.diagnosis,
+        date_created=date_created,
+        date_to_come=date_to_come,
+        status=AppointmentStatuses.IN_QUEUE,
     )
 
-    return appointment
 
+async def recreate_day_appointments(day: datetime.date, new_day: datetime.date) -> int:
+    """
+    Переносит все ожидающие приемы дня на другой день с сохранением времени
+    (например, если врач не вышел на работу). Выполняется одной транзакцией:
+    блокировка строк дня, одна многострочная вставка новых приемов и один UPDATE старых.
+    Если на новый день не хватает мест, ничего не переносится.
+    :param day: День, с которого переносятся приемы
+    :param new_day: День, на который переносятся приемы
+    :return: количество перенесенных приемов
+    """
+
+    appointments = Appointment.ormar_config.table
+    day_start = datetime.datetime.combine(day, datetime.time.min)
+    shift = datetime.datetime.combine(new_day, datetime.time.min) - day_start
+    date_created = models.get_current_date()
 
-async def get_inactive_appointments():
-    return await Appointment.objects.filter(
-        status__in=[
-            AppointmentStatuses.CANCELED,
-            AppointmentStatuses.NOT_CAME,
-            AppointmentStatuses.COMPLETED,
+    async def write() -> tuple[list, int | None]:
+        rows = await _update_statuses(
+            sqlalchemy.and_(
+                appointments.c.date_to_come >= day_start,
+                appointments.c.date_to_come < day_start + datetime.timedelta(days=1),
+            ),
             AppointmentStatuses.RECREATED,
-        ]
-    ).all()
+        )
+        if not rows:
+            return rows, None
+
+        # Вставка выполняется после всех проверок, поэтому приемы одного слота проверяются вместе
+        slots: dict[int | None, list[datetime.datetime]] = {}
+        for *_, date_to_come in rows:
+            new_date_to_come = to_local_naive(date_to_come) + shift
+            slots.setdefault(slot_allocator.slot_index(new_date_to_come), []).append(new_date_to_come)
+
+        for values in slots.values():
+            await slot_allocator.reserve(values[0], places=len(values))
+
+        # Для многострочной вставки MySQL возвращает ID первой строки, остальные идут подряд
+        first_id = await models.database.execute(
+            appointments.insert().values([
+                {
+                    'patient': patient_id,
+                    'diagnosis': diagnosis_id,
+                    'date_created': date_created,
+                    'date_to_come': to_local_naive(date_to_come) + shift,
+                    'status': AppointmentStatuses.IN_QUEUE,
+                }
+                for _, patient_id, diagnosis_id, date_to_come in rows
+            ])
+        )
+        return rows, first_id
+
+    rows, first_id = await in_slot_transaction(write)
+    if not rows:
+        return 0
+
+    for *_, date_to_come in rows:
+        slot_allocator.occupy(to_local_naive(date_to_come) + shift)
+
+    # Старый день перечитается из БД при следующем обращении
+    slot_allocator.invalidate(day)
+
+    await event_bus.publish(AppointmentsChanged(ChangeAction.UPDATED, tuple(row[0] for row in rows)))
+    await event_bus.publish(AppointmentsChanged(ChangeAction.CREATED, tuple(range(first_id, first_id + len(rows)))))
+    return len(rows)
+
+
+@replica_reads
+async def get_archived_appointments(trusted: bool = False) -> list[Appointment]:
+    """
+    Приемы из архива в виде сущностей основной таблицы.
+    :param trusted: Собрать сущности без повторной валидации строк БД
+    :return: список архивных приемов
+    """
+
+    queryset = ArchivedAppointment.objects
+    if trusted:
+        archived = await fetch_trusted(ArchivedAppointment, queryset)
+    else:
+        archived = await queryset.all()
+
+    # У архивных приемов много повторяющихся пациентов: каждый загружается один раз
+    await prefetch_related(archived, APPOINTMENT_RELATED)
+
+    return [
+        Appointment.model_construct(
+            id=appointment.id,
+            diagnosis=appointment.diagnosis,
+            date_created=appointment.date_created,
+            date_to_come=appointment.date_to_come,
+            patient=appointment.patient,
+            status=appointment.status,
+        )
+        for appointment in archived
+    ]
+
+
+@replica_reads
+async def get_inactive_appointments(trusted: bool = False, include_archive: bool = False) -> list[Appointment]:
+    """
+    Закрытые приемы.
+    :param trusted: Собрать сущности без повторной валидации строк БД
+    :param include_archive: Добавить приемы из архива (по умолчанию читается только основная таблица)
+    :return: список закрытых приемов
+    """
+
+    appointments = await fetch_appointments(
+        Appointment.objects.filter(
+            status__in=CLOSED_APPOINTMENT_STATUSES,
+        ),
+        trusted=trusted,
+    )
+
+    if include_archive:
+        appointments = sorted(
+            appointments + await get_archived_appointments(trusted=trusted),
+            key=lambda appointment: appointment.id,
+        )
+
+    return appointments
+
+
+@replica_reads
+async def get_appointments_list(statuses: list[AppointmentStatuses] = None) -> list[Appointment]:
+    """
+    Список приемов для таблиц: выбираются только отображаемые поля,
+    пациент и диагноз загружаются частично.
+    :param statuses: Статусы приемов (по умолчанию - все)
+    :return: список частично загруженных приемов
+    """
+
+    queryset = Appointment.objects.select_related(APPOINTMENT_RELATED)
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+
+    return await fetch_projection(Appointment, queryset, APPOINTMENT_LIST_FIELDS)
+
+
+async def handle_remote_appointments_changed(_: AppointmentsChanged) -> None:
+    # Занятость слотов, загруженная этим процессом, перечитается из БД при следующем обращении
+    slot_allocator.invalidate()
+
+
+event_bus.subscribe_remote(AppointmentsChanged, handle_remote_appointments_changed)
@@ -0,0 +1,142 @@
+"""
+Перенос закрытых приемов в архив.
+
+Закрытые приемы старше settings.ARCHIVE_AFTER_DAYS переносятся из таблицы appointments
+в appointments_archive пачками. Каждая пачка - одна транзакция
+(INSERT ... SELECT и DELETE по одним и тем же ID), поэтому прерванный перенос
+безопасно продолжается следующим запуском с оставшихся строк.
+"""
+import datetime
+import logging
+
+import databases
+import sqlalchemy
+
+import models
+import settings
+from models import AppointmentStatuses
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_STATUSES = [
+    AppointmentStatuses.CANCELED,
+    AppointmentStatuses.NOT_CAME,
+    AppointmentStatuses.COMPLETED,
+    AppointmentStatuses.RECREATED,
+]
+
+
+def get_archive_month(value: datetime.date) -> int:
+    return value.year * 100 + value.month
+
+
+def get_archive_months_range(
+        date_from: datetime.datetime | None,
+        date_to: datetime.datetime | None,
+) -> sqlalchemy.sql.ColumnElement | None:
+    """
+    Условие по месяцам архива для периода, чтобы читались только нужные месяцы.
+    """
+
+    archive_month = models.ArchivedAppointment.ormar_config.table.c.archive_month
+    conditions = []
+
+    if date_from is not None:
+        conditions.append(archive_month >= get_archive_month(date_from))
+    if date_to is not None:
+        conditions.append(archive_month <= get_archive_month(date_to))
+
+    return sqlalchemy.and_(*conditions) if conditions else None
+
+
+def get_archive_cutoff(older_than_days: int = settings.ARCHIVE_AFTER_DAYS) -> datetime.datetime:
+    now = datetime.datetime.now(tz=settings.TIMEZONE).replace(tzinfo=None)
+    return now - datetime.timedelta(days=older_than_days)
+
+
+async def archive_batch(
+        database: databases.Database,
+        cutoff: datetime.datetime,
+        batch_size: int = settings.ARCHIVE_BATCH_SIZE,
+) -> int:
+    """
+    Переносит в архив одну пачку закрытых приемов, назначенных раньше cutoff.
+    :return: количество перенесенных приемов
+    """
+
+    appointments = models.Appointment.ormar_config.table
+    archive = models.ArchivedAppointment.ormar_config.table
+
+    async with database.transaction():
+        rows = await database.fetch_all(
+            sqlalchemy.select(appointments.c.id)
+            .where(
+                appointments.c.date_to_come < cutoff,
+                appointments.c.status.in_(ARCHIVED_STATUSES),
+            )
+            .order_by(appointments.c.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        if not rows:
+            return 0
+
+        appointment_ids = [row[0] for row in rows]
+        await database.execute(
+            archive.insert().from_select(
+                [
+                    archive.c.id,
+                    archive.c.diagnosis,
+                    archive.c.date_created,
+                    archive.c.date_to_come,
+                    archive.c.patient,
+                    archive.c.status,
+                    archive.c.archive_month,
+                    archive.c.date_archived,
+                ],
+                sqlalchemy.select(
+                    appointments.c.id,
+                    appointments.c.diagnosis,
+                    appointments.c.date_created,
+                    appointments.c.date_to_come,
+                    appointments.c.patient,
+                    appointments.c.status,
+                    sqlalchemy.extract('year', appointments.c.date_to_come) * 100
+                    + sqlalchemy.extract('month', appointments.c.date_to_come),
+                    sqlalchemy.literal(models.get_current_date(), sqlalchemy.DateTime()),
+                ).where(appointments.c.id.in_(appointment_ids)),
+            )
+        )
+        await database.execute(
+            appointments.delete().where(appointments.c.id.in_(appointment_ids))
+        )
+
+    return len(appointment_ids)
+
+
+async def archive_closed_appointments(
+        database: databases.Database = models.database,
+        older_than_days: int = settings.ARCHIVE_AFTER_DAYS,
+        batch_size: int = settings.ARCHIVE_BATCH_SIZE,
+) -> int:
+    """
+    Переносит в архив все закрытые приемы старше указанного количества дней.
+    :param database: Подключение к БД (у фонового планировщика - свое)
+    :param older_than_days: Возраст приема в днях
+    :param batch_size: Размер пачки
+    :return: количество перенесенных приемов
+    """
+
+    cutoff = get_archive_cutoff(older_than_days)
+    archived = 0
+
+    while True:
+        batch_archived = await archive_batch(database, cutoff, batch_size)
+        archived += batch_archived
+        if batch_archived < batch_size:
+            break
+
+    if archived:
+        logger.info('В архив перенесено приемов: %d', archived)
+
+    return archived
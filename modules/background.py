@@ -0,0 +1,118 @@
+"""
+Фоновые задачи внутри процесса приложения.
+
+Задачи выполняются в отдельном потоке со своим циклом событий и своим
+подключением к БД, поэтому не конкурируют с обработчиками интерфейса
+за settings.LOOP и models.database.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable
+
+import databases
+
+import settings
+from database_pool import create_database
+
+logger = logging.getLogger(__name__)
+
+TaskFunction = Callable[[databases.Database], Awaitable[None]]
+
+
+class BackgroundTask:
+    __slots__ = ('name', 'interval', 'function', 'next_run_at')
+
+    def __init__(self, name: str, interval: float, function: TaskFunction):
+        self.name = name
+        self.interval = interval
+        self.function = function
+        self.next_run_at = 0.0
+
+
+class BackgroundScheduler:
+    """
+    Периодический запуск задач. Каждая задача получает подключение к БД планировщика.
+    """
+
+    def __init__(self, database_url: str = settings.DATABASE_URL):
+        self.database_url = database_url
+        self.tasks: dict[str, BackgroundTask] = {}
+
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop_event: asyncio.Event | None = None
+
+    def add_task(self, name: str, interval: float, function: TaskFunction) -> None:
+        """
+        Регистрирует периодическую задачу.
+        :param name: Название задачи (для логов)
+        :param interval: Интервал запуска в секундах
+        :param function: Асинхронная функция, принимающая подключение к БД
+        """
+
+        self.tasks[name] = BackgroundTask(name, interval, function)
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+
+        self._thread = threading.Thread(target=self._run, name='background-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        if not self.is_running:
+            return
+
+        self._loop.call_soon_threadsafe(self._stop_event.set)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._stop_event = asyncio.Event()
+
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self) -> None:
+        database = create_database(self.database_url)
+        await database.connect()
+
+        try:
+            while not self._stop_event.is_set():
+                now = time.monotonic()
+                for task in self.tasks.values():
+                    if task.next_run_at <= now:
+                        await self._run_task(task, database)
+
+                timeout = max(0.0, min(
+                    (task.next_run_at for task in self.tasks.values()),
+                    default=now + 60,
+                ) - time.monotonic())
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await database.disconnect()
+
+    @staticmethod
+    async def _run_task(task: BackgroundTask, database: databases.Database) -> None:
+        started_at = time.monotonic()
+        try:
+            await task.function(database)
+        except Exception:
+            logger.exception('Фоновая задача %s завершилась с ошибкой', task.name)
+        finally:
+            task.next_run_at = started_at + task.interval
+
+
+scheduler = BackgroundScheduler()
@@ -1,8 +1,19 @@
+from database_routing import replica_reads
 from models import Diagnosis, Appointment
+from modules.events import event_bus, DiagnosesChanged, ChangeAction
+from modules.projection import fetch_trusted
 
 
-async def get_diagnoses() -> list[Diagnosis]:
-    diagnoses = await Diagnosis.objects.all()
+@replica_reads
+async def get_diagnoses(trusted: bool = False, ids: list[int] = None) -> list[Diagnosis]:
+    queryset = Diagnosis.objects
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+
+    if trusted:
+        return await fetch_trusted(Diagnosis, queryset)
+
+    diagnoses = await queryset.all()
     # for diagnosis in diagnoses:
     #     setattr(diagnosis, 'appointments_count', await Appointment.objects.filter(diagnosis__id=diagnosis.id).count())
     return diagnoses
@@ -16,5 +27,13 @@ async def create_diagnosis(name: str) -> Diagnosis:
     if not is_created:
         raise Exception("Данный диагноз уже существует в базе.")
 
+    await event_bus.publish(DiagnosesChanged(ChangeAction.CREATED, (diagnosis.id,)))
     return diagnosis
 
+
+async def remove_diagnosis(diagnosis: Diagnosis) -> bool:
+    diagnosis_id = diagnosis.id
+    await diagnosis.delete()
+    await event_bus.publish(DiagnosesChanged(ChangeAction.DELETED, (diagnosis_id,)))
+    return True
+
@@ -0,0 +1,219 @@
+"""
+Поиск вероятных дублей пациентов (опечатки в ФИО при повторной регистрации).
+
+Пациенты разбиваются на блоки по ключу (дата рождения + фонетический ключ фамилии
+или имени), а расстояние Левенштейна считается только внутри блока.
+Поэтому проверка всего реестра растет почти линейно, а не квадратично.
+"""
+import datetime
+from collections import defaultdict
+from itertools import combinations
+from typing import NamedTuple
+
+import sqlalchemy
+
+import models
+
+# Максимальное суммарное расстояние Левенштейна по ФИО для дубля
+MAX_NAME_DISTANCE = 2
+
+# Максимальная длина фонетического ключа
+PHONETIC_KEY_LENGTH = 6
+
+VOWELS = set('аеёиоуыэюяй')
+
+# Звонкие согласные оглушаются, чтобы "Бобров" и "Попров" попадали в один блок
+CONSONANTS_MAP = str.maketrans({
+    'б': 'п',
+    'в': 'ф',
+    'г': 'к',
+    'д': 'т',
+    'ж': 'ш',
+    'з': 'с',
+    'щ': 'ш',
+    'ц': 'с',
+    'ё': 'е',
+})
+
+
+class PatientNames(NamedTuple):
+    id: int
+    first_name: str
+    last_name: str
+    surname: str
+    date_of_birth: datetime.date
+
+
+class DuplicatePair(NamedTuple):
+    first_id: int
+    second_id: int
+    distance: int
+
+
+def normalize_name(name: str | None) -> str:
+    return (name or '').strip().lower().replace('ё', 'е')
+
+
+def phonetic_key(name: str | None) -> str:
+    """
+    Упрощенный фонетический ключ русского имени: первая буква,
+    затем оглушенные согласные без гласных, мягкого/твердого знака и повторов.
+    """
+
+    name = normalize_name(name).translate(CONSONANTS_MAP)
+    if not name:
+        return ''
+
+    key = [name[0]]
+    for char in name[1:]:
+        if char in VOWELS or char in 'ьъ' or not char.isalpha():
+            continue
+        if key[-1] != char:
+            key.append(char)
+
+    return ''.join(key)[:PHONETIC_KEY_LENGTH]
+
+
+def levenshtein(first: str, second: str, max_distance: int) -> int:
+    """
+    Расстояние Левенштейна с отсечкой: как только оно гарантированно больше max_distance,
+    возвращается max_distance + 1.
+    """
+
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+
+    if len(first) < len(second):
+        first, second = second, first
+
+    previous = list(range(len(second) + 1))
+    for index, first_char in enumerate(first, start=1):
+        current = [index]
+        for second_index, second_char in enumerate(second, start=1):
+            current.append(min(
+                previous[second_index] + 1,
+                current[second_index - 1] + 1,
+                previous[second_index - 1] + (first_char != second_char),
+            ))
+
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+
+    return previous[-1]
+
+
+def names_distance(first: PatientNames, second: PatientNames, max_distance: int = MAX_NAME_DISTANCE) -> int:
+    distance = 0
+    for first_name, second_name in (
+            (first.last_name, second.last_name),
+            (first.first_name, second.first_name),
+            (first.surname, second.surname),
+    ):
+        distance += levenshtein(
+            normalize_name(first_name),
+            normalize_name(second_name),
+            max_distance - distance,
+        )
+        if distance > max_distance:
+            break
+
+    return distance
+
+
+def get_blocking_keys(patient: PatientNames) -> tuple[tuple, ...]:
+    """
+    Ключи блоков пациента. Второй ключ (по имени) находит дубли с опечаткой в первой букве фамилии.
+    """
+
+    return (
+        (patient.date_of_birth, 'last_name', phonetic_key(patient.last_name)),
+        (patient.date_of_birth, 'first_name', phonetic_key(patient.first_name)),
+    )
+
+
+def find_duplicates_in_blocks(
+        blocks: dict[tuple, list[PatientNames]],
+        max_distance: int = MAX_NAME_DISTANCE,
+) -> list[DuplicatePair]:
+    pairs: dict[tuple[int, int], DuplicatePair] = {}
+
+    for block in blocks.values():
+        for first, second in combinations(block, 2):
+            pair_key = (min(first.id, second.id), max(first.id, second.id))
+            if pair_key in pairs:
+                continue
+
+            distance = names_distance(first, second, max_distance)
+            if distance <= max_distance:
+                pairs[pair_key] = DuplicatePair(*pair_key, distance)
+
+    return sorted(pairs.values())
+
+
+def patient_names_query() -> sqlalchemy.sql.Select:
+    patients = models.Patient.ormar_config.table
+    passports = models.Passport.ormar_config.table
+
+    return sqlalchemy.select(
+        patients.c.id,
+        patients.c.first_name,
+        patients.c.last_name,
+        patients.c.surname,
+        passports.c.date_of_birth,
+    ).select_from(
+        patients.join(passports, patients.c.passport == passports.c.id)
+    )
+
+
+async def find_duplicate_patients(max_distance: int = MAX_NAME_DISTANCE) -> list[DuplicatePair]:
+    """
+    Проверка всего реестра на вероятные дубли.
+    :param max_distance: Максимальное суммарное расстояние по ФИО
+    :return: пары ID вероятных дублей
+    """
+
+    blocks: dict[tuple, list[PatientNames]] = defaultdict(list)
+
+    async for row in models.database.iterate(patient_names_query()):
+        patient = PatientNames(*(row[index] for index in range(5)))
+        for key in get_blocking_keys(patient):
+            blocks[key].append(patient)
+
+    return find_duplicates_in_blocks(blocks, max_distance)
+
+
+async def find_similar_patients(
+        first_name: str,
+        last_name: str,
+        surname: str | None,
+        date_of_birth: datetime.date,
+        max_distance: int = MAX_NAME_DISTANCE,
+) -> list[int]:
+    """
+    Поиск уже зарегистрированных пациентов, похожих на нового.
+    Читаются только пациенты с той же датой рождения (по индексу).
+    :return: ID похожих пациентов
+    """
+
+    if isinstance(date_of_birth, datetime.datetime):
+        date_of_birth = date_of_birth.date()
+
+    candidate = PatientNames(0, first_name, last_name, surname, date_of_birth)
+    candidate_keys = set(get_blocking_keys(candidate))
+
+    passports = models.Passport.ormar_config.table
+    rows = await models.database.fetch_all(
+        patient_names_query().where(passports.c.date_of_birth == date_of_birth)
+    )
+
+    similar = []
+    for row in rows:
+        patient = PatientNames(*(row[index] for index in range(5)))
+        if candidate_keys.isdisjoint(get_blocking_keys(patient)):
+            continue
+
+        if names_distance(candidate, patient, max_distance) <= max_distance:
+            similar.append(patient.id)
+
+    return similar
@@ -0,0 +1,247 @@
+"""
+Шина событий об изменении данных (publish/subscribe).
+
+Модули записи (modules.patient, modules.appointments, modules.diagnosis) публикуют
+типизированные события с ID измененных строк, а открытые страницы всех сессий
+подписываются на них и обновляют только затронутые строки таблиц.
+
+По умолчанию события доставляются внутри процесса. Для нескольких процессов
+подключается бэкенд-брокер (TcpBrokerBackend); для проверки локально запускается
+простой брокер: python event_broker.py
+"""
+import asyncio
+import enum
+import json
+import logging
+import threading
+import weakref
+from typing import Awaitable, Callable, NamedTuple
+
+import settings
+from database_routing import primary_reads
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeAction(enum.Enum):
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+
+
+class PatientsChanged(NamedTuple):
+    action: ChangeAction
+    ids: tuple[int, ...]
+
+
+class AppointmentsChanged(NamedTuple):
+    action: ChangeAction
+    ids: tuple[int, ...]
+
+
+class DiagnosesChanged(NamedTuple):
+    action: ChangeAction
+    ids: tuple[int, ...]
+
+
+type ChangeEvent = PatientsChanged | AppointmentsChanged | DiagnosesChanged
+type EventHandler = Callable[[ChangeEvent], Awaitable[None]]
+
+EVENT_TYPES: dict[str, type[ChangeEvent]] = {
+    event_type.__name__: event_type
+    for event_type in (PatientsChanged, AppointmentsChanged, DiagnosesChanged)
+}
+
+
+def encode_event(event: ChangeEvent) -> bytes:
+    return json.dumps({
+        'type': type(event).__name__,
+        'action': event.action.value,
+        'ids': list(event.ids),
+    }).encode() + b'\n'
+
+
+def decode_event(payload: bytes) -> ChangeEvent:
+    data = json.loads(payload)
+    return EVENT_TYPES[data['type']](ChangeAction(data['action']), tuple(data['ids']))
+
+
+class LocalBackend:
+    """
+    Бэкенд для одного процесса: события не покидают процесс.
+    """
+
+    def start(self, on_message: Callable[[bytes], None]) -> None:
+        pass
+
+    def publish(self, payload: bytes) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class TcpBrokerBackend:
+    """
+    Бэкенд для нескольких процессов: события пересылаются через TCP-брокер (run_broker),
+    который рассылает каждую строку всем остальным подключенным процессам.
+    Соединение обслуживается в отдельном потоке и восстанавливается при обрыве.
+    """
+
+    def __init__(self, host: str, port: int, reconnect_delay: float = 1.0):
+        self.host = host
+        self.port = port
+        self.reconnect_delay = reconnect_delay
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def start(self, on_message: Callable[[bytes], None]) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_until_complete,
+            args=(self._run(on_message),),
+            name='event-broker',
+            daemon=True,
+        )
+        self._thread.start()
+
+    async def _run(self, on_message: Callable[[bytes], None]) -> None:
+        while not self._closed:
+            try:
+                reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                while line := await reader.readline():
+                    on_message(line)
+            except OSError as error:
+                logger.warning('Нет соединения с брокером событий %s:%d: %s', self.host, self.port, error)
+            finally:
+                self._writer = None
+
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _write(self, payload: bytes) -> None:
+        if self._writer is not None:
+            self._writer.write(payload)
+
+    def publish(self, payload: bytes) -> None:
+        if self._loop is not None and not self._closed:
+            self._loop.call_soon_threadsafe(self._write, payload)
+
+    def close(self) -> None:
+        self._closed = True
+        if self._loop is not None and self._writer is not None:
+            self._loop.call_soon_threadsafe(self._writer.close)
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers: dict[type[ChangeEvent], list[Callable[[], EventHandler | None]]] = {}
+        # Обработчики событий только из других процессов
+        self._remote_handlers: dict[type[ChangeEvent], list[EventHandler]] = {}
+        self.backend: LocalBackend | TcpBrokerBackend = LocalBackend()
+        # Задачи доставки в цикле приложения: ссылки, чтобы задачи не удалил сборщик мусора
+        self._deliveries: set[asyncio.Task] = set()
+
+    def set_backend(self, backend: LocalBackend | TcpBrokerBackend) -> None:
+        self.backend.close()
+        self.backend = backend
+        backend.start(self.handle_message)
+
+    def subscribe(self, event_type: type[ChangeEvent], handler: EventHandler) -> None:
+        """
+        Подписывает обработчик на события типа.
+        Методы объектов хранятся по слабой ссылке: подписка страницы пропадает вместе с ее сессией.
+        :param event_type: Тип события
+        :param handler: Асинхронный обработчик
+        """
+
+        reference = weakref.WeakMethod(handler) if hasattr(handler, '__self__') else (lambda: handler)
+
+        with self._lock:
+            self._handlers.setdefault(event_type, []).append(reference)
+
+    def subscribe_remote(self, event_type: type[ChangeEvent], handler: EventHandler) -> None:
+        """
+        Подписывает обработчик на события, пришедшие через брокер из других процессов.
+        Нужен для кешей процесса (кеш строк, индекс поиска), которые модули записи
+        при локальных изменениях обновляют сами.
+        Такие обработчики вызываются раньше обработчиков страниц.
+        :param event_type: Тип события
+        :param handler: Асинхронный обработчик
+        """
+
+        with self._lock:
+            self._remote_handlers.setdefault(event_type, []).append(handler)
+
+    def get_handlers(self, event_type: type[ChangeEvent]) -> list[EventHandler]:
+        with self._lock:
+            references = self._handlers.get(event_type, [])
+            handlers = [reference() for reference in references]
+            # Убираем подписки уже удаленных объектов
+            self._handlers[event_type] = [
+                reference for reference, handler in zip(references, handlers) if handler is not None
+            ]
+
+        return [handler for handler in handlers if handler is not None]
+
+    async def deliver(self, event: ChangeEvent, remote: bool = False) -> None:
+        handlers = self.get_handlers(type(event))
+        if remote:
+            with self._lock:
+                handlers = self._remote_handlers.get(type(event), []) + handlers
+
+        for handler in handlers:
+            try:
+                # Событие приходит сразу после записи: реплика могла ее еще не получить
+                with primary_reads():
+                    await handler(event)
+            except Exception:
+                logger.exception('Ошибка обработчика события %s', type(event).__name__)
+
+    def deliver_threadsafe(self, event: ChangeEvent, remote: bool = False) -> None:
+        """
+        Доставка события из другого потока или цикла событий (брокер, фоновые задачи):
+        обработчики страниц работают с БД, поэтому выполняются в цикле приложения (см. event_loop).
+        """
+
+        asyncio.run_coroutine_threadsafe(self.deliver(event, remote), settings.LOOP)
+
+    def handle_message(self, payload: bytes) -> None:
+        try:
+            event = decode_event(payload)
+        except (ValueError, KeyError):
+            logger.warning('Некорректное событие от брокера: %r', payload[:200])
+            return
+
+        self.deliver_threadsafe(event, remote=True)
+
+    async def publish(self, event: ChangeEvent) -> None:
+        """
+        Публикует событие: обработчикам процесса оно доставляется отдельной задачей в цикле приложения,
+        другим процессам уходит через бэкенд. Публикующий не ждет обработчики подписчиков.
+        :param event: Событие
+        """
+
+        if not event.ids:
+            return
+
+        if asyncio.get_running_loop() is settings.LOOP:
+            task = settings.LOOP.create_task(self.deliver(event))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+        else:
+            self.deliver_threadsafe(event)
+
+        self.backend.publish(encode_event(event))
+
+
+event_bus = EventBus()
+
+
+def get_broker_address(url: str) -> tuple[str, int]:
+    # Адрес вида tcp://127.0.0.1:8765
+    host, _, port = url.removeprefix('tcp://').rpartition(':')
+    return host, int(port)
@@ -0,0 +1,191 @@
+"""
+Отслеживание истекающих страховых полисов.
+
+Полисы выбираются по индексу date_expires с постраничной выборкой по ключу
+(date_expires, id), поэтому стоимость запроса и пометки приемов зависит
+от количества истекающих полисов, а не от размера реестра пациентов.
+"""
+import datetime
+import logging
+from typing import NamedTuple
+
+import databases
+import sqlalchemy
+
+import models
+import settings
+from models import AppointmentStatuses
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiringPolicy(NamedTuple):
+    insurance_id: int
+    insurance_number: int
+    date_expires: datetime.date
+    patient_id: int
+    first_name: str
+    last_name: str
+    surname: str | None
+    phone_number: str
+
+
+# Ключ страницы: (date_expires, insurance_id) последнего полиса предыдущей страницы
+PolicyCursor = tuple[datetime.date, int]
+
+
+def get_today() -> datetime.date:
+    return datetime.datetime.now(tz=settings.TIMEZONE).date()
+
+
+def expiring_policies_query(
+        date_from: datetime.date,
+        date_to: datetime.date,
+        after: PolicyCursor | None = None,
+        limit: int = 100,
+) -> sqlalchemy.sql.Select:
+    patients = models.Patient.ormar_config.table
+    insurances = models.Insurance.ormar_config.table
+
+    query = sqlalchemy.select(
+        insurances.c.id,
+        insurances.c.number,
+        insurances.c.date_expires,
+        patients.c.id,
+        patients.c.first_name,
+        patients.c.last_name,
+        patients.c.surname,
+        patients.c.phone_number,
+    ).select_from(
+        insurances.join(patients, patients.c.insurance == insurances.c.id)
+    ).where(
+        insurances.c.date_expires >= date_from,
+        insurances.c.date_expires <= date_to,
+    ).order_by(
+        insurances.c.date_expires,
+        insurances.c.id,
+    ).limit(limit)
+
+    if after is not None:
+        after_date, after_id = after
+        query = query.where(sqlalchemy.or_(
+            insurances.c.date_expires > after_date,
+            sqlalchemy.and_(
+                insurances.c.date_expires == after_date,
+                insurances.c.id > after_id,
+            ),
+        ))
+
+    return query
+
+
+async def get_expiring_policies(
+        days: int = settings.INSURANCE_EXPIRY_WARNING_DAYS,
+        after: PolicyCursor | None = None,
+        limit: int = 100,
+        database: databases.Database = models.database,
+) -> tuple[list[ExpiringPolicy], PolicyCursor | None]:
+    """
+    Пациенты, полис которых истекает в ближайшие N дней, по возрастанию даты окончания.
+    :param days: Через сколько дней (включительно) истекает полис
+    :param after: Ключ, возвращенный для предыдущей страницы
+    :param limit: Размер страницы
+    :param database: Подключение к БД
+    :return: страница полисов и ключ следующей страницы (None, если страница последняя)
+    """
+
+    today = get_today()
+    rows = await database.fetch_all(
+        expiring_policies_query(today, today + datetime.timedelta(days=days), after, limit)
+    )
+    policies = [ExpiringPolicy(*(row[index] for index in range(8))) for row in rows]
+
+    if len(policies) < limit:
+        return policies, None
+
+    return policies, (policies[-1].date_expires, policies[-1].insurance_id)
+
+
+async def clear_renewed_policy_flags(database: databases.Database = models.database) -> None:
+    """
+    Снимает пометку с ожидающих приемов, полис пациента которых продлен и теперь действует на дату приема.
+    Ожидающие приемы назначены не раньше сегодняшнего дня, поэтому запрос идет по индексу (date_to_come, status).
+    :param database: Подключение к БД
+    """
+
+    appointments = models.Appointment.ormar_config.table
+    patients = models.Patient.ormar_config.table
+    insurances = models.Insurance.ormar_config.table
+
+    await database.execute(
+        appointments.update()
+        .where(
+            appointments.c.patient == patients.c.id,
+            patients.c.insurance == insurances.c.id,
+            appointments.c.date_to_come >= get_today(),
+            appointments.c.status == AppointmentStatuses.IN_QUEUE,
+            appointments.c.insurance_expired == sqlalchemy.true(),
+            sqlalchemy.func.date(appointments.c.date_to_come) <= insurances.c.date_expires,
+        )
+        .values(insurance_expired=False)
+    )
+
+
+async def flag_expiring_appointments(
+        database: databases.Database = models.database,
+        days: int = settings.INSURANCE_EXPIRY_WARNING_DAYS,
+        batch_size: int = settings.INSURANCE_EXPIRY_BATCH_SIZE,
+) -> int:
+    """
+    Помечает ожидающие приемы, назначенные после окончания полиса пациента,
+    и снимает пометку с приемов, полис которых продлен.
+    Полисы читаются страницами, на каждую страницу выполняется один UPDATE.
+    :param database: Подключение к БД (у фонового планировщика - свое)
+    :param days: Через сколько дней истекает полис
+    :param batch_size: Сколько полисов обрабатывается одним запросом
+    :return: количество обработанных полисов
+    """
+
+    appointments = models.Appointment.ormar_config.table
+    patients = models.Patient.ormar_config.table
+    insurances = models.Insurance.ormar_config.table
+
+    today = get_today()
+    date_from = today - datetime.timedelta(days=settings.INSURANCE_EXPIRY_LOOKBACK_DAYS)
+    date_to = today + datetime.timedelta(days=days)
+
+    await clear_renewed_policy_flags(database)
+
+    processed = 0
+    cursor = None
+
+    while True:
+        rows = await database.fetch_all(
+            expiring_policies_query(date_from, date_to, cursor, batch_size)
+        )
+        if not rows:
+            break
+
+        await database.execute(
+            appointments.update()
+            .where(
+                appointments.c.patient == patients.c.id,
+                patients.c.insurance == insurances.c.id,
+                insurances.c.id.in_([row[0] for row in rows]),
+                appointments.c.status == AppointmentStatuses.IN_QUEUE,
+                appointments.c.insurance_expired == sqlalchemy.false(),
+                sqlalchemy.func.date(appointments.c.date_to_come) > insurances.c.date_expires,
+            )
+            .values(insurance_expired=True)
+        )
+
+        processed += len(rows)
+        if len(rows) < batch_size:
+            break
+
+        cursor = (rows[-1][2], rows[-1][0])
+
+    if processed:
+        logger.info('Проверено истекающих полисов: %d', processed)
+
+    return processed
@@ -0,0 +1,182 @@
+"""
+Пакетная загрузка связей по внешним ключам (в духе DataLoader).
+
+ID, запрошенные за один проход цикла событий, собираются вместе и загружаются
+одним запросом WHERE id IN (...). Так обход списка сущностей с обращением
+к связям стоит один запрос на модель, а не запрос на каждую строку.
+
+В режиме разработки (settings.DEBUG) детектор N+1 считает однотипные запросы
+при отрисовке страницы и предупреждает, если связи загружаются построчно.
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+from collections import Counter
+from typing import Any, Iterable
+
+import databases
+import ormar
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RelationLoader[ModelType: ormar.Model]:
+    """
+    Загрузчик сущностей одной модели по первичному ключу.
+    Загруженные сущности кешируются на время жизни загрузчика.
+    """
+
+    def __init__(self, model: type[ModelType]):
+        self.model = model
+        self._cache: dict[Any, asyncio.Future] = {}
+        self._pending: dict[Any, asyncio.Future] = {}
+
+    def load(self, pk: Any) -> asyncio.Future:
+        """
+        Запрашивает сущность по первичному ключу. Запрос к БД выполняется
+        после текущего прохода цикла событий вместе с остальными запрошенными ID.
+        :param pk: Первичный ключ
+        :return: future с сущностью (None, если сущность не найдена)
+        """
+
+        if pk in self._cache:
+            return self._cache[pk]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._cache[pk] = future
+
+        if not self._pending:
+            loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        self._pending[pk] = future
+
+        return future
+
+    async def load_many(self, pks: Iterable[Any]) -> list[ModelType | None]:
+        return list(await asyncio.gather(*(self.load(pk) for pk in pks)))
+
+    async def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+
+        try:
+            instances = await self.model.objects.filter(
+                **{f'{self.model.ormar_config.pkname}__in': list(pending)}
+            ).all()
+        except Exception as exception:
+            for pk, future in pending.items():
+                self._cache.pop(pk, None)
+                future.set_exception(exception)
+            return
+
+        by_pk = {instance.pk: instance for instance in instances}
+        for pk, future in pending.items():
+            future.set_result(by_pk.get(pk))
+
+
+class RelationLoaders:
+    """
+    Набор загрузчиков по моделям для одного прохода (отрисовки страницы, фоновой задачи).
+    """
+
+    def __init__(self):
+        self._loaders: dict[type[ormar.Model], RelationLoader] = {}
+
+    def get[ModelType: ormar.Model](self, model: type[ModelType]) -> RelationLoader[ModelType]:
+        if model not in self._loaders:
+            self._loaders[model] = RelationLoader(model)
+
+        return self._loaders[model]
+
+
+async def prefetch_related(
+        instances: list[ormar.Model],
+        fields: list[str],
+        loaders: RelationLoaders = None,
+) -> list[ormar.Model]:
+    """
+    Загружает связи по внешним ключам для списка сущностей: один запрос IN (...) на каждую связь.
+    Повторяющиеся ID загружаются один раз.
+    :param instances: Сущности одной модели
+    :param fields: Названия полей внешних ключей
+    :param loaders: Загрузчики (по умолчанию - новые на этот вызов)
+    :return: те же сущности с загруженными связями
+    """
+
+    if not instances:
+        return instances
+
+    loaders = loaders or RelationLoaders()
+    model_fields = type(instances[0]).ormar_config.model_fields
+
+    for field in fields:
+        loader = loaders.get(model_fields[field].to)
+        related_pks = [
+            related.pk if (related := getattr(instance, field)) is not None else None
+            for instance in instances
+        ]
+
+        loaded = await loader.load_many({pk for pk in related_pks if pk is not None})
+        by_pk = {instance.pk: instance for instance in loaded if instance is not None}
+
+        for instance, pk in zip(instances, related_pks):
+            if pk in by_pk:
+                setattr(instance, field, by_pk[pk])
+
+    return instances
+
+
+_query_scope: contextvars.ContextVar[Counter | None] = contextvars.ContextVar('query_scope', default=None)
+
+
+def get_query_shape(query: Any) -> str:
+    # Параметры в текст запроса не попадают, поэтому однотипные запросы дают одну строку
+    return str(query)
+
+
+@contextlib.contextmanager
+def query_scope(name: str, threshold: int = settings.N_PLUS_ONE_THRESHOLD):
+    """
+    Область подсчета запросов (например, отрисовка страницы).
+    Если детектор установлен и один и тот же запрос выполнен не меньше threshold раз, пишется предупреждение.
+    :param name: Название области для лога
+    :param threshold: Сколько однотипных запросов считать признаком N+1
+    """
+
+    counter = Counter()
+    token = _query_scope.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_scope.reset(token)
+
+        for shape, count in counter.items():
+            if count >= threshold:
+                logger.warning(
+                    'Возможен N+1 в %s: запрос выполнен %d раз: %s',
+                    name,
+                    count,
+                    ' '.join(shape.split())[:300],
+                )
+
+
+def install_n_plus_one_detector(database: databases.Database) -> None:
+    """
+    Оборачивает методы подключения к БД для подсчета запросов в областях query_scope.
+    Используется только в режиме разработки.
+    """
+
+    def wrap(method):
+        def wrapper(query, *args, **kwargs):
+            counter = _query_scope.get()
+            if counter is not None:
+                counter[get_query_shape(query)] += 1
+
+            return method(query, *args, **kwargs)
+
+        return wrapper
+
+    for method_name in ('fetch_all', 'fetch_one', 'fetch_val', 'execute', 'iterate'):
+        setattr(database, method_name, wrap(getattr(database, method_name)))
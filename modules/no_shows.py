@@ -0,0 +1,160 @@
+"""
+Перевод неявившихся пациентов в статус NOT_CAME.
+
+Просроченные приемы IN_QUEUE выбираются по индексу (date_to_come, status)
+пачками ограниченного размера; каждая пачка обновляется в своей короткой
+транзакции, поэтому таблица приемов не блокируется надолго.
+"""
+import datetime
+import logging
+import time
+
+import databases
+import sqlalchemy
+
+import models
+import settings
+from models import AppointmentStatuses
+from modules.events import event_bus, AppointmentsChanged, ChangeAction
+
+logger = logging.getLogger(__name__)
+
+
+class NoShowSweepMetrics:
+    """
+    Показатели работы задачи поиска неявившихся.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.batches = 0
+        self.total_marked = 0
+        self.last_marked = 0
+        self.last_batches = 0
+        self.last_run_at: datetime.datetime | None = None
+        self.last_duration: float | None = None
+        self.last_error: str | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            'runs': self.runs,
+            'batches': self.batches,
+            'total_marked': self.total_marked,
+            'last_marked': self.last_marked,
+            'last_batches': self.last_batches,
+            'last_run_at': self.last_run_at,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+        }
+
+
+no_show_metrics = NoShowSweepMetrics()
+
+
+def log_no_show_metrics() -> None:
+    metrics = no_show_metrics.as_dict()
+
+    logger.log(
+        logging.WARNING if metrics['last_error'] else logging.INFO,
+        'Поиск неявившихся %s: отмечено %d приемов, пачек %d, за %.1f мс%s; '
+        'всего запусков %d, пачек %d, отмечено %d',
+        metrics['last_run_at'].strftime('%d.%m.%Y %H:%M:%S'),
+        metrics['last_marked'],
+        metrics['last_batches'],
+        metrics['last_duration'] * 1000,
+        f', ошибка: {metrics["last_error"]}' if metrics['last_error'] else '',
+        metrics['runs'],
+        metrics['batches'],
+        metrics['total_marked'],
+    )
+
+
+def get_no_show_cutoff() -> datetime.datetime:
+    """
+    Приемы раньше этого времени (локальное время клиники, как в БД) считаются просроченными.
+    """
+
+    now = datetime.datetime.now(tz=settings.TIMEZONE).replace(tzinfo=None)
+    return now - datetime.timedelta(minutes=settings.NO_SHOW_GRACE_MINUTES)
+
+
+async def mark_no_show_batch(
+        database: databases.Database,
+        cutoff: datetime.datetime,
+        batch_size: int = settings.NO_SHOW_BATCH_SIZE,
+) -> int:
+    """
+    Переводит одну пачку просроченных приемов в NOT_CAME.
+    Строки, заблокированные другими сессиями, пропускаются (SKIP LOCKED) и попадут в следующий запуск.
+    :return: количество обновленных приемов
+    """
+
+    appointments = models.Appointment.ormar_config.table
+
+    async with database.transaction():
+        rows = await database.fetch_all(
+            sqlalchemy.select(appointments.c.id)
+            .where(
+                appointments.c.date_to_come < cutoff,
+                appointments.c.status == AppointmentStatuses.IN_QUEUE,
+            )
+            .order_by(appointments.c.date_to_come)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        if not rows:
+            return 0
+
+        await database.execute(
+            appointments.update()
+            .where(
+                appointments.c.id.in_([row[0] for row in rows]),
+                appointments.c.status == AppointmentStatuses.IN_QUEUE,
+            )
+            .values(status=AppointmentStatuses.NOT_CAME)
+        )
+
+    await event_bus.publish(AppointmentsChanged(ChangeAction.UPDATED, tuple(row[0] for row in rows)))
+    return len(rows)
+
+
+async def sweep_no_shows(database: databases.Database = models.database) -> int:
+    """
+    Переводит все просроченные приемы IN_QUEUE в NOT_CAME пачками.
+    :param database: Подключение к БД (у фонового планировщика - свое)
+    :return: количество обновленных приемов
+    """
+
+    started_at = time.monotonic()
+    cutoff = get_no_show_cutoff()
+    marked = 0
+    batches = 0
+
+    no_show_metrics.runs += 1
+    no_show_metrics.last_run_at = datetime.datetime.now(tz=settings.TIMEZONE)
+
+    try:
+        while True:
+            batch_marked = await mark_no_show_batch(database, cutoff)
+            if not batch_marked:
+                break
+
+            marked += batch_marked
+            batches += 1
+            no_show_metrics.batches += 1
+            no_show_metrics.total_marked += batch_marked
+
+            if batch_marked < settings.NO_SHOW_BATCH_SIZE:
+                break
+
+        no_show_metrics.last_error = None
+    except Exception as error:
+        no_show_metrics.last_error = str(error)
+        raise
+    finally:
+        no_show_metrics.last_marked = marked
+        no_show_metrics.last_batches = batches
+        no_show_metrics.last_duration = time.monotonic() - started_at
+        log_no_show_metrics()
+
+    return marked
@@ -1,74 +1,167 @@
+from contextlib import contextmanager
 from datetime import datetime, date
 
+from database_routing import replica_reads
 import models
 import serializers
 import settings
 from models import Patient, Passport, MedCard, Insurance
+from modules.duplicates import find_similar_patients
+from modules.events import event_bus, PatientsChanged, ChangeAction
+from modules.projection import fetch_projection, fetch_trusted
+from modules.row_cache import row_cache
+from modules.search import index_patient, unindex_patient
+from modules.unique_keys import unique_keys, UniqueKeysFilter, passport_key
 
+# Код ошибки MySQL: нарушение уникального ключа
+MYSQL_DUPLICATE_ENTRY_ERROR = 1062
 
-async def create_patient(patient_data: serializers.PatientFormSerializer | dict) -> Patient:
+PASSPORT_EXISTS_MESSAGE = 'Пациент с такими данными уже существует.'
+EMAIL_EXISTS_MESSAGE = 'Пациент с такой эл. почтой уже существует в базе.'
+INSURANCE_EXISTS_MESSAGE = 'Пациент с таким страховым полисом уже сущесвует в базе.'
+
+# Документы, загружаемые вместе с пациентом
+PATIENT_RELATED = [
+    'passport',
+    'med_card',
+    'insurance',
+]
+
+# Поля, отображаемые в списках пациентов (таблица пациентов, выбор пациента в формах)
+PATIENT_LIST_FIELDS = [
+    'id',
+    'first_name',
+    'last_name',
+    'surname',
+    'phone_number',
+    'passport__serial',
+    'passport__number',
+    'insurance__number',
+    'insurance__date_expires',
+    'med_card__id',
+]
+
+
+@contextmanager
+def duplicate_entry_message(message: str):
+    """
+    Заменяет ошибку уникального ключа БД сообщением для пользователя.
+    Проверки перед записью не защищают от параллельной записи тех же данных: ее отклоняет БД.
+    :param message: Сообщение
+    """
+
+    try:
+        yield
+    except Exception as error:
+        if error.args and error.args[0] == MYSQL_DUPLICATE_ENTRY_ERROR:
+            raise Exception(message) from error
+        raise
+
+
+class SimilarPatientsExist(Exception):
+    """
+    Найдены похожие пациенты (вероятные дубли). Создание можно подтвердить: create_patient(..., allow_similar=True).
+    """
+
+    def __init__(self, patient_ids: list[int]):
+        super().__init__(
+            'Похожий пациент с той же датой рождения уже существует '
+            f'(ID: {", ".join(map(str, patient_ids))}). Проверьте, не опечатка ли это.'
+        )
+        self.patient_ids = patient_ids
+
+
+async def create_patient(
+        patient_data: serializers.PatientFormSerializer | dict,
+        allow_similar: bool = False,
+) -> Patient:
     """
     Метод для создания пациента в системе со всеми привязанными документами.
     :param patient_data: Данные пациента
+    :param allow_similar: Создать пациента, даже если найден похожий (вероятный дубль)
     :return: сущность пациента
+    :raises SimilarPatientsExist: найден похожий пациент и создание не подтверждено
     """
 
-    patient = await Patient.objects.get_or_none(
-        first_name=patient_data.first_name,
-        last_name=patient_data.last_name,
-        surname=patient_data.surname,
-        passport__serial=patient_data.passport.serial,
-        passport__number=patient_data.passport.number,
-    )
-
-    if patient:
+    if patient_data.insurance.date_expires < date.today():
         raise Exception(
-            'Пациент с такими данными уже существует.'
+            "Страховой полис клиента уже просрочен."
         )
 
-    passport = await Passport.objects.create(
+    # Запрос на существование выполняется, только если фильтр не дал точного ответа "нет"
+    if unique_keys.might_exist(
+        UniqueKeysFilter.PASSPORT,
+        passport_key(patient_data.passport.serial, patient_data.passport.number),
+    ) and await Passport.objects.filter(
         serial=patient_data.passport.serial,
         number=patient_data.passport.number,
-        issued_date=patient_data.passport.issued_date,
+    ).exists():
+        raise Exception(PASSPORT_EXISTS_MESSAGE)
+
+    if unique_keys.might_exist(
+        UniqueKeysFilter.EMAIL,
+        patient_data.email,
+    ) and await Patient.objects.filter(email=patient_data.email).exists():
+        raise Exception(EMAIL_EXISTS_MESSAGE)
+
+    if unique_keys.might_exist(
+        UniqueKeysFilter.INSURANCE,
+        patient_data.insurance.number,
+    ) and await Insurance.objects.filter(number=patient_data.insurance.number).exists():
+        raise Exception(INSURANCE_EXISTS_MESSAGE)
+
+    similar_patients = [] if allow_similar else await find_similar_patients(
+        first_name=patient_data.first_name,
+        last_name=patient_data.last_name,
+        surname=patient_data.surname,
         date_of_birth=patient_data.passport.date_of_birth,
-        gender=patient_data.passport.gender,
-        issued_by=patient_data.passport.issued_by,
-        address=patient_data.passport.address,
     )
 
-    insurance, is_created = await Insurance.objects.get_or_create(
-        number=patient_data.insurance.number,
-        _defaults={
-            'date_of_issue': patient_data.insurance.date_of_issue,
-            'date_expires': patient_data.insurance.date_expires,
-        }
-    )
+    if similar_patients:
+        raise SimilarPatientsExist(similar_patients)
 
-    if not is_created:
-        raise Exception(
-            "Пациент с таким страховым полисом уже сущесвует в базе."
-        )
+    async with models.database.transaction():
+        with duplicate_entry_message(PASSPORT_EXISTS_MESSAGE):
+            passport = await Passport.objects.create(
+                serial=patient_data.passport.serial,
+                number=patient_data.passport.number,
+                issued_date=patient_data.passport.issued_date,
+                date_of_birth=patient_data.passport.date_of_birth,
+                gender=patient_data.passport.gender,
+                issued_by=patient_data.passport.issued_by,
+                address=patient_data.passport.address,
+            )
 
-    elif insurance.date_expires < date.today():
-        raise Exception(
-            "Страховой полис клиента уже просрочен."
+        with duplicate_entry_message(INSURANCE_EXISTS_MESSAGE):
+            insurance = await Insurance.objects.create(
+                number=patient_data.insurance.number,
+                date_of_issue=patient_data.insurance.date_of_issue,
+                date_expires=patient_data.insurance.date_expires,
+            )
+
+        med_card = await MedCard.objects.create(
+            date_of_issue=date.today()
         )
 
-    med_card = await MedCard.objects.create(
-        date_of_issue=date.today()
-    )
+        # Единственный уникальный столбец пациентов (кроме ID) - эл. почта
+        with duplicate_entry_message(EMAIL_EXISTS_MESSAGE):
+            patient = await Patient.objects.create(
+                first_name=patient_data.first_name,
+                last_name=patient_data.last_name,
+                surname=patient_data.surname,
+                phone_number=patient_data.phone_number,
+                email=patient_data.email,
+                insurance=insurance,
+                passport=passport,
+                med_card=med_card,
+                photo_url='',
+            )
 
-    patient = await Patient.objects.create(
-        first_name=patient_data.first_name,
-        last_name=patient_data.last_name,
-        surname=patient_data.surname,
-        phone_number=patient_data.phone_number,
-        email=patient_data.email,
-        insurance=insurance,
-        passport=passport,
-        med_card=med_card,
-        photo_url='',
-    )
+    unique_keys.register(UniqueKeysFilter.PASSPORT, passport_key(passport.serial, passport.number))
+    unique_keys.register(UniqueKeysFilter.EMAIL, patient.email)
+    unique_keys.register(UniqueKeysFilter.INSURANCE, insurance.number)
+    index_patient(patient)
+    await event_bus.publish(PatientsChanged(ChangeAction.CREATED, (patient.id,)))
 
     return patient
 
@@ -86,23 +179,155 @@ async def update_patient_bio(patient: models.Patient, data: serializers.PatientF
         exclude_defaults=True,
     )
 
-    await patient.update(
-        **patient_data_decoded
-    )
+    with duplicate_entry_message(EMAIL_EXISTS_MESSAGE):
+        await patient.update(
+            **patient_data_decoded
+        )
+    row_cache.invalidate(Patient, patient.id)
+    index_patient(await load_patient_documents(patient))
+    await event_bus.publish(PatientsChanged(ChangeAction.UPDATED, (patient.id,)))
 
     return patient
 
 
 async def remove_patient(patient: models.Patient) -> bool:
+    patient_id = patient.id
     await patient.delete()
+    row_cache.invalidate(Patient, patient_id)
+    unindex_patient(patient_id)
+    await event_bus.publish(PatientsChanged(ChangeAction.DELETED, (patient_id,)))
     return True
 
 
-async def get_patients() -> list[Patient]:
-    return await models.Patient.objects.select_related([
-        'passport',
-        'med_card',
-        'insurance',
-    ]).all()
+@replica_reads
+async def get_patients(trusted: bool = False) -> list[Patient]:
+    """
+    Список пациентов со всеми документами.
+    :param trusted: Собрать сущности без повторной валидации строк БД
+    :return: список пациентов
+    """
+
+    queryset = models.Patient.objects.select_related(PATIENT_RELATED)
+    if trusted:
+        return await fetch_trusted(Patient, queryset, PATIENT_RELATED)
+
+    return await queryset.all()
+
+
+@replica_reads
+async def get_patients_list(ids: list[int] = None) -> list[Patient]:
+    """
+    Список пациентов для таблиц: выбираются только отображаемые поля,
+    документы пациента загружаются частично.
+    :param ids: ID пациентов (по умолчанию - все пациенты)
+    :return: список частично загруженных пациентов
+    """
+
+    queryset = Patient.objects.select_related(PATIENT_RELATED)
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+
+    return await fetch_projection(
+        Patient,
+        queryset,
+        PATIENT_LIST_FIELDS,
+    )
+
+
+async def get_patients_by_ids(ids: list[int]) -> list[Patient]:
+    """
+    Пациенты со всеми документами из общего кеша строк.
+    Отсутствующие в кеше пациенты загружаются одним запросом и кладутся в кеш.
+    Возвращаемые сущности общие для всех сессий: изменять их можно только через этот модуль.
+    :param ids: ID пациентов
+    :return: найденные пациенты в порядке ids
+    """
+
+    patients: dict[int, Patient] = {}
+    missing: dict[int, tuple[int, int]] = {}
+
+    for patient_id in dict.fromkeys(ids):
+        patient = row_cache.get(Patient, patient_id)
+        if patient is not None:
+            patients[patient_id] = patient
+        else:
+            missing[patient_id] = row_cache.get_version(Patient, patient_id)
+
+    if missing:
+        loaded = await Patient.objects.select_related(PATIENT_RELATED).filter(
+            id__in=list(missing),
+        ).all()
+
+        for patient in loaded:
+            row_cache.put(patient, missing[patient.id])
+            patients[patient.id] = patient
+
+    return [patients[patient_id] for patient_id in ids if patient_id in patients]
+
+
+async def get_patient(patient_id: int) -> Patient | None:
+    """
+    Пациент со всеми документами из общего кеша строк.
+    :param patient_id: ID пациента
+    :return: пациент или None, если он не найден
+    """
+
+    patients = await get_patients_by_ids([patient_id])
+    return patients[0] if patients else None
+
+
+async def load_patient_documents(patient: models.Patient) -> Patient:
+    """
+    Догружает паспорт, страховой полис и мед. карту пациента одним запросом,
+    если они еще не были загружены. Обратные связи (приемы пациента) не загружаются.
+    :param patient: Пациент
+    :return: пациент с загруженными документами
+    """
+
+    if patient.passport.address is None or patient.insurance.date_of_issue is None:
+        patient = await Patient.objects.select_related(PATIENT_RELATED).get(id=patient.id)
+
+    return patient
+
+
+async def find_patients_by_phone(phone_number: str) -> list[Patient]:
+    """
+    Поиск пациентов по номеру входящего звонка: один проход по индексу phone_key.
+    :param phone_number: Номер телефона в любом формате
+    :return: пациенты с этим номером (номер может быть общим, например, у членов семьи)
+    """
+
+    phone_key = models.normalize_phone(phone_number)
+    if not phone_key:
+        return []
+
+    return await Patient.objects.select_related(PATIENT_RELATED).filter(
+        phone_key=phone_key,
+    ).all()
+
+
+async def handle_remote_patients_changed(event: PatientsChanged) -> None:
+    """
+    Обновляет кеш строк, индекс поиска и фильтр уникальных ключей процесса
+    после изменения пациентов в другом процессе.
+    :param event: Событие от брокера
+    """
+
+    for patient_id in event.ids:
+        row_cache.invalidate(Patient, patient_id)
+
+    if event.action == ChangeAction.DELETED:
+        for patient_id in event.ids:
+            unindex_patient(patient_id)
+        return
+
+    for patient in await get_patients_by_ids(list(event.ids)):
+        index_patient(patient)
+
+        if event.action == ChangeAction.CREATED:
+            unique_keys.register(UniqueKeysFilter.PASSPORT, passport_key(patient.passport.serial, patient.passport.number))
+            unique_keys.register(UniqueKeysFilter.EMAIL, patient.email)
+            unique_keys.register(UniqueKeysFilter.INSURANCE, patient.insurance.number)
 
 
+event_bus.subscribe_remote(PatientsChanged, handle_remote_patients_changed)
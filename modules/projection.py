@@ -0,0 +1,95 @@
+from collections import defaultdict
+from typing import Any
+
+import ormar
+
+
+def hydrate_projection[ModelType: ormar.Model](model: type[ModelType], row: dict[str, Any]) -> ModelType:
+    """
+    Собирает частично загруженную сущность из строки проекции.
+    Поля связанных сущностей передаются в виде `relation__field`.
+    Строки берутся из нашей БД, поэтому сущности создаются без повторной валидации
+    (иначе невыбранные обязательные поля не прошли бы ее).
+    :param model: Класс сущности
+    :param row: Строка проекции
+    :return: частично загруженная сущность
+    """
+
+    values = {}
+    related_values = defaultdict(dict)
+
+    for key, value in row.items():
+        name, _, related_key = key.partition('__')
+        if related_key:
+            related_values[name][related_key] = value
+        else:
+            values[name] = value
+
+    for name, related_row in related_values.items():
+        related_model = model.ormar_config.model_fields[name].to
+        values[name] = hydrate_projection(related_model, related_row)
+
+    return model.model_construct(**values)
+
+
+async def fetch_projection[ModelType: ormar.Model](
+        model: type[ModelType],
+        queryset: ormar.QuerySet,
+        fields: list[str],
+) -> list[ModelType]:
+    """
+    Выполняет запрос, выбирая из БД только указанные поля, включая поля связанных сущностей.
+    :param model: Класс сущности запроса
+    :param queryset: Запрос
+    :param fields: Поля проекции (`field` или `relation__field`)
+    :return: список частично загруженных сущностей
+    """
+
+    rows = await queryset.values(fields)
+    return [hydrate_projection(model, row) for row in rows]
+
+
+def get_model_fields(model: type[ormar.Model], related: list[str] = None) -> list[str]:
+    """
+    Все поля сущности в виде полей проекции, включая поля выбранных связанных сущностей.
+    Для невыбранных связей в проекцию попадает только внешний ключ.
+    :param model: Класс сущности
+    :param related: Выбранные связи (как в select_related)
+    :return: поля проекции
+    """
+
+    related = related or []
+    fields = []
+
+    for name, field in model.ormar_config.model_fields.items():
+        if field.virtual or field.is_multi:
+            continue
+
+        if field.is_relation and name in related:
+            fields.extend(
+                f'{name}__{related_field}'
+                for related_field in get_model_fields(field.to)
+                if '__' not in related_field
+            )
+            continue
+
+        fields.append(name)
+
+    return fields
+
+
+async def fetch_trusted[ModelType: ormar.Model](
+        model: type[ModelType],
+        queryset: ormar.QuerySet,
+        related: list[str] = None,
+) -> list[ModelType]:
+    """
+    Доверенная загрузка: строки нашей БД уже прошли валидацию при записи,
+    поэтому сущности собираются без повторного запуска валидаторов полей.
+    :param model: Класс сущности запроса
+    :param queryset: Запрос (с уже примененными select_related и фильтрами)
+    :param related: Выбранные связи запроса
+    :return: список полностью загруженных сущностей
+    """
+
+    return await fetch_projection(model, queryset, get_model_fields(model, related))
@@ -0,0 +1,339 @@
+"""
+Облегченные модели чтения для таблиц.
+Запросы выполняются через SQLAlchemy Core, а строки превращаются в компактные
+именованные кортежи без валидации и менеджеров связей ormar.
+Записи предназначены только для отображения.
+"""
+import datetime
+import heapq
+from typing import NamedTuple
+
+import sqlalchemy
+
+from database_routing import replica_reads
+import models
+from models import AppointmentStatuses
+from modules.archive import ARCHIVED_STATUSES, get_archive_months_range
+from modules.scheduling import to_local_naive
+
+
+class DiagnosisRecord(NamedTuple):
+    id: int
+    name: str
+
+
+class PatientShortRecord(NamedTuple):
+    id: int
+    first_name: str
+    last_name: str
+    surname: str | None
+
+
+class PassportShortRecord(NamedTuple):
+    serial: int
+    number: int
+
+
+class InsuranceShortRecord(NamedTuple):
+    number: int
+    date_expires: datetime.date
+
+
+class MedCardShortRecord(NamedTuple):
+    id: int
+
+
+class PatientRecord(NamedTuple):
+    id: int
+    first_name: str
+    last_name: str
+    surname: str | None
+    phone_number: str
+    passport: PassportShortRecord
+    insurance: InsuranceShortRecord
+    med_card: MedCardShortRecord
+
+
+class AppointmentRecord(NamedTuple):
+    id: int
+    date_created: datetime.datetime
+    date_to_come: datetime.datetime
+    status: AppointmentStatuses
+    patient: PatientShortRecord
+    diagnosis: DiagnosisRecord | None
+    insurance_expired: bool = False
+
+
+def appointments_records_query(
+        statuses: list[AppointmentStatuses] = None,
+        date_from: datetime.datetime = None,
+        date_to: datetime.datetime = None,
+        archive: bool = False,
+) -> sqlalchemy.sql.Select:
+    """
+    Запрос приемов для таблиц.
+    :param archive: Читать архив закрытых приемов вместо основной таблицы
+    """
+
+    appointments = (models.ArchivedAppointment if archive else models.Appointment).ormar_config.table
+    patients = models.Patient.ormar_config.table
+    diagnoses = models.Diagnosis.ormar_config.table
+
+    query = sqlalchemy.select(
+        appointments.c.id,
+        appointments.c.date_created,
+        appointments.c.date_to_come,
+        appointments.c.status,
+        patients.c.id,
+        patients.c.first_name,
+        patients.c.last_name,
+        patients.c.surname,
+        diagnoses.c.id,
+        diagnoses.c.name,
+        # В архиве закрытые приемы, пометка об истекшем полисе там не нужна
+        sqlalchemy.false() if archive else appointments.c.insurance_expired,
+    ).select_from(
+        appointments
+        .join(patients, appointments.c.patient == patients.c.id)
+        .outerjoin(diagnoses, appointments.c.diagnosis == diagnoses.c.id)
+    ).order_by(appointments.c.id)
+
+    if statuses:
+        query = query.where(appointments.c.status.in_(statuses))
+
+    if date_from is not None:
+        query = query.where(appointments.c.date_to_come >= date_from)
+
+    if date_to is not None:
+        query = query.where(appointments.c.date_to_come < date_to)
+
+    if archive:
+        months_range = get_archive_months_range(date_from, date_to)
+        if months_range is not None:
+            query = query.where(months_range)
+
+    return query
+
+
+def patients_records_query() -> sqlalchemy.sql.Select:
+    patients = models.Patient.ormar_config.table
+    passports = models.Passport.ormar_config.table
+    insurances = models.Insurance.ormar_config.table
+
+    return sqlalchemy.select(
+        patients.c.id,
+        patients.c.first_name,
+        patients.c.last_name,
+        patients.c.surname,
+        patients.c.phone_number,
+        passports.c.serial,
+        passports.c.number,
+        insurances.c.number,
+        insurances.c.date_expires,
+        patients.c.med_card,
+    ).select_from(
+        patients
+        .join(passports, patients.c.passport == passports.c.id)
+        .join(insurances, patients.c.insurance == insurances.c.id)
+    ).order_by(patients.c.id)
+
+
+def _row_values(row, size: int) -> tuple:
+    # Позиционный доступ к Record применяет преобразования типов столбцов (Enum, DateTime)
+    return tuple(row[index] for index in range(size))
+
+
+def to_appointment_record(row: tuple) -> AppointmentRecord:
+    (
+        id_, date_created, date_to_come, status,
+        patient_id, first_name, last_name, surname,
+        diagnosis_id, diagnosis_name,
+        insurance_expired,
+    ) = row
+
+    return AppointmentRecord(
+        id_,
+        date_created,
+        date_to_come,
+        status,
+        PatientShortRecord(patient_id, first_name, last_name, surname),
+        DiagnosisRecord(diagnosis_id, diagnosis_name) if diagnosis_id is not None else None,
+        bool(insurance_expired),
+    )
+
+
+def to_patient_record(row: tuple) -> PatientRecord:
+    (
+        id_, first_name, last_name, surname, phone_number,
+        passport_serial, passport_number,
+        insurance_number, insurance_date_expires,
+        med_card_id,
+    ) = row
+
+    return PatientRecord(
+        id_,
+        first_name,
+        last_name,
+        surname,
+        phone_number,
+        PassportShortRecord(passport_serial, passport_number),
+        InsuranceShortRecord(insurance_number, insurance_date_expires),
+        MedCardShortRecord(med_card_id),
+    )
+
+
+@replica_reads
+async def get_appointment_records(
+        statuses: list[AppointmentStatuses] = None,
+        include_archive: bool = False,
+) -> list[AppointmentRecord]:
+    """
+    Приемы для таблиц в виде записей только для чтения.
+    :param statuses: Статусы приемов (по умолчанию - все)
+    :param include_archive: Добавить приемы из архива
+    :return: список записей приемов
+    """
+
+    rows = await models.database.fetch_all(
+        appointments_records_query(statuses)
+    )
+    records = [to_appointment_record(_row_values(row, 11)) for row in rows]
+
+    if not include_archive or (statuses and not set(statuses) & set(ARCHIVED_STATUSES)):
+        return records
+
+    archived_rows = await models.database.fetch_all(
+        appointments_records_query(statuses, archive=True)
+    )
+    # Обе выборки отсортированы по ID, а ID в архиве совпадают с исходными
+    return list(heapq.merge(
+        records,
+        (to_appointment_record(_row_values(row, 11)) for row in archived_rows),
+        key=lambda record: record.id,
+    ))
+
+
+async def get_appointment_records_by_ids(ids: list[int]) -> list[AppointmentRecord]:
+    """
+    Приемы с указанными ID (например, измененные в другой сессии).
+    :param ids: ID приемов
+    :return: найденные записи приемов
+    """
+
+    appointments = models.Appointment.ormar_config.table
+    rows = await models.database.fetch_all(
+        appointments_records_query().where(appointments.c.id.in_(ids))
+    )
+    return [to_appointment_record(_row_values(row, 11)) for row in rows]
+
+
+@replica_reads
+async def get_appointment_records_in_range(
+        date_from: datetime.datetime,
+        date_to: datetime.datetime,
+        statuses: list[AppointmentStatuses] = None,
+) -> list[AppointmentRecord]:
+    """
+    Приемы с датой посещения в полуинтервале [date_from, date_to), по возрастанию даты.
+    Запрос идет по индексу (date_to_come, status).
+    :param date_from: Начало периода (время с часовым поясом или локальное время клиники)
+    :param date_to: Конец периода, не включая
+    :param statuses: Статусы приемов (по умолчанию - все)
+    :return: список записей приемов
+    """
+
+    query = appointments_records_query(
+        statuses,
+        date_from=to_local_naive(date_from),
+        date_to=to_local_naive(date_to),
+    ).order_by(None).order_by(
+        models.Appointment.ormar_config.table.c.date_to_come,
+    )
+
+    rows = await models.database.fetch_all(query)
+    return [to_appointment_record(_row_values(row, 11)) for row in rows]
+
+
+# Ключ страницы истории: (date_to_come, id) последнего приема предыдущей страницы
+HistoryCursor = tuple[datetime.datetime, int]
+
+
+def patient_history_query(
+        patient_id: int,
+        before: HistoryCursor | None,
+        limit: int,
+        archive: bool = False,
+) -> sqlalchemy.sql.Select:
+    appointments = (models.ArchivedAppointment if archive else models.Appointment).ormar_config.table
+
+    query = appointments_records_query(archive=archive).where(
+        appointments.c.patient == patient_id,
+    ).order_by(None).order_by(
+        appointments.c.date_to_come.desc(),
+        appointments.c.id.desc(),
+    ).limit(limit)
+
+    if before is not None:
+        before_date, before_id = before
+        query = query.where(sqlalchemy.or_(
+            appointments.c.date_to_come < before_date,
+            sqlalchemy.and_(
+                appointments.c.date_to_come == before_date,
+                appointments.c.id < before_id,
+            ),
+        ))
+
+    return query
+
+
+@replica_reads
+async def get_patient_history(
+        patient_id: int,
+        before: HistoryCursor | None = None,
+        limit: int = 20,
+        include_archive: bool = False,
+) -> tuple[list[AppointmentRecord], HistoryCursor | None]:
+    """
+    Страница истории приемов пациента, от новых к старым.
+    Запрос идет по индексу (patient, date_to_come), диагнозы читаются тем же запросом.
+    :param patient_id: ID пациента
+    :param before: Ключ, возвращенный для предыдущей страницы
+    :param limit: Размер страницы
+    :param include_archive: Добавить приемы из архива
+    :return: страница приемов и ключ следующей страницы (None, если страница последняя)
+    """
+
+    rows = await models.database.fetch_all(
+        patient_history_query(patient_id, before, limit)
+    )
+    records = [to_appointment_record(_row_values(row, 11)) for row in rows]
+
+    if include_archive:
+        archived_rows = await models.database.fetch_all(
+            patient_history_query(patient_id, before, limit, archive=True)
+        )
+        # Из двух отсортированных страниц берем общую страницу нужного размера
+        records = list(heapq.merge(
+            records,
+            (to_appointment_record(_row_values(row, 11)) for row in archived_rows),
+            key=lambda record: (record.date_to_come, record.id),
+            reverse=True,
+        ))[:limit]
+
+    if len(records) < limit:
+        return records, None
+
+    return records, (records[-1].date_to_come, records[-1].id)
+
+
+@replica_reads
+async def get_patient_records() -> list[PatientRecord]:
+    """
+    Пациенты для таблиц и выпадающих списков в виде записей только для чтения.
+    :return: список записей пациентов
+    """
+
+    rows = await models.database.fetch_all(
+        patients_records_query()
+    )
+    return [to_patient_record(_row_values(row, 10)) for row in rows]
@@ -0,0 +1,371 @@
+"""
+Рассылка напоминаний о приемах на завтра.
+
+Приемы IN_QUEUE читаются из БД порциями по ключу (id), поэтому память
+не зависит от количества приемов. Сообщения отправляются через подключаемые
+транспорты (email, sms) с ограничением одновременных отправок и повторами
+с нарастающей паузой, а результат записывается одной вставкой на порцию.
+
+Для проверки без настоящей почты достаточно локального SMTP-сервера:
+python -m aiosmtpd -n -l localhost:1025
+"""
+import abc
+import asyncio
+import datetime
+import logging
+import queue
+import smtplib
+import time
+from email.message import EmailMessage
+from typing import NamedTuple
+
+import databases
+import sqlalchemy
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+import models
+import settings
+from models import AppointmentStatuses, ReminderStatuses
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderRecipient(NamedTuple):
+    appointment_id: int
+    date_to_come: datetime.datetime
+    first_name: str
+    last_name: str
+    surname: str | None
+    email: str | None
+    phone_number: str | None
+
+
+class ReminderMessage(NamedTuple):
+    appointment_id: int
+    recipient: str
+    subject: str
+    text: str
+
+
+class DeliveryResult(NamedTuple):
+    appointment_id: int
+    channel: str
+    status: ReminderStatuses
+    attempts: int
+    error: str | None
+
+
+class DispatchStats(NamedTuple):
+    appointments: int
+    sent: int
+    failed: int
+    duration: float
+
+
+class ReminderTransport(abc.ABC):
+    """
+    Базовый транспорт напоминаний.
+    """
+
+    channel: str
+
+    @abc.abstractmethod
+    def get_recipient(self, recipient: ReminderRecipient) -> str | None:
+        """
+        Адрес получателя в канале транспорта или None, если адреса нет.
+        """
+
+    @abc.abstractmethod
+    async def send(self, message: ReminderMessage) -> None:
+        """
+        Отправляет сообщение. Ошибка отправки - исключение.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class SmtpTransport(ReminderTransport):
+    """
+    Отправка по email. smtplib блокирующий, поэтому письма отправляются в потоках,
+    а SMTP-соединения переиспользуются между письмами.
+    """
+
+    channel = 'email'
+
+    def __init__(
+            self,
+            host: str = settings.SMTP_HOST,
+            port: int = settings.SMTP_PORT,
+            sender: str = settings.SMTP_SENDER,
+            timeout: float = 10,
+    ):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+        self._connections: queue.SimpleQueue[smtplib.SMTP] = queue.SimpleQueue()
+
+    def get_recipient(self, recipient: ReminderRecipient) -> str | None:
+        return recipient.email
+
+    def _send(self, message: ReminderMessage) -> None:
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = message.recipient
+        email['Subject'] = message.subject
+        email.set_content(message.text)
+
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        try:
+            connection.send_message(email)
+        except Exception:
+            connection.close()
+            raise
+
+        self._connections.put(connection)
+
+    async def send(self, message: ReminderMessage) -> None:
+        await asyncio.to_thread(self._send, message)
+
+    def close(self) -> None:
+        while True:
+            try:
+                connection = self._connections.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                connection.quit()
+            except smtplib.SMTPException:
+                connection.close()
+
+
+class LoggingSmsTransport(ReminderTransport):
+    """
+    Заглушка SMS-шлюза: сообщения пишутся в лог. Заменяется транспортом конкретного шлюза.
+    """
+
+    channel = 'sms'
+
+    def get_recipient(self, recipient: ReminderRecipient) -> str | None:
+        return models.normalize_phone(recipient.phone_number)
+
+    async def send(self, message: ReminderMessage) -> None:
+        logger.info('SMS на %s: %s', message.recipient, message.text)
+
+
+def get_default_transports() -> list[ReminderTransport]:
+    return [SmtpTransport(), LoggingSmsTransport()]
+
+
+def make_reminder_message(recipient: ReminderRecipient, address: str) -> ReminderMessage:
+    return ReminderMessage(
+        recipient.appointment_id,
+        address,
+        'Напоминание о приеме',
+        f'{recipient.first_name} {recipient.surname or ""}, напоминаем, что вы записаны на прием '
+        f'{recipient.date_to_come.strftime("%d.%m.%Y в %H:%M")}. Клиника Саныча.',
+    )
+
+
+def reminders_query(
+        date_from: datetime.datetime,
+        date_to: datetime.datetime,
+        after_id: int,
+        limit: int,
+) -> sqlalchemy.sql.Select:
+    appointments = models.Appointment.ormar_config.table
+    patients = models.Patient.ormar_config.table
+
+    return sqlalchemy.select(
+        appointments.c.id,
+        appointments.c.date_to_come,
+        patients.c.first_name,
+        patients.c.last_name,
+        patients.c.surname,
+        patients.c.email,
+        patients.c.phone_number,
+    ).select_from(
+        appointments.join(patients, appointments.c.patient == patients.c.id)
+    ).where(
+        appointments.c.date_to_come >= date_from,
+        appointments.c.date_to_come < date_to,
+        appointments.c.status == AppointmentStatuses.IN_QUEUE,
+        appointments.c.id > after_id,
+    ).order_by(appointments.c.id).limit(limit)
+
+
+class ReminderDispatcher:
+    def __init__(
+            self,
+            transports: list[ReminderTransport],
+            concurrency: int = settings.REMINDER_CONCURRENCY,
+            chunk_size: int = settings.REMINDER_CHUNK_SIZE,
+            max_attempts: int = settings.REMINDER_MAX_ATTEMPTS,
+            retry_backoff: float = settings.REMINDER_RETRY_BACKOFF,
+    ):
+        self.transports = transports
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+
+    async def send_with_retry(
+            self,
+            transport: ReminderTransport,
+            message: ReminderMessage,
+            semaphore: asyncio.Semaphore,
+    ) -> DeliveryResult:
+        error = None
+
+        for attempt in range(1, self.max_attempts + 1):
+            async with semaphore:
+                try:
+                    await transport.send(message)
+                    return DeliveryResult(
+                        message.appointment_id, transport.channel, ReminderStatuses.SENT, attempt, None,
+                    )
+                except Exception as exception:
+                    error = str(exception)[:255]
+
+            # Пауза вне семафора, чтобы не занимать место других отправок
+            if attempt < self.max_attempts:
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+        return DeliveryResult(
+            message.appointment_id, transport.channel, ReminderStatuses.FAILED, self.max_attempts, error,
+        )
+
+    async def get_finished(self, database: databases.Database, appointment_ids: list[int]) -> set[tuple[int, str]]:
+        """
+        Напоминания, которые больше не отправляются: доставленные и те, на которые потрачены все попытки.
+        :return: пары (ID приема, канал)
+        """
+
+        reminders = models.AppointmentReminder.ormar_config.table
+        rows = await database.fetch_all(
+            sqlalchemy.select(reminders.c.appointment, reminders.c.channel).where(
+                reminders.c.appointment.in_(appointment_ids),
+                sqlalchemy.or_(
+                    reminders.c.status == ReminderStatuses.SENT,
+                    sqlalchemy.and_(
+                        reminders.c.status == ReminderStatuses.FAILED,
+                        reminders.c.attempts >= self.max_attempts,
+                    ),
+                ),
+            )
+        )
+        return {(row[0], row[1]) for row in rows}
+
+    @staticmethod
+    async def save_results(database: databases.Database, results: list[DeliveryResult]) -> None:
+        """
+        Записывает состояние доставки одной вставкой (INSERT ... ON DUPLICATE KEY UPDATE).
+        """
+
+        if not results:
+            return
+
+        reminders = models.AppointmentReminder.ormar_config.table
+        date_updated = models.get_current_date()
+
+        query = mysql_insert(reminders).values([
+            {
+                'appointment': result.appointment_id,
+                'channel': result.channel,
+                'status': result.status,
+                'attempts': result.attempts,
+                'date_updated': date_updated,
+                'error': result.error,
+            }
+            for result in results
+        ])
+        query = query.on_duplicate_key_update(
+            status=query.inserted.status,
+            attempts=reminders.c.attempts + query.inserted.attempts,
+            date_updated=query.inserted.date_updated,
+            error=query.inserted.error,
+        )
+        await database.execute(query)
+
+    async def dispatch(self, day: datetime.date, database: databases.Database = models.database) -> DispatchStats:
+        """
+        Отправляет напоминания о приемах дня. Уже доставленные напоминания и напоминания,
+        на которые потрачены все попытки, не повторяются, поэтому рассылку можно запускать несколько раз за день.
+        :param day: День приемов
+        :param database: Подключение к БД
+        :return: статистика рассылки
+        """
+
+        started_at = time.monotonic()
+        date_from = datetime.datetime.combine(day, datetime.time.min)
+        date_to = date_from + datetime.timedelta(days=1)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        appointments_count = sent = failed = 0
+        after_id = 0
+
+        try:
+            while True:
+                rows = await database.fetch_all(reminders_query(date_from, date_to, after_id, self.chunk_size))
+                if not rows:
+                    break
+
+                recipients = [ReminderRecipient(*(row[index] for index in range(7))) for row in rows]
+                after_id = recipients[-1].appointment_id
+                appointments_count += len(recipients)
+
+                finished = await self.get_finished(database, [recipient.appointment_id for recipient in recipients])
+                sending = []
+                for recipient in recipients:
+                    for transport in self.transports:
+                        address = transport.get_recipient(recipient)
+                        if not address or (recipient.appointment_id, transport.channel) in finished:
+                            continue
+
+                        sending.append(self.send_with_retry(
+                            transport,
+                            make_reminder_message(recipient, address),
+                            semaphore,
+                        ))
+
+                results = await asyncio.gather(*sending)
+                await self.save_results(database, results)
+
+                sent += sum(result.status == ReminderStatuses.SENT for result in results)
+                failed += sum(result.status == ReminderStatuses.FAILED for result in results)
+
+                if len(rows) < self.chunk_size:
+                    break
+        finally:
+            for transport in self.transports:
+                transport.close()
+
+        return DispatchStats(appointments_count, sent, failed, time.monotonic() - started_at)
+
+
+async def send_appointment_reminders(database: databases.Database = models.database) -> DispatchStats:
+    """
+    Рассылка напоминаний о приемах на завтра (фоновая задача).
+    :param database: Подключение к БД (у фонового планировщика - свое)
+    :return: статистика рассылки
+    """
+
+    tomorrow = datetime.datetime.now(tz=settings.TIMEZONE).date() + datetime.timedelta(days=1)
+    stats = await ReminderDispatcher(get_default_transports()).dispatch(tomorrow, database)
+
+    if stats.sent or stats.failed:
+        logger.info(
+            'Напоминания на %s: отправлено %d, с ошибкой %d (за %.1f с)',
+            tomorrow.strftime('%d.%m.%Y'),
+            stats.sent,
+            stats.failed,
+            stats.duration,
+        )
+
+    return stats
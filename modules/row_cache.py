@@ -0,0 +1,118 @@
+"""
+Общий для всех сессий процесса кеш строк (identity map) по первичному ключу.
+
+Для каждого ключа хранится версия: она увеличивается при каждой инвалидации,
+поэтому загрузка, начатая до записи, не может положить в кеш устаревшую сущность.
+Объем кеша ограничен оценкой занимаемой памяти, вытесняются давно не использованные строки.
+Сущности из кеша общие для всех сессий, изменять их можно только через модули записи.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import ormar
+
+import settings
+
+# Оценка накладных расходов Python на одно поле сущности (в байтах)
+FIELD_OVERHEAD = 64
+
+# Версия строки: (поколение кеша, номер изменения строки)
+Version = tuple[int, int]
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Приблизительный объем памяти, занимаемый данными сущности.
+    """
+
+    if isinstance(value, dict):
+        return sum(FIELD_OVERHEAD + estimate_size(item) for item in value.values())
+
+    if isinstance(value, (list, tuple, set)):
+        return sum(FIELD_OVERHEAD + estimate_size(item) for item in value)
+
+    if value is None:
+        return 0
+
+    return len(value) if isinstance(value, (str, bytes)) else len(str(value))
+
+
+class RowCache:
+    def __init__(self, max_bytes: int = settings.ROW_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # (модель, ключ) -> (версия, сущность, объем)
+        self._rows: OrderedDict[tuple[str, Any], tuple[Version, ormar.Model, int]] = OrderedDict()
+        self._versions: dict[tuple[str, Any], int] = {}
+        # Увеличивается при полной очистке, чтобы устарели версии всех строк
+        self._generation = 0
+
+    @staticmethod
+    def make_key(model: type[ormar.Model], pk: Any) -> tuple[str, Any]:
+        return model.ormar_config.tablename, pk
+
+    def get_version(self, model: type[ormar.Model], pk: Any) -> Version:
+        return self._generation, self._versions.get(self.make_key(model, pk), 0)
+
+    def get[ModelType: ormar.Model](self, model: type[ModelType], pk: Any) -> ModelType | None:
+        key = self.make_key(model, pk)
+
+        with self._lock:
+            cached = self._rows.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+
+            self._rows.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+    def put(self, instance: ormar.Model, version: Version) -> None:
+        """
+        Кладет сущность в кеш, если с момента чтения версии строка не изменялась.
+        :param instance: Загруженная сущность
+        :param version: Версия строки, полученная до начала загрузки
+        """
+
+        key = self.make_key(type(instance), instance.pk)
+        size = estimate_size(instance.model_dump())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if (self._generation, self._versions.get(key, 0)) != version:
+                return
+
+            self._remove(key)
+            self._rows[key] = (version, instance, size)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._rows)))
+
+    def invalidate(self, model: type[ormar.Model], pk: Any) -> None:
+        key = self.make_key(model, pk)
+
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._versions.clear()
+            self._rows.clear()
+            self.size = 0
+
+    def _remove(self, key: tuple[str, Any]) -> None:
+        cached = self._rows.pop(key, None)
+        if cached is not None:
+            self.size -= cached[2]
+
+
+row_cache = RowCache()
@@ -0,0 +1,246 @@
+"""
+Распределение приемов по слотам с учетом вместимости.
+
+Для каждого дня в памяти хранится массив счетчиков занятости слотов
+(рабочие часы / длительность слота). День загружается из БД одним запросом
+по диапазону date_to_come, после чего поиск свободных слотов работает только
+с массивом, без обращения к таблице приемов.
+
+Счетчики - только подсказка: их не видят другие процессы, и они отстают от БД.
+Вместимость при записи проверяется по БД внутри транзакции записи (reserve).
+"""
+import datetime
+import threading
+import time
+
+import sqlalchemy
+
+import models
+import settings
+from models import AppointmentStatuses
+
+# Через сколько секунд загруженный день перечитывается из БД
+DAY_CACHE_TTL = 60
+
+# На сколько дней вперед ищутся свободные слоты
+SEARCH_HORIZON_DAYS = 60
+
+# Сколько дней загружается из БД одним запросом
+PRELOAD_DAYS = 7
+
+
+def to_local_naive(value: datetime.datetime) -> datetime.datetime:
+    """
+    Время приема в часовом поясе клиники без tzinfo (так оно хранится в БД).
+    """
+
+    if value.tzinfo is not None:
+        value = value.astimezone(settings.TIMEZONE).replace(tzinfo=None)
+
+    return value
+
+
+class DaySchedule:
+    """
+    Занятость слотов одного дня.
+    """
+
+    __slots__ = ('day', 'counts', 'loaded_at')
+
+    def __init__(self, day: datetime.date, counts: bytearray):
+        self.day = day
+        self.counts = counts
+        self.loaded_at = time.monotonic()
+
+    @property
+    def is_expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > DAY_CACHE_TTL
+
+
+class SlotAllocator:
+    def __init__(
+            self,
+            working_hours: tuple[datetime.time, datetime.time] = settings.WORKING_HOURS,
+            working_weekdays: set[int] = settings.WORKING_WEEKDAYS,
+            slot_minutes: int = settings.APPOINTMENT_SLOT_MINUTES,
+            capacity: int = settings.APPOINTMENT_SLOT_CAPACITY,
+    ):
+        self.working_hours = working_hours
+        self.working_weekdays = working_weekdays
+        self.slot_length = datetime.timedelta(minutes=slot_minutes)
+        self.capacity = capacity
+
+        start, end = working_hours
+        self.slots_per_day = (
+            datetime.datetime.combine(datetime.date.min, end)
+            - datetime.datetime.combine(datetime.date.min, start)
+        ) // self.slot_length
+
+        self._lock = threading.Lock()
+        self._days: dict[datetime.date, DaySchedule] = {}
+
+    def is_working_day(self, day: datetime.date) -> bool:
+        return day.weekday() in self.working_weekdays
+
+    def day_start(self, day: datetime.date) -> datetime.datetime:
+        return datetime.datetime.combine(day, self.working_hours[0])
+
+    def slot_time(self, day: datetime.date, index: int) -> datetime.datetime:
+        return self.day_start(day) + self.slot_length * index
+
+    def slot_index(self, value: datetime.datetime) -> int | None:
+        """
+        Номер слота, в который попадает время, или None, если время вне рабочего графика.
+        """
+
+        value = to_local_naive(value)
+        if not self.is_working_day(value.date()):
+            return None
+
+        index = (value - self.day_start(value.date())) // self.slot_length
+        if not 0 <= index < self.slots_per_day:
+            return None
+
+        return index
+
+    async def load_days(self, first_day: datetime.date, days_count: int) -> None:
+        """
+        Загружает занятость слотов за несколько дней одним запросом по диапазону дат.
+        """
+
+        days = [first_day + datetime.timedelta(days=offset) for offset in range(days_count)]
+        days = [day for day in days if self.is_working_day(day)]
+        if not days:
+            return
+
+        counts = {day: bytearray(self.slots_per_day) for day in days}
+        appointments = models.Appointment.ormar_config.table
+
+        rows = await models.database.fetch_all(
+            sqlalchemy.select(appointments.c.date_to_come).where(
+                appointments.c.date_to_come >= self.day_start(days[0]),
+                appointments.c.date_to_come < self.day_start(days[-1] + datetime.timedelta(days=1)),
+                appointments.c.status == AppointmentStatuses.IN_QUEUE,
+            )
+        )
+
+        for row in rows:
+            value = to_local_naive(row[0])
+            index = self.slot_index(value)
+            if index is not None and value.date() in counts:
+                counts[value.date()][index] = min(counts[value.date()][index] + 1, 255)
+
+        with self._lock:
+            for day, day_counts in counts.items():
+                self._days[day] = DaySchedule(day, day_counts)
+
+    async def get_day(self, day: datetime.date) -> DaySchedule:
+        schedule = self._days.get(day)
+        if schedule is None or schedule.is_expired:
+            await self.load_days(day, PRELOAD_DAYS)
+            schedule = self._days[day]
+
+        return schedule
+
+    async def get_free_slots(self, start: datetime.datetime, count: int = 10) -> list[datetime.datetime]:
+        """
+        Ближайшие свободные слоты, начиная с указанного времени.
+        :param start: Время, с которого искать
+        :param count: Сколько слотов вернуть
+        :return: время начала свободных слотов
+        """
+
+        start = to_local_naive(start)
+        result = []
+
+        for offset in range(SEARCH_HORIZON_DAYS):
+            day = start.date() + datetime.timedelta(days=offset)
+            if not self.is_working_day(day):
+                continue
+
+            schedule = await self.get_day(day)
+            for index, occupied in enumerate(schedule.counts):
+                if occupied >= self.capacity:
+                    continue
+
+                slot = self.slot_time(day, index)
+                if slot < start:
+                    continue
+
+                result.append(slot)
+                if len(result) >= count:
+                    return result
+
+        return result
+
+    async def reserve(self, value: datetime.datetime, places: int = 1) -> None:
+        """
+        Проверяет по БД, что в слоте есть места. Вызывается внутри транзакции записи:
+        ожидающие приемы слота блокируются (SELECT ... FOR UPDATE вместе с промежутками индекса),
+        поэтому параллельная запись в тот же слот, в том числе из другого процесса,
+        ждет окончания транзакции и видит ее результат.
+        :param value: Время приема
+        :param places: Сколько мест занимается
+        :raises Exception: время вне графика или слот заполнен
+        """
+
+        index = self.slot_index(value)
+        if index is None:
+            raise Exception(
+                'Время приема вне рабочего графика клиники.'
+            )
+
+        slot_start = self.slot_time(to_local_naive(value).date(), index)
+        appointments = models.Appointment.ormar_config.table
+
+        rows = await models.database.fetch_all(
+            sqlalchemy.select(appointments.c.id).where(
+                appointments.c.date_to_come >= slot_start,
+                appointments.c.date_to_come < slot_start + self.slot_length,
+                appointments.c.status == AppointmentStatuses.IN_QUEUE,
+            ).with_for_update()
+        )
+
+        if len(rows) + places > self.capacity:
+            raise Exception(
+                'На это время запись уже заполнена, выберите другое время.'
+            )
+
+    def occupy(self, value: datetime.datetime, places: int = 1) -> None:
+        """
+        Учитывает в счетчиках занятые места после успешной записи.
+        Загруженный день изменяется на месте; не загруженный прочитается из БД при обращении.
+        """
+
+        index = self.slot_index(value)
+        if index is None:
+            return
+
+        with self._lock:
+            schedule = self._days.get(to_local_naive(value).date())
+            if schedule:
+                schedule.counts[index] = min(schedule.counts[index] + places, 255)
+
+    def release(self, value: datetime.datetime) -> None:
+        """
+        Освобождает место в слоте (отмена или перенос).
+        """
+
+        index = self.slot_index(value)
+        if index is None:
+            return
+
+        with self._lock:
+            schedule = self._days.get(to_local_naive(value).date())
+            if schedule and schedule.counts[index]:
+                schedule.counts[index] -= 1
+
+    def invalidate(self, day: datetime.date = None) -> None:
+        with self._lock:
+            if day is None:
+                self._days.clear()
+            else:
+                self._days.pop(day, None)
+
+
+slot_allocator = SlotAllocator()
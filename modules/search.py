@@ -0,0 +1,453 @@
+"""
+Поиск пациентов по префиксу ФИО, телефона, паспорта и страхового полиса.
+
+Индекс хранится в памяти процесса: отсортированный список уникальных токенов
+и словарь токен -> ID пациентов. Поиск префикса - это два бинарных поиска
+по списку токенов, поэтому время ответа не зависит от размера реестра линейно.
+Индекс строится в фоне после запуска приложения (пока он не построен, поиск идет по БД)
+и обновляется при создании, изменении и удалении пациентов через modules.patient.
+"""
+import asyncio
+import re
+import threading
+from bisect import bisect_left, insort
+from itertools import chain
+from typing import Any, Iterable
+
+import sqlalchemy
+
+import models
+
+# Сколько совпадений по одному токену просматривается при поиске
+MAX_CANDIDATES = 10_000
+
+TERM_SEPARATOR_REGEX = re.compile(r'[\s,;]+')
+NON_DIGITS_REGEX = re.compile(r'\D+')
+
+# Код страны, который в номере телефона пишут отдельным словом: "+7 916 ...", "8 916 ..."
+PHONE_COUNTRY_CODES = {'7', '8'}
+
+# Количество цифр российского номера телефона с кодом страны
+PHONE_LENGTH = 11
+
+
+def normalize_term(term: str) -> str:
+    """
+    Приводит слово запроса или значение поля к виду токена индекса.
+    Из слов с цифрами (телефон, номера документов) остаются только цифры.
+    """
+
+    term = term.strip().lower().replace('ё', 'е')
+    if any(char.isdigit() for char in term):
+        return NON_DIGITS_REGEX.sub('', term)
+
+    return term
+
+
+def get_query_terms(query: str) -> list[tuple[str, ...]]:
+    """
+    Слова запроса в виде токенов. Для каждого слова - варианты, совпасть должен любой из них.
+    Номер телефона с пробелами ("8 916 123 45 67", "+7 (916) 123-45-67") склеивается в одно слово,
+    а номер телефона, начинающийся с 8, ищется и с кодом 7, как он хранится в индексе (models.normalize_phone).
+    Номером телефона считается слово после отдельного кода страны или слово из 11 цифр,
+    остальные числа (паспорт, полис) ищутся как есть.
+    :param query: Строка запроса
+    :return: варианты токенов каждого слова
+    """
+
+    words = [word for word in (normalize_term(word) for word in TERM_SEPARATOR_REGEX.split(query)) if word]
+
+    terms = []
+    index = 0
+    while index < len(words):
+        word = words[index]
+        index += 1
+
+        is_phone = False
+        if word in PHONE_COUNTRY_CODES:
+            while index < len(words) and words[index].isdigit():
+                word += words[index]
+                index += 1
+                is_phone = True
+
+        if word.isdigit() and len(word) == PHONE_LENGTH:
+            is_phone = True
+
+        if is_phone and word.startswith('8'):
+            terms.append((word, '7' + word[1:]))
+        else:
+            terms.append((word,))
+
+    return terms
+
+
+def get_patient_tokens(
+        first_name: str,
+        last_name: str,
+        surname: str | None,
+        phone_number: str | None,
+        passport_serial: int | None,
+        passport_number: int | None,
+        insurance_number: int | None,
+) -> set[str]:
+    """
+    Токены пациента, по префиксам которых он будет находиться.
+    """
+
+    tokens = {
+        normalize_term(value)
+        for value in (first_name, last_name, surname)
+        if value
+    }
+
+    phone = models.normalize_phone(phone_number)
+    if phone:
+        tokens.add(phone)
+        # Номер без кода страны, чтобы находить по "916..."
+        if len(phone) == PHONE_LENGTH:
+            tokens.add(phone[1:])
+
+    if passport_serial and passport_number:
+        tokens.update({
+            str(passport_serial),
+            str(passport_number),
+            f'{passport_serial}{passport_number}',
+        })
+
+    if insurance_number:
+        tokens.add(str(insurance_number))
+
+    tokens.discard('')
+    return tokens
+
+
+class PatientSearchIndex:
+    """
+    Префиксный индекс пациентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tokens: list[str] = []
+        self._postings: dict[str, int | set[int]] = {}
+        self._patient_tokens: dict[int, tuple[str, ...]] = {}
+        # Изменения во время построения индекса: (ID пациента, токены или None при удалении)
+        self._pending: list[tuple[int, set[str] | None]] | None = None
+        self.is_built = False
+
+    def __len__(self) -> int:
+        return len(self._patient_tokens)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._postings.clear()
+            self._patient_tokens.clear()
+            self.is_built = False
+
+    def begin_build(self) -> None:
+        with self._lock:
+            self._pending = []
+
+    def build(self, rows: Iterable[tuple[int, set[str]]]) -> None:
+        """
+        Полностью перестраивает индекс.
+        :param rows: Пары (ID пациента, токены)
+        """
+
+        postings: dict[str, int | set[int]] = {}
+        patient_tokens: dict[int, tuple[str, ...]] = {}
+
+        for patient_id, tokens in rows:
+            patient_tokens[patient_id] = tuple(tokens)
+            for token in tokens:
+                self._add_posting(postings, token, patient_id)
+
+        with self._lock:
+            self._postings = postings
+            self._patient_tokens = patient_tokens
+            self._tokens = sorted(postings)
+
+            # Строки читались до этих изменений, поэтому они применяются поверх
+            pending, self._pending = self._pending or [], None
+            for patient_id, tokens in pending:
+                if tokens is None:
+                    self._remove(patient_id)
+                else:
+                    self._add(patient_id, tokens)
+
+            self.is_built = True
+
+    def add(self, patient_id: int, tokens: set[str]) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((patient_id, tokens))
+            self._add(patient_id, tokens)
+
+    def remove(self, patient_id: int) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((patient_id, None))
+            self._remove(patient_id)
+
+    def _add(self, patient_id: int, tokens: set[str]) -> None:
+        with self._lock:
+            self._remove(patient_id)
+            self._patient_tokens[patient_id] = tuple(tokens)
+
+            for token in tokens:
+                if token not in self._postings:
+                    insort(self._tokens, token)
+                self._add_posting(self._postings, token, patient_id)
+
+    def _remove(self, patient_id: int) -> None:
+        with self._lock:
+            for token in self._patient_tokens.pop(patient_id, ()):
+                ids = self._postings.get(token)
+
+                if isinstance(ids, set) and len(ids) > 1:
+                    ids.discard(patient_id)
+                    if len(ids) == 1:
+                        self._postings[token] = next(iter(ids))
+                    continue
+
+                del self._postings[token]
+                index = bisect_left(self._tokens, token)
+                if index < len(self._tokens) and self._tokens[index] == token:
+                    del self._tokens[index]
+
+    def search(self, query: str, limit: int = 20) -> list[int]:
+        """
+        Ищет пациентов, у которых для каждого слова запроса есть токен с таким префиксом.
+        :param query: Строка запроса
+        :param limit: Максимальное количество результатов
+        :return: ID найденных пациентов
+        """
+
+        terms = get_query_terms(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            # Кандидатов берем по самому избирательному слову, остальные проверяем у кандидатов
+            ranges = {
+                term: [self._prefix_range(variant) for variant in term]
+                for term in terms
+            }
+            leading_term = min(
+                terms,
+                key=lambda term: sum(self._range_size(*term_range) for term_range in ranges[term]),
+            )
+            other_terms = [term for term in terms if term != leading_term]
+
+            result = []
+            seen = set()
+
+            candidates = chain.from_iterable(self._iter_range(*term_range) for term_range in ranges[leading_term])
+            for patient_id in candidates:
+                if patient_id in seen:
+                    continue
+                seen.add(patient_id)
+
+                tokens = self._patient_tokens[patient_id]
+                # startswith с кортежем вариантов проверяет любой из них
+                if all(any(token.startswith(term) for token in tokens) for term in other_terms):
+                    result.append(patient_id)
+                    if len(result) >= limit:
+                        break
+
+                if len(seen) >= MAX_CANDIDATES:
+                    break
+
+            return result
+
+    def _prefix_range(self, prefix: str) -> tuple[int, int]:
+        start = bisect_left(self._tokens, prefix)
+        end = bisect_left(self._tokens, prefix + '\U0010ffff', lo=start)
+        return start, end
+
+    def _range_size(self, start: int, end: int) -> int:
+        # Количество ID в диапазоне токенов, посчитанное не дальше MAX_CANDIDATES
+        size = 0
+        for index in range(start, end):
+            ids = self._postings[self._tokens[index]]
+            size += len(ids) if isinstance(ids, set) else 1
+            if size >= MAX_CANDIDATES:
+                break
+
+        return size
+
+    def _iter_range(self, start: int, end: int) -> Iterable[int]:
+        for index in range(start, end):
+            ids = self._postings[self._tokens[index]]
+            if isinstance(ids, set):
+                yield from ids
+            else:
+                yield ids
+
+    @staticmethod
+    def _add_posting(postings: dict[str, int | set[int]], token: str, patient_id: int) -> None:
+        ids = postings.get(token)
+        if ids is None:
+            postings[token] = patient_id
+        elif isinstance(ids, set):
+            ids.add(patient_id)
+        elif ids != patient_id:
+            postings[token] = {ids, patient_id}
+
+
+patient_search_index = PatientSearchIndex()
+
+
+def index_query() -> sqlalchemy.sql.Select:
+    patients = models.Patient.ormar_config.table
+    passports = models.Passport.ormar_config.table
+    insurances = models.Insurance.ormar_config.table
+
+    return sqlalchemy.select(
+        patients.c.id,
+        patients.c.first_name,
+        patients.c.last_name,
+        patients.c.surname,
+        patients.c.phone_number,
+        passports.c.serial,
+        passports.c.number,
+        insurances.c.number,
+    ).select_from(
+        patients
+        .join(passports, patients.c.passport == passports.c.id)
+        .join(insurances, patients.c.insurance == insurances.c.id)
+    )
+
+
+def build_index_from_rows(rows: Iterable[tuple]) -> None:
+    """
+    Вычисляет токены пациентов и перестраивает индекс.
+    :param rows: Строки запроса index_query
+    """
+
+    patient_search_index.build(
+        (row[0], get_patient_tokens(*(row[index] for index in range(1, 8)))) for row in rows
+    )
+
+
+async def build_search_index() -> None:
+    """
+    Строит индекс поиска по всем пациентам.
+    Строки читаются из БД в цикле приложения, а токены и индекс вычисляются
+    в отдельном потоке, чтобы не задерживать обработчики страниц.
+    """
+
+    patient_search_index.begin_build()
+
+    rows = [tuple(row) async for row in models.database.iterate(index_query())]
+
+    await asyncio.to_thread(build_index_from_rows, rows)
+
+
+def index_patient(patient: models.Patient) -> None:
+    """
+    Добавляет пациента в индекс или обновляет его токены.
+    :param patient: Пациент с загруженными паспортом и страховым полисом
+    """
+
+    patient_search_index.add(
+        patient.id,
+        get_patient_tokens(
+            patient.first_name,
+            patient.last_name,
+            patient.surname,
+            patient.phone_number,
+            patient.passport.serial,
+            patient.passport.number,
+            patient.insurance.number,
+        ),
+    )
+
+
+def unindex_patient(patient_id: int) -> None:
+    patient_search_index.remove(patient_id)
+
+
+def term_condition(term: tuple[str, ...]):
+    """
+    Условие SQL для слова запроса: префикс слова совпадает с одним из полей индекса,
+    а префикс варианта номера телефона - с телефоном.
+    """
+
+    patients = models.Patient.ormar_config.table
+    passports = models.Passport.ormar_config.table
+    insurances = models.Insurance.ormar_config.table
+
+    word, *phone_variants = term
+
+    if word.isdigit():
+        conditions = [
+            patients.c.phone_key.startswith(word),
+            # Номер без кода страны
+            patients.c.phone_key.like(f'_{word}%'),
+            sqlalchemy.cast(passports.c.serial, sqlalchemy.String).startswith(word),
+            sqlalchemy.cast(passports.c.number, sqlalchemy.String).startswith(word),
+            sqlalchemy.func.concat(passports.c.serial, passports.c.number).startswith(word),
+            sqlalchemy.cast(insurances.c.number, sqlalchemy.String).startswith(word),
+        ]
+    else:
+        conditions = [
+            column.startswith(word, autoescape=True)
+            for column in (patients.c.first_name, patients.c.last_name, patients.c.surname)
+        ]
+
+    # Вариант номера телефона с кодом 7 сравнивается только с телефоном
+    conditions.extend(patients.c.phone_key.startswith(variant) for variant in phone_variants)
+
+    return sqlalchemy.or_(*conditions)
+
+
+async def search_patient_ids_in_database(query: str, limit: int = 20) -> list[int]:
+    """
+    Тот же поиск запросом к БД (без индекса, полным просмотром таблицы).
+    Используется, пока индекс строится после запуска приложения.
+    :param query: Строка запроса
+    :param limit: Максимальное количество результатов
+    :return: ID найденных пациентов
+    """
+
+    terms = get_query_terms(query)
+    if not terms:
+        return []
+
+    patients = models.Patient.ormar_config.table
+    rows = await models.database.fetch_all(
+        index_query()
+        .with_only_columns(patients.c.id)
+        .where(*(term_condition(term) for term in terms))
+        .order_by(patients.c.id)
+        .limit(limit)
+    )
+    return [row[0] for row in rows]
+
+
+async def search_patients(query: str, limit: int = 20) -> list[models.Patient]:
+    """
+    Единая точка поиска пациентов: по префиксу фамилии, имени, отчества,
+    номера телефона, серии/номера паспорта или номера страхового полиса.
+    Слова запроса должны совпасть все, например "иван 4510".
+    :param query: Строка запроса
+    :param limit: Максимальное количество результатов
+    :return: найденные пациенты с полями таблицы пациентов
+    """
+
+    from modules.patient import get_patients_list
+
+    if patient_search_index.is_built:
+        patient_ids = patient_search_index.search(query, limit=limit)
+    else:
+        patient_ids = await search_patient_ids_in_database(query, limit=limit)
+
+    if not patient_ids:
+        return []
+
+    patients: dict[Any, models.Patient] = {
+        patient.id: patient for patient in await get_patients_list(ids=patient_ids)
+    }
+    return [patients[patient_id] for patient_id in patient_ids if patient_id in patients]
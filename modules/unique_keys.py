@@ -0,0 +1,156 @@
+"""
+Предварительная проверка уникальных ключей (эл. почта, страховой полис, паспорт, логин)
+по фильтру Блума в памяти процесса.
+
+Если фильтр говорит, что ключа точно нет, запрос на существование в БД не нужен.
+Если ключ "возможно есть", проверка выполняется в БД как раньше.
+Фильтр строится при запуске приложения и пополняется при каждой вставке.
+"""
+import asyncio
+import hashlib
+import math
+import threading
+
+import sqlalchemy
+
+import models
+
+# Минимальная емкость фильтра (количество ключей)
+MIN_CAPACITY = 100_000
+
+# Допустимая доля ложноположительных ответов
+ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """
+    Фильтр Блума: отвечает "точно нет" или "возможно есть".
+    """
+
+    def __init__(self, capacity: int, error_rate: float = ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+
+        for index in range(self.hashes_count):
+            yield (first + index * second) % self.size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    @property
+    def is_saturated(self) -> bool:
+        # После превышения емкости доля ложноположительных ответов растет
+        return self.count > self.capacity
+
+
+class UniqueKeysFilter:
+    """
+    Фильтр уникальных ключей. Пока фильтр не построен или переполнен,
+    любой ключ считается возможно существующим.
+    """
+
+    EMAIL = 'email'
+    INSURANCE = 'insurance'
+    PASSPORT = 'passport'
+    USERNAME = 'username'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter: BloomFilter | None = None
+        # Ключи, добавленные во время построения фильтра
+        self._pending: list[str] | None = None
+
+    @staticmethod
+    def make_key(namespace: str, value) -> str:
+        # Регистр не учитываем: сравнение строк в MySQL по умолчанию регистронезависимо
+        return f'{namespace}:{str(value).strip().lower()}'
+
+    def might_exist(self, namespace: str, value) -> bool:
+        bloom_filter = self._filter
+        if bloom_filter is None or bloom_filter.is_saturated:
+            return True
+
+        return self.make_key(namespace, value) in bloom_filter
+
+    def register(self, namespace: str, value) -> None:
+        key = self.make_key(namespace, value)
+
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(key)
+            if self._filter is not None:
+                self._filter.add(key)
+
+    def begin_build(self) -> None:
+        with self._lock:
+            self._pending = []
+
+    def build(self, keys: list[str]) -> None:
+        bloom_filter = BloomFilter(capacity=max(MIN_CAPACITY, len(keys) * 2))
+        for key in keys:
+            bloom_filter.add(key)
+
+        with self._lock:
+            for key in self._pending or []:
+                bloom_filter.add(key)
+
+            self._pending = None
+            self._filter = bloom_filter
+
+
+unique_keys = UniqueKeysFilter()
+
+
+def passport_key(serial: int, number: int) -> str:
+    return f'{serial} {number}'
+
+
+async def build_unique_keys_filter() -> None:
+    """
+    Строит фильтр уникальных ключей по текущему содержимому БД.
+    Значения читаются в цикле приложения, а хеширование ключей выполняется
+    в отдельном потоке, чтобы не задерживать обработчики страниц.
+    """
+
+    patients = models.Patient.ormar_config.table
+    passports = models.Passport.ormar_config.table
+    insurances = models.Insurance.ormar_config.table
+    users = models.User.ormar_config.table
+
+    unique_keys.begin_build()
+
+    values = []
+    sources = [
+        (UniqueKeysFilter.EMAIL, sqlalchemy.select(patients.c.email), lambda row: row[0]),
+        (UniqueKeysFilter.INSURANCE, sqlalchemy.select(insurances.c.number), lambda row: row[0]),
+        (
+            UniqueKeysFilter.PASSPORT,
+            sqlalchemy.select(passports.c.serial, passports.c.number),
+            lambda row: passport_key(row[0], row[1]),
+        ),
+        (UniqueKeysFilter.USERNAME, sqlalchemy.select(users.c.username), lambda row: row[0]),
+    ]
+
+    for namespace, query, get_value in sources:
+        async for row in models.database.iterate(query):
+            values.append((namespace, get_value(row)))
+
+    await asyncio.to_thread(
+        lambda: unique_keys.build([UniqueKeysFilter.make_key(namespace, value) for namespace, value in values])
+    )
@@ -1,74 +1,161 @@
+import importlib
+import logging
+import sys
+import threading
+import time
+
 import flet as ft
 
-import settings
-from ui.login_page import LoginPage
-from ui.registration_page import RegistrationPage
-from ui.appointments_page import AppointmentsPage
-from ui.base_page import UserControl
-from ui.diagnoses_page import DiagnosesPage
-from ui.patients_page import PatientsPage
+from event_loop import run_background, run_sync
+from ui.base_page import BasePage, UserControl
+
+logger = logging.getLogger(__name__)
+
+
+class LazyRoute:
+    """
+    Маршрут, модуль страницы которого импортируется при первом переходе на него.
+    """
+
+    # Время импорта модулей страниц в секундах
+    import_timings: dict[str, float] = {}
+
+    _import_lock = threading.Lock()
+
+    def __init__(self, module_path: str, class_name: str):
+        self.module_path = module_path
+        self.class_name = class_name
+        self._page_class: type[BasePage] | None = None
+
+    def load(self) -> type[BasePage]:
+        """
+        Импортирует модуль страницы (единожды на процесс) и возвращает класс страницы.
+        :return: класс страницы
+        """
+
+        if self._page_class:
+            return self._page_class
+
+        with self._import_lock:
+            is_imported = self.module_path in sys.modules
+            started_at = time.perf_counter()
+            module = importlib.import_module(self.module_path)
+
+            if not is_imported:
+                self.import_timings[self.module_path] = time.perf_counter() - started_at
+                logger.info(
+                    'Модуль %s импортирован за %.1f мс',
+                    self.module_path,
+                    self.import_timings[self.module_path] * 1000,
+                )
+
+            self._page_class = getattr(module, self.class_name)
+
+        return self._page_class
+
+
+ROUTES: dict[str, LazyRoute] = {
+    '/login': LazyRoute('ui.login_page', 'LoginPage'),
+    '/registration': LazyRoute('ui.registration_page', 'RegistrationPage'),
+    '/appointments': LazyRoute('ui.appointments_page', 'AppointmentsPage'),
+    '/calendar': LazyRoute('ui.calendar_page', 'CalendarPage'),
+    '/diagnoses': LazyRoute('ui.diagnoses_page', 'DiagnosesPage'),
+    '/patients': LazyRoute('ui.patients_page', 'PatientsPage'),
+}
 
 
 class Router:
+    """
+    Роутер сессии. Экземпляры страниц и их отрисованные деревья живут всю сессию.
+    """
+
     def __init__(self, page: ft.Page, initial_route: str = '/'):
         self.user_control = UserControl()
 
-        self.routes = {
-            '/': lambda: ft.Container(),
-            '/login': lambda: settings.LOOP.run_until_complete(
-                LoginPage(page, self.user_control).render()
-            ),
-            '/registration': lambda: settings.LOOP.run_until_complete(
-                RegistrationPage(page, self.user_control).render()
-            ),
-            '/appointments': lambda: settings.LOOP.run_until_complete(
-                AppointmentsPage(page, self.user_control).render()
-            ),
-            '/diagnoses': lambda: settings.LOOP.run_until_complete(
-                DiagnosesPage(page, self.user_control).render()
-            ),
-            '/patients': lambda: settings.LOOP.run_until_complete(
-                PatientsPage(page, self.user_control).render()
-            )
-        }
+        self.routes = ROUTES
+        self.pages: dict[str, BasePage] = {}
+
         self.page = page
-        self.body = ft.Container(content=self.routes[initial_route]())
+        self._drawer: ft.NavigationDrawer | None = None
+        self._appbar = ft.AppBar(
+            title=ft.Text("Клиника Саныча"),
+            center_title=True,
+        )
+        self.body = ft.Container(content=self.get_content(initial_route))
+
+    def get_page(self, route: str) -> BasePage | None:
+        """
+        Возвращает экземпляр страницы маршрута, создавая его при первом переходе.
+        :param route: Маршрут
+        :return: страница или None, если маршрут не найден
+        """
+
+        if route not in self.routes:
+            return None
+
+        if route not in self.pages:
+            page_class = self.routes[route].load()
+            self.pages[route] = page_class(self.page, self.user_control)
+
+        return self.pages[route]
+
+    def get_content(self, route: str) -> ft.Control:
+        page = self.get_page(route)
+        if not page:
+            return ft.Container()
+
+        return run_sync(page.get_content())
+
+    def get_drawer(self) -> ft.NavigationDrawer | None:
+        if not self.user_control.get_user():
+            return None
+
+        if not self._drawer:
+            self._drawer = ft.NavigationDrawer(
+                tile_padding=ft.Padding(top=20, bottom=20, left=0, right=0),
+                controls=[
+                    ft.OutlinedButton(
+                        text="Пациенты",
+                        on_click=lambda *_: self.page.go('/patients')
+                    ),
+                    ft.OutlinedButton(
+                        text="Диагнозы",
+                        on_click=lambda *_: self.page.go('/diagnoses')
+                    ),
+                    ft.OutlinedButton(
+                        text="Приемы",
+                        on_click=lambda *_: self.page.go('/appointments')
+                    ),
+                    ft.OutlinedButton(
+                        text="Календарь",
+                        on_click=lambda *_: self.page.go('/calendar')
+                    ),
+                    ft.OutlinedButton(
+                        text="Выход",
+                        style=ft.ButtonStyle(color=ft.colors.RED_50),
+                        on_click=lambda *_: None
+                    )
+                ]
+            )
+
+        return self._drawer
 
     def handle_switch_drawer(self, *_):
         self.page.drawer.open = not self.page.drawer.open
         self.page.update()
 
     def handle_route_change(self, route: ft.RouteChangeEvent) -> None:
-        self.page.drawer = ft.NavigationDrawer(
-            tile_padding=ft.Padding(top=20, bottom=20, left=0, right=0),
-            controls=[
-                ft.OutlinedButton(
-                    text="Пациенты",
-                    on_click=lambda *_: self.page.go('/patients')
-                ),
-                ft.OutlinedButton(
-                    text="Диагнозы",
-                    on_click=lambda *_: self.page.go('/diagnoses')
-                ),
-                ft.OutlinedButton(
-                    text="Приемы",
-                    on_click=lambda *_: self.page.go('/appointments')
-                ),
-                ft.OutlinedButton(
-                    text="Выход",
-                    style=ft.ButtonStyle(color=ft.colors.RED_50),
-                    on_click=lambda *_: None
-                )
-            ]
-        ) if self.user_control.get_user() else None
-        self.page.appbar = ft.AppBar(
-            title=ft.Text("Клиника Саныча"),
-            center_title=True,
-        )
-        self.body.clean()
-        new_content = self.routes[route.route]()
+        self.page.drawer = self.get_drawer()
+        self.page.appbar = self._appbar
+
+        new_content = self.get_content(route.route)
         if not new_content:
             return
 
         self.body.content = new_content
         self.body.update()
+
+        # Сначала показываем сохраненное дерево, затем в фоне обновляем устаревшие данные
+        page = self.pages.get(route.route)
+        if page and page.is_stale():
+            run_background(page.reload())
@@ -1,5 +1,5 @@
 import asyncio
-from datetime import timedelta, timezone
+from datetime import time, timedelta, timezone
 
 
 # Путь подключения СУБД
@@ -14,3 +14,117 @@ TIMEZONE = timezone(offset=timedelta(hours=3), name='МСК')
 
 # Жизненный цикл проекта
 LOOP = asyncio.get_event_loop()
+
+# Количество окон документов пациентов, хранимых в кеше сессии
+DOCUMENTS_MODAL_CACHE_SIZE = 32
+
+# Время (в секундах), после которого данные открытой ранее страницы обновляются при переходе на нее
+PAGE_DATA_TTL = 60
+
+# Уровень логирования приложения
+LOG_LEVEL = 'INFO'
+
+# Рабочие часы клиники (начало и конец приема)
+WORKING_HOURS = (time(hour=9), time(hour=18))
+
+# Рабочие дни недели (0 - понедельник)
+WORKING_WEEKDAYS = {0, 1, 2, 3, 4}
+
+# Длительность одного слота приема в минутах
+APPOINTMENT_SLOT_MINUTES = 15
+
+# Сколько пациентов можно записать в один слот
+APPOINTMENT_SLOT_CAPACITY = 1
+
+# Как часто (в секундах) неявившиеся пациенты переводятся в статус NOT_CAME
+NO_SHOW_SWEEP_INTERVAL = 300
+
+# Через сколько минут после времени приема пациент считается неявившимся
+NO_SHOW_GRACE_MINUTES = 60
+
+# Сколько приемов обновляется одним запросом при поиске неявившихся
+NO_SHOW_BATCH_SIZE = 500
+
+# Через сколько дней после даты приема закрытый прием переносится в архив
+ARCHIVE_AFTER_DAYS = 180
+
+# Сколько приемов переносится в архив одной транзакцией
+ARCHIVE_BATCH_SIZE = 1000
+
+# Как часто (в секундах) запускается перенос приемов в архив
+ARCHIVE_INTERVAL = 3600
+
+# За сколько дней до окончания полиса приемы пациента помечаются
+INSURANCE_EXPIRY_WARNING_DAYS = 30
+
+# Сколько дней после окончания полиса он еще проверяется при пометке приемов
+INSURANCE_EXPIRY_LOOKBACK_DAYS = 7
+
+# Как часто (в секундах) запускается пометка приемов с истекающими полисами
+INSURANCE_EXPIRY_SWEEP_INTERVAL = 3600
+
+# Сколько полисов обрабатывается одним запросом при пометке приемов
+INSURANCE_EXPIRY_BATCH_SIZE = 500
+
+# SMTP-сервер для напоминаний о приемах (для проверки: python -m aiosmtpd -n -l localhost:1025)
+SMTP_HOST = 'localhost'
+SMTP_PORT = 1025
+
+# Адрес отправителя напоминаний
+SMTP_SENDER = 'clinic@localhost'
+
+# Сколько напоминаний отправляется одновременно
+REMINDER_CONCURRENCY = 20
+
+# Сколько приемов читается из БД за один раз при рассылке напоминаний
+REMINDER_CHUNK_SIZE = 500
+
+# Количество попыток отправки одного напоминания
+REMINDER_MAX_ATTEMPTS = 3
+
+# Пауза (в секундах) перед повторной отправкой, удваивается с каждой попыткой
+REMINDER_RETRY_BACKOFF = 1.0
+
+# Как часто (в секундах) запускается рассылка напоминаний на завтра
+REMINDER_INTERVAL = 3600
+
+# Режим разработки: дополнительные проверки (например, детектор N+1 запросов)
+DEBUG = False
+
+# Сколько однотипных запросов при отрисовке страницы считается признаком N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+# Объем памяти (в байтах) общего кеша строк пациентов с документами
+ROW_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Путь подключения к реплике для чтения списков (None - все запросы идут в основную БД)
+DATABASE_REPLICA_URL = None
+
+# Сколько секунд после записи сессия читает только из основной БД (должно быть больше отставания реплики)
+REPLICA_STALENESS_WINDOW = 5
+
+# Минимальное и максимальное количество подключений в пуле БД (в каждом процессе)
+DATABASE_POOL_MIN_SIZE = 1
+DATABASE_POOL_MAX_SIZE = 10
+
+# Сколько секунд ждать свободного подключения из пула (None - без ограничения)
+DATABASE_POOL_ACQUIRE_TIMEOUT = 10
+
+# Через сколько секунд подключение к БД пересоздается (-1 - никогда)
+DATABASE_POOL_RECYCLE = 3600
+
+# Как часто (в секундах) показатели пула подключений пишутся в лог
+DATABASE_POOL_METRICS_INTERVAL = 60
+
+# Адрес брокера событий для работы в нескольких процессах (None - события только внутри процесса)
+EVENT_BROKER_URL = None
+
+# Адрес и порт, на которых веб-режим (python web.py) принимает подключения
+WEB_HOST = '0.0.0.0'
+WEB_PORT = 8550
+
+# Количество процессов веб-режима (None - по количеству ядер процессора)
+WEB_WORKERS = None
+
+# Брокер событий веб-режима, если EVENT_BROKER_URL не задан (запускается вместе с прокси)
+WEB_EVENT_BROKER_URL = 'tcp://127.0.0.1:8765'
@@ -4,20 +4,74 @@ import flet as ft
 
 import models
 import serializers
-from ui.base_page import BasePage
+import settings
+from event_loop import run_sync
+from ui.base_page import BasePage, UserControl
 from ui.components import PydanticTable, FletForm
 
-from modules.appointments import get_all_appointments, get_active_appointments, create_appointment, get_inactive_appointments
-from modules.patient import get_patients
+from modules.appointments import create_appointment, CLOSED_APPOINTMENT_STATUSES
+from modules.read_models import (
+    get_appointment_records, get_appointment_records_by_ids, get_patient_records, AppointmentRecord, PatientRecord,
+)
 from modules.diagnosis import get_diagnoses
+from modules.events import event_bus, AppointmentsChanged, PatientsChanged, DiagnosesChanged, ChangeAction
+from modules.scheduling import slot_allocator
+
+# Сколько ближайших свободных слотов предлагать в форме записи
+FREE_SLOTS_COUNT = 40
 
 
 class AppointmentsPage(BasePage):
-    all_appointments: list[models.Appointment]
-    active_appointments: list[models.Appointment]
-    inactive_appointments: list[models.Appointment]
-    patients: list[models.Patient]
+    all_appointments: list[AppointmentRecord]
+    active_appointments: list[AppointmentRecord]
+    inactive_appointments: list[AppointmentRecord]
+    patients: list[PatientRecord]
     diagnoses: list[models.Diagnosis]
+    free_slots: list[datetime.datetime]
+    # Показывать ли в завершенных приемах архив
+    include_archive: bool = False
+    appointments_tables: dict[str, PydanticTable]
+    create_appointment_form_row: ft.Row
+
+    def __init__(self, page: ft.Page, user_storage: UserControl):
+        super().__init__(page, user_storage)
+        event_bus.subscribe(AppointmentsChanged, self.handle_appointments_changed)
+        event_bus.subscribe(PatientsChanged, self.handle_form_choices_changed)
+        event_bus.subscribe(DiagnosesChanged, self.handle_form_choices_changed)
+
+    def get_table_statuses(self) -> dict[str, set[models.AppointmentStatuses] | None]:
+        # Какие статусы показывает каждая таблица (None - все)
+        return {
+            'all_appointments': None,
+            'active_appointments': {models.AppointmentStatuses.IN_QUEUE},
+            'inactive_appointments': set(CLOSED_APPOINTMENT_STATUSES),
+        }
+
+    async def handle_appointments_changed(self, event: AppointmentsChanged):
+        """
+        Обновляет строки измененных приемов во всех таблицах без перерисовки страницы.
+        Прием, сменивший статус, переносится между таблицами активных и завершенных приемов.
+        """
+
+        if not self._rendered:
+            return
+
+        ids = set(event.ids)
+        records = [] if event.action == ChangeAction.DELETED else await get_appointment_records_by_ids(list(ids))
+
+        for name, statuses in self.get_table_statuses().items():
+            matching = [record for record in records if statuses is None or record.status in statuses]
+            setattr(self, name, [
+                record for record in getattr(self, name) if record.id not in ids
+            ] + matching)
+
+            table = self.appointments_tables[name]
+            table.remove_rows(ids - {record.id for record in matching})
+            table.upsert_rows(matching)
+
+    async def handle_form_choices_changed(self, _):
+        # Пациенты и диагнозы формы записи обновятся при следующем показе страницы
+        self.mark_stale()
 
     async def handle_create_appointment_form_submit(self, data):
         appointment = await create_appointment(
@@ -31,82 +85,42 @@ class AppointmentsPage(BasePage):
             f"Запись пациента {appointment.patient.first_name} успешно создана."
         )
 
-        await self.refresh_data()
-        self.page.go('/', skip_route_change_event=False)
-        self.page.go('/appointments', skip_route_change_event=False)
+        # Занятый слот пропадает из вариантов формы
+        await self.reload_data()
 
     async def refresh_data(self):
-        self.all_appointments = await get_all_appointments()
-        self.active_appointments = await get_active_appointments()
-        self.inactive_appointments = await get_inactive_appointments()
-        self.patients = await get_patients()
-        self.diagnoses = await get_diagnoses()
-
-    async def render(self) -> ft.Control:
-        await self.refresh_data()
-
-        all_appointments_table = PydanticTable(
-            dataset=self.all_appointments,
-            columns_by_keys={
-                'id': 'ID',
-                'patient': 'ФИО Пациента',
-                'diagnosis': 'Диагноз',
-                'date_created': 'Дата создания',
-                'date_to_come': 'Дата приема',
-                'status': 'Статус приема'
-            },
-            displays={
-                'diagnosis': lambda value: value.name,
-                'patient': lambda value: f'{value.last_name} {value.first_name} {value.surname}',
-                'date_created': lambda value: value.strftime('%d.%m.%Y %H:%M'),
-                'date_to_come': lambda value: value.strftime('%d.%m.%Y %H:%M'),
-                'status': lambda value: value.value
-            },
-            actions=[
-                ("Обновить", lambda: None),
-                ("Удалить", lambda: None)
-            ]
+        self.all_appointments = await get_appointment_records()
+        self.active_appointments = await get_appointment_records([models.AppointmentStatuses.IN_QUEUE])
+        self.inactive_appointments = await get_appointment_records(
+            CLOSED_APPOINTMENT_STATUSES,
+            include_archive=self.include_archive,
         )
-
-        active_appointments_table = PydanticTable(
-            dataset=self.active_appointments,
-            columns_by_keys={
-                'id': 'ID',
-                'patient': 'ФИО Пациента',
-                'diagnosis': 'Диагноз',
-                'date_created': 'Дата создания',
-                'date_to_come': 'Дата приема',
-                'status': 'Статус приема'
-            },
-            displays={
-                'diagnosis': lambda value: value.name,
-                'patient': lambda value: f'{value.last_name} {value.first_name} {value.surname}',
-                'date_created': lambda value: value.strftime('%d.%m.%Y %H:%M'),
-                'date_to_come': lambda value: value.strftime('%d.%m.%Y %H:%M'),
-                'status': lambda value: value.value
-            },
-            actions=[
-                ("Обновить", lambda: None),
-                ("Удалить", lambda: None)
-            ]
+        self.patients = await get_patient_records()
+        self.diagnoses = await get_diagnoses(trusted=True)
+        self.free_slots = await slot_allocator.get_free_slots(
+            datetime.datetime.now(tz=settings.TIMEZONE),
+            count=FREE_SLOTS_COUNT,
         )
 
-        inactive_appointments_table = PydanticTable(
-            dataset=self.inactive_appointments,
+    def render_appointments_table(self, appointments: list[AppointmentRecord]) -> PydanticTable:
+        return PydanticTable(
+            dataset=appointments,
             columns_by_keys={
                 'id': 'ID',
                 'patient': 'ФИО Пациента',
                 'diagnosis': 'Диагноз',
                 'date_created': 'Дата создания',
                 'date_to_come': 'Дата приема',
-                'status': 'Статус приема'
+                'status': 'Статус приема',
+                'insurance_expired': 'Полис',
             },
             displays={
                 'diagnosis': lambda value: value.name,
                 'patient': lambda value: f'{value.last_name} {value.first_name} {value.surname}',
                 'date_created': lambda value: value.strftime('%d.%m.%Y %H:%M'),
                 'date_to_come': lambda value: value.strftime('%d.%m.%Y %H:%M'),
-                'status': lambda value: value.value
+                'status': lambda value: value.value,
+                'insurance_expired': lambda value: 'Истекает' if value else '',
             },
             actions=[
                 ("Обновить", lambda: None),
@@ -114,7 +128,9 @@ class AppointmentsPage(BasePage):
             ]
         )
 
-        create_appointment_form = FletForm(
+    def render_create_appointment_form(self) -> FletForm:
+        # Варианты формы (пациенты, диагнозы, свободные слоты) берутся из последней загрузки данных
+        return FletForm(
             model=serializers.AppointmentFormSerializer,
             choices={
                 'diagnosis': (
@@ -124,11 +140,56 @@ class AppointmentsPage(BasePage):
                 'patient': (
                     self.patients,
                     lambda patient: (patient.id, f"{patient.last_name} {patient.first_name} {patient.surname}"),
-                )
+                ),
+                'date_to_come': (
+                    self.free_slots,
+                    lambda slot: (slot.strftime('%Y-%m-%dT%H:%M'), slot.strftime('%d.%m.%Y %H:%M')),
+                ),
             },
             handle_form_submit=self.handle_create_appointment_form_submit,
         )
 
+    async def reload_data(self) -> bool:
+        await self.refresh_data()
+
+        for name in self.get_table_statuses():
+            self.appointments_tables[name].set_rows(getattr(self, name))
+
+        self.create_appointment_form_row.controls = [self.render_create_appointment_form()]
+        if self.create_appointment_form_row.page:
+            self.create_appointment_form_row.update()
+
+        return True
+
+    def handle_include_archive_change(self, event: ft.ControlEvent):
+        self.include_archive = event.control.value
+        self.inactive_appointments = run_sync(
+            get_appointment_records(CLOSED_APPOINTMENT_STATUSES, include_archive=self.include_archive)
+        )
+        self.appointments_tables['inactive_appointments'] = self.render_appointments_table(self.inactive_appointments)
+        self.inactive_appointments_container.content = self.appointments_tables['inactive_appointments']
+        self.inactive_appointments_container.update()
+
+    async def render(self) -> ft.Control:
+        await self.refresh_data()
+
+        self.appointments_tables = {
+            name: self.render_appointments_table(getattr(self, name))
+            for name in self.get_table_statuses()
+        }
+        all_appointments_table = self.appointments_tables['all_appointments']
+        active_appointments_table = self.appointments_tables['active_appointments']
+        self.inactive_appointments_container = ft.Container(
+            content=self.appointments_tables['inactive_appointments'],
+        )
+
+        self.create_appointment_form_row = ft.Row(
+            [
+                self.render_create_appointment_form(),
+            ],
+            alignment=ft.MainAxisAlignment.CENTER,
+        )
+
         return ft.Column(
             horizontal_alignment=ft.CrossAxisAlignment.CENTER,
             spacing=30,
@@ -161,7 +222,17 @@ class AppointmentsPage(BasePage):
                             ),
                             ft.Tab(
                                 content=ft.Container(
-                                    content=inactive_appointments_table,
+                                    content=ft.Column(
+                                        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                                        controls=[
+                                            ft.Checkbox(
+                                                label='Включая архив',
+                                                value=self.include_archive,
+                                                on_change=self.handle_include_archive_change,
+                                            ),
+                                            self.inactive_appointments_container,
+                                        ]
+                                    ),
                                     alignment=ft.alignment.top_center,
                                 ),
                                 text='Завершенные приемы',
@@ -169,12 +240,7 @@ class AppointmentsPage(BasePage):
                             ),
                             ft.Tab(
                                 content=ft.Container(
-                                    ft.Row(
-                                        [
-                                            create_appointment_form,
-                                        ],
-                                        alignment=ft.MainAxisAlignment.CENTER,
-                                    ),
+                                    self.create_appointment_form_row,
                                     margin=ft.Margin(top=20, bottom=0, left=0, right=0),
                                     alignment=ft.alignment.top_center,
                                 ),
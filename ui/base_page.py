@@ -1,6 +1,10 @@
+import time
+
 import flet as ft
 from abc import abstractmethod
 
+import settings
+from event_loop import run_sync
 from models import User
 
 
@@ -19,10 +23,18 @@ class UserControl[UserType:User]:
 
 
 class BasePage:
+    # Через сколько секунд данные страницы считаются устаревшими (None - никогда)
+    stale_after: float | None = settings.PAGE_DATA_TTL
+
     def __init__(self, page: ft.Page, user_storage: UserControl):
         self.page = page
         self.user_storage = user_storage
 
+        self.container = ft.Container()
+        self._rendered = False
+        self._refreshed_at: float | None = None
+        self._reloading = False
+
     def handle_go_back(self):
         pass
 
@@ -30,8 +42,84 @@ class BasePage:
     async def render(self) -> ft.Control:
         raise NotImplemented
 
+    async def render_content(self) -> ft.Control:
+        """
+        Отрисовывает страницу. В режиме разработки запросы отрисовки проверяются детектором N+1.
+        """
+
+        if not settings.DEBUG:
+            return await self.render()
+
+        from modules.loaders import query_scope
+
+        with query_scope(type(self).__name__):
+            return await self.render()
+
+    async def get_content(self) -> ft.Control:
+        """
+        Возвращает отрисованное дерево страницы, отрисовывая его только при первом обращении.
+        :return: контейнер с содержимым страницы
+        """
+
+        if not self._rendered:
+            self.container.content = await self.render_content()
+            self._rendered = True
+            self._refreshed_at = time.monotonic()
+
+        return self.container
+
+    def is_stale(self) -> bool:
+        if not self._rendered:
+            return False
+
+        if self._refreshed_at is None:
+            return True
+
+        return self.stale_after is not None and time.monotonic() - self._refreshed_at > self.stale_after
+
+    def mark_stale(self) -> None:
+        self._refreshed_at = None
+
+    async def refresh(self) -> None:
+        """
+        Перезагружает данные страницы и заменяет ее дерево в уже показанном контейнере.
+        """
+
+        self.container.content = await self.render_content()
+        self._rendered = True
+        self._refreshed_at = time.monotonic()
+
+        if self.container.page:
+            self.container.update()
+
+    async def reload_data(self) -> bool:
+        """
+        Перезагружает данные уже отрисованной страницы и обновляет ими ее элементы, не перестраивая дерево.
+        :return: False, если страница так не умеет и ее нужно перерисовать целиком
+        """
+
+        return False
+
+    async def reload(self) -> None:
+        """
+        Обновляет устаревшие данные показанной страницы (выполняется в фоне после показа сохраненного дерева).
+        """
+
+        # Повторные запросы, пока идет обновление или после него, ничего не делают
+        if self._reloading or not self.is_stale():
+            return
+
+        self._reloading = True
+        try:
+            if await self.reload_data():
+                self._refreshed_at = time.monotonic()
+            else:
+                await self.refresh()
+        finally:
+            self._reloading = False
+
     def force_rerender(self) -> None:
-        self.page.update(self.render())
+        run_sync(self.refresh())
 
     def create_error_message(self, description: str):
         def handle_decline_banner(_):
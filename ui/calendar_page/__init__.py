@@ -0,0 +1 @@
+from .calendar_page import CalendarPage
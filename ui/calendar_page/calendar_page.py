@@ -0,0 +1,247 @@
+import datetime
+
+import flet as ft
+
+import settings
+from event_loop import run_sync
+from models import AppointmentStatuses
+from ui.base_page import BasePage
+
+from modules.events import event_bus, AppointmentsChanged, ChangeAction
+from modules.read_models import get_appointment_records_in_range, get_appointment_records_by_ids, AppointmentRecord
+from modules.scheduling import to_local_naive
+
+# Перенесенные приемы в календаре не показываются: вместо них есть новая запись
+CALENDAR_STATUSES = [
+    AppointmentStatuses.IN_QUEUE,
+    AppointmentStatuses.COMPLETED,
+    AppointmentStatuses.CANCELED,
+    AppointmentStatuses.NOT_CAME,
+]
+
+# Сколько недель хранится в памяти страницы
+CACHED_WEEKS_COUNT = 5
+
+DAY_MODE = 'day'
+WEEK_MODE = 'week'
+
+WEEKDAY_NAMES = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+STATUS_COLORS = {
+    AppointmentStatuses.IN_QUEUE: ft.colors.BLUE_50,
+    AppointmentStatuses.COMPLETED: ft.colors.GREEN_50,
+    AppointmentStatuses.CANCELED: ft.colors.GREY_200,
+    AppointmentStatuses.NOT_CAME: ft.colors.RED_50,
+}
+
+
+def get_week_start(day: datetime.date) -> datetime.date:
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def get_day_bounds(day: datetime.date, days_count: int = 1) -> tuple[datetime.datetime, datetime.datetime]:
+    """
+    Границы периода в часовом поясе клиники.
+    """
+
+    start = datetime.datetime.combine(day, datetime.time.min, tzinfo=settings.TIMEZONE)
+    return start, start + datetime.timedelta(days=days_count)
+
+
+class CalendarPage(BasePage):
+    """
+    Календарь приемов по дням и неделям.
+    Приемы загружаются по неделям запросом по диапазону даты посещения,
+    соседние недели подгружаются заранее, поэтому листание не ждет БД.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.mode = WEEK_MODE
+        self.current_day = datetime.datetime.now(tz=settings.TIMEZONE).date()
+        # Начало недели -> приемы недели
+        self.weeks: dict[datetime.date, list[AppointmentRecord]] = {}
+
+        self.period_text = ft.Text(size=20)
+        self.calendar_container = ft.Container(alignment=ft.alignment.top_center)
+
+        event_bus.subscribe(AppointmentsChanged, self.handle_appointments_changed)
+
+    async def handle_appointments_changed(self, event: AppointmentsChanged):
+        """
+        Переносит измененные приемы в загруженных неделях и перерисовывает текущий период.
+        """
+
+        if not self._rendered:
+            return
+
+        ids = set(event.ids)
+        records = [] if event.action == ChangeAction.DELETED else await get_appointment_records_by_ids(list(ids))
+
+        for week_start, week_records in self.weeks.items():
+            self.weeks[week_start] = [record for record in week_records if record.id not in ids]
+
+        for record in records:
+            week_start = get_week_start(to_local_naive(record.date_to_come).date())
+            if record.status in CALENDAR_STATUSES and week_start in self.weeks:
+                self.weeks[week_start].append(record)
+                self.weeks[week_start].sort(key=lambda item: item.date_to_come)
+
+        self.calendar_container.content = await self.render_period()
+        if self.calendar_container.page:
+            self.calendar_container.update()
+
+    async def load_week(self, week_start: datetime.date) -> list[AppointmentRecord]:
+        if week_start not in self.weeks:
+            self.weeks[week_start] = await get_appointment_records_in_range(
+                *get_day_bounds(week_start, days_count=7),
+                statuses=CALENDAR_STATUSES,
+            )
+
+        return self.weeks[week_start]
+
+    async def prefetch_adjacent_weeks(self) -> None:
+        """
+        Подгружает предыдущую и следующую недели и вытесняет самые дальние от текущей.
+        """
+
+        week_start = get_week_start(self.current_day)
+        for offset in (1, -1):
+            await self.load_week(week_start + datetime.timedelta(weeks=offset))
+
+        while len(self.weeks) > CACHED_WEEKS_COUNT:
+            del self.weeks[max(self.weeks, key=lambda start: abs(start - week_start))]
+
+    async def get_day_records(self, day: datetime.date) -> list[AppointmentRecord]:
+        records = await self.load_week(get_week_start(day))
+        return [record for record in records if to_local_naive(record.date_to_come).date() == day]
+
+    def render_record(self, record: AppointmentRecord) -> ft.Control:
+        patient = record.patient
+        return ft.Container(
+            bgcolor=STATUS_COLORS.get(record.status),
+            border_radius=5,
+            padding=5,
+            content=ft.Column(
+                spacing=2,
+                controls=[
+                    ft.Text(record.date_to_come.strftime('%H:%M'), weight=ft.FontWeight.BOLD, color='black'),
+                    ft.Text(f'{patient.last_name} {patient.first_name} {patient.surname or ""}', color='black'),
+                    ft.Text(record.diagnosis.name if record.diagnosis else '', size=12, color='black'),
+                ]
+            )
+        )
+
+    def render_day_column(self, day: datetime.date, records: list[AppointmentRecord], width: int) -> ft.Control:
+        return ft.Container(
+            width=width,
+            content=ft.Column(
+                spacing=5,
+                controls=[
+                    ft.Text(
+                        f'{WEEKDAY_NAMES[day.weekday()]}, {day.strftime("%d.%m")}',
+                        weight=ft.FontWeight.BOLD,
+                    ),
+                    *(self.render_record(record) for record in records),
+                ]
+            )
+        )
+
+    async def render_period(self) -> ft.Control:
+        if self.mode == DAY_MODE:
+            self.period_text.value = self.current_day.strftime('%d.%m.%Y')
+            return self.render_day_column(
+                self.current_day,
+                await self.get_day_records(self.current_day),
+                width=400,
+            )
+
+        week_start = get_week_start(self.current_day)
+        week_end = week_start + datetime.timedelta(days=6)
+        self.period_text.value = f'{week_start.strftime("%d.%m.%Y")} - {week_end.strftime("%d.%m.%Y")}'
+
+        records = await self.load_week(week_start)
+        days = [week_start + datetime.timedelta(days=offset) for offset in range(7)]
+        return ft.Row(
+            vertical_alignment=ft.CrossAxisAlignment.START,
+            controls=[
+                self.render_day_column(
+                    day,
+                    [record for record in records if to_local_naive(record.date_to_come).date() == day],
+                    width=180,
+                )
+                for day in days
+            ]
+        )
+
+    async def show_period(self) -> None:
+        self.calendar_container.content = await self.render_period()
+        if self.calendar_container.page:
+            self.calendar_container.update()
+            self.period_text.update()
+
+        await self.prefetch_adjacent_weeks()
+
+    async def reload_data(self) -> bool:
+        self.weeks.clear()
+        await self.show_period()
+        return True
+
+    def handle_move(self, direction: int):
+        step = datetime.timedelta(days=1) if self.mode == DAY_MODE else datetime.timedelta(weeks=1)
+        self.current_day += step * direction
+        run_sync(self.show_period())
+
+    def handle_today(self, *_):
+        self.current_day = datetime.datetime.now(tz=settings.TIMEZONE).date()
+        run_sync(self.show_period())
+
+    def handle_mode_change(self, event: ft.ControlEvent):
+        self.mode = event.control.value
+        run_sync(self.show_period())
+
+    async def render(self) -> ft.Control:
+        # При обновлении страницы данные недель перечитываются
+        self.weeks.clear()
+        self.calendar_container.content = await self.render_period()
+        await self.prefetch_adjacent_weeks()
+
+        return ft.Column(
+            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+            spacing=30,
+            controls=[
+                ft.Text(
+                    "Календарь приемов",
+                    size=35,
+                ),
+                ft.Row(
+                    alignment=ft.MainAxisAlignment.CENTER,
+                    controls=[
+                        ft.IconButton(
+                            icon=ft.icons.CHEVRON_LEFT,
+                            on_click=lambda *_: self.handle_move(-1),
+                        ),
+                        self.period_text,
+                        ft.IconButton(
+                            icon=ft.icons.CHEVRON_RIGHT,
+                            on_click=lambda *_: self.handle_move(1),
+                        ),
+                        ft.TextButton(
+                            text='Сегодня',
+                            on_click=self.handle_today,
+                        ),
+                        ft.Dropdown(
+                            width=150,
+                            value=self.mode,
+                            options=[
+                                ft.dropdown.Option(key=DAY_MODE, text='День'),
+                                ft.dropdown.Option(key=WEEK_MODE, text='Неделя'),
+                            ],
+                            on_change=self.handle_mode_change,
+                        ),
+                    ]
+                ),
+                self.calendar_container,
+            ]
+        )
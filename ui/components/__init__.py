@@ -1,3 +1,19 @@
-from .flet_form import FletForm
-from .pydantic_table import PydanticTable
-from .documents_modal import DocumentsModal
+import importlib
+
+# Компоненты импортируются при первом обращении, чтобы страницы не тянули за собой лишние модули
+_COMPONENTS = {
+    'FletForm': '.flet_form',
+    'PydanticTable': '.pydantic_table',
+    'DocumentsModal': '.documents_modal',
+    'DocumentsModalCache': '.documents_modal',
+    'PatientHistoryModal': '.patient_history_modal',
+}
+
+__all__ = list(_COMPONENTS)
+
+
+def __getattr__(name: str):
+    if name not in _COMPONENTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(importlib.import_module(_COMPONENTS[name], __name__), name)
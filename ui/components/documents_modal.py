@@ -1,8 +1,11 @@
-from typing import Optional
+from collections import OrderedDict
+from typing import Callable
 
 import flet as ft
 
 import models
+import settings
+from modules.row_cache import row_cache
 
 
 description_font_style = ft.TextStyle(
@@ -52,7 +55,196 @@ def render_tab_container(content: ft.Control):
         content=content,
     )
 
+
+def render_passport_content(passport: models.Passport) -> ft.Control:
+    """
+    Содержимое вкладки паспорта пациента
+    """
+
+    return ft.Column(
+        height=200,
+        width=300,
+        spacing=20,
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        alignment=ft.MainAxisAlignment.SPACE_AROUND,
+        controls=[
+            ft.Column(
+                spacing=10,
+                alignment=ft.MainAxisAlignment.START,
+                controls=[
+                    ft.Text(
+                        value=f"{passport.serial} {passport.number}",
+                        style=ft.TextStyle(
+                            size=20,
+                            weight=ft.FontWeight.W_500,
+                        ),
+                    ),
+                    render_description_item(
+                        title="Кем выдан",
+                        value=passport.issued_by,
+                    ),
+                    ft.Row(
+                        alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                        vertical_alignment=ft.CrossAxisAlignment.START,
+                        controls=[
+                            ft.Column(
+                                controls=[
+                                    render_description_item(
+                                        title="Дата выдачи",
+                                        value=passport.issued_date.strftime('%d.%m.%Y')
+                                    ),
+                                    render_description_item(
+                                        title="Код подразделения",
+                                        value="000-000",
+                                    ),
+                                ]
+                            ),
+                            ft.Column(
+                                [
+                                    render_description_item(
+                                        title="Дата рождения",
+                                        value=passport.date_of_birth.strftime('%d.%m.%Y')
+                                    ),
+                                    render_description_item(
+                                        title="Пол",
+                                        value="Мужской" if passport.gender == models.Gender.MALE else "Женский",
+                                    ),
+                                ]
+                            ),
+                        ],
+                    ),
+                    render_description_item(
+                        title="Адрес регистрации",
+                        value=passport.address,
+                    ),
+                ]
+            )
+        ],
+    )
+
+
+def render_insurance_content(insurance: models.Insurance) -> ft.Control:
+    """
+    Содержимое вкладки страхового полиса пациента
+    """
+
+    return ft.Column(
+        height=120,
+        spacing=20,
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        alignment=ft.MainAxisAlignment.SPACE_AROUND,
+        controls=[
+            ft.Column(
+                spacing=10,
+                alignment=ft.MainAxisAlignment.START,
+                controls=[
+                    ft.Text(
+                        value=f"{insurance.number}",
+                        style=ft.TextStyle(
+                            size=20,
+                        ),
+                    ),
+                    render_description_item(
+                        title="Кем выдан",
+                        value='ООО "РЕСО-Cтрахование"',
+                    ),
+                    ft.Row(
+                        vertical_alignment=ft.CrossAxisAlignment.START,
+                        controls=[
+                            ft.Column(
+                                controls=[
+                                    render_description_item(
+                                        title="Дата выдачи",
+                                        value=insurance.date_of_issue.strftime('%d.%m.%Y')
+                                    ),
+                                ]
+                            ),
+                            ft.Column(
+                                [
+                                    render_description_item(
+                                        title="Дата окончания",
+                                        value=insurance.date_expires.strftime('%d.%m.%Y')
+                                    ),
+                                ]
+                            )
+                        ],
+                        alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                    ),
+                ]
+            )
+        ],
+    )
+
+
+def render_med_card_content(med_card: models.MedCard, insurance: models.Insurance) -> ft.Control:
+    """
+    Содержимое вкладки медицинской карты пациента
+    """
+
+    return ft.Column(
+        height=100,
+        spacing=20,
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        alignment=ft.MainAxisAlignment.SPACE_AROUND,
+        controls=[
+            ft.Column(
+                spacing=10,
+                alignment=ft.MainAxisAlignment.START,
+                controls=[
+                    ft.Text(
+                        value=f"№{med_card.id}",
+                        style=ft.TextStyle(
+                            size=20,
+                        ),
+                    ),
+                    render_description_item(
+                        title="Кем выдан",
+                        value='Аганов Арам Арамович - лор эндокринолог',
+                    ),
+                    ft.Row(
+                        vertical_alignment=ft.CrossAxisAlignment.START,
+                        controls=[
+                            ft.Column(
+                                controls=[
+                                    render_description_item(
+                                        title="Дата выдачи",
+                                        value=insurance.date_of_issue.strftime('%d.%m.%Y')
+                                    ),
+                                ]
+                            ),
+                            ft.Column(
+                                [
+                                    render_description_item(
+                                        title="Дата окончания",
+                                        value="не обозначена",
+                                    ),
+                                ]
+                            )
+                        ],
+                        alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                    ),
+                ]
+            )
+        ],
+    )
+
+
+def get_patient_documents_version(patient: models.Patient) -> tuple[int, int]:
+    """
+    Версия документов пациента в общем кеше строк: меняется при каждой записи пациента.
+    :param patient: Пациент
+    :return: версия
+    """
+
+    return row_cache.get_version(models.Patient, patient.id)
+
+
 class DocumentsModal(ft.AlertDialog):
+    """
+    Окно документов пациента.
+    Содержимое вкладок строится при первом их открытии.
+    """
+
     def __init__(self, patient: models.Patient, **kwargs):
         super().__init__(**kwargs)
 
@@ -73,191 +265,35 @@ class DocumentsModal(ft.AlertDialog):
             alignment=ft.MainAxisAlignment.CENTER,
         )
 
-        passport = patient.passport
-        passport_content = ft.Column(
-            height=200,
-            width=300,
-            spacing=20,
-            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-            alignment=ft.MainAxisAlignment.SPACE_AROUND,
-            controls=[
-                ft.Column(
-                    spacing=10,
-                    alignment=ft.MainAxisAlignment.START,
-                    controls=[
-                        ft.Text(
-                            value=f"{passport.serial} {passport.number}",
-                            style=ft.TextStyle(
-                                size=20,
-                                weight=ft.FontWeight.W_500,
-                            ),
-                        ),
-                        render_description_item(
-                            title="Кем выдан",
-                            value=passport.issued_by,
-                        ),
-                        ft.Row(
-                            alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
-                            vertical_alignment=ft.CrossAxisAlignment.START,
-                            controls=[
-                                ft.Column(
-                                    controls=[
-                                        render_description_item(
-                                            title="Дата выдачи",
-                                            value=passport.issued_date.strftime('%d.%m.%Y')
-                                        ),
-                                        render_description_item(
-                                            title="Код подразделения",
-                                            value="000-000",
-                                        ),
-                                    ]
-                                ),
-                                ft.Column(
-                                    [
-                                        render_description_item(
-                                            title="Дата рождения",
-                                            value=passport.date_of_birth.strftime('%d.%m.%Y')
-                                        ),
-                                        render_description_item(
-                                            title="Пол",
-                                            value="Мужской" if passport.gender == models.Gender.MALE else "Женский",
-                                        ),
-                                    ]
-                                ),
-                            ],
-                        ),
-                        render_description_item(
-                            title="Адрес регистрации",
-                            value=passport.address,
-                        ),
-                    ]
-                )
-            ],
-        )
-
-        insurance = patient.insurance
-        insurance_content = ft.Column(
-            height=120,
-            spacing=20,
-            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-            alignment=ft.MainAxisAlignment.SPACE_AROUND,
-            controls=[
-                ft.Column(
-                    spacing=10,
-                    alignment=ft.MainAxisAlignment.START,
-                    controls=[
-                        ft.Text(
-                            value=f"{insurance.number}",
-                            style=ft.TextStyle(
-                                size=20,
-                            ),
-                        ),
-                        render_description_item(
-                            title="Кем выдан",
-                            value='ООО "РЕСО-Cтрахование"',
-                        ),
-                        ft.Row(
-                            vertical_alignment=ft.CrossAxisAlignment.START,
-                            controls=[
-                                ft.Column(
-                                    controls=[
-                                        render_description_item(
-                                            title="Дата выдачи",
-                                            value=insurance.date_of_issue.strftime('%d.%m.%Y')
-                                        ),
-                                    ]
-                                ),
-                                ft.Column(
-                                    [
-                                        render_description_item(
-                                            title="Дата окончания",
-                                            value=insurance.date_expires.strftime('%d.%m.%Y')
-                                        ),
-                                    ]
-                                )
-                            ],
-                            alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
-                        ),
-                    ]
-                )
-            ],
-        )
+        self._tab_builders: list[Callable[[], ft.Control]] = [
+            lambda: render_passport_content(patient.passport),
+            lambda: render_insurance_content(patient.insurance),
+            lambda: render_med_card_content(patient.med_card, patient.insurance),
+        ]
 
-        med_card = patient.med_card
-        med_card_content = ft.Column(
-            height=100,
-            spacing=20,
-            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-            alignment=ft.MainAxisAlignment.SPACE_AROUND,
-            controls=[
-                ft.Column(
-                    spacing=10,
-                    alignment=ft.MainAxisAlignment.START,
-                    controls=[
-                        ft.Text(
-                            value=f"№{med_card.id}",
-                            style=ft.TextStyle(
-                                size=20,
-                            ),
-                        ),
-                        render_description_item(
-                            title="Кем выдан",
-                            value='Аганов Арам Арамович - лор эндокринолог',
-                        ),
-                        ft.Row(
-                            vertical_alignment=ft.CrossAxisAlignment.START,
-                            controls=[
-                                ft.Column(
-                                    controls=[
-                                        render_description_item(
-                                            title="Дата выдачи",
-                                            value=insurance.date_of_issue.strftime('%d.%m.%Y')
-                                        ),
-                                    ]
-                                ),
-                                ft.Column(
-                                    [
-                                        render_description_item(
-                                            title="Дата окончания",
-                                            value="не обозначена",
-                                        ),
-                                    ]
-                                )
-                            ],
-                            alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
-                        ),
-                    ]
+        self._tabs = ft.Tabs(
+            height=550,
+            selected_index=0,
+            on_change=self.handle_tab_change,
+            tabs=[
+                ft.Tab(
+                    text="Паспорт",
+                ),
+                ft.Tab(
+                    text="Страховка",
+                ),
+                ft.Tab(
+                    text="Мед. карта",
                 )
-            ],
+            ]
         )
+        self.build_tab(0)
 
         self.title = None
         self.content = ft.Column(
             controls=[
                 patient_bio_container,
-                ft.Tabs(
-                    height=550,
-                    tabs=[
-                        ft.Tab(
-                            text="Паспорт",
-                            content=render_tab_container(
-                                passport_content
-                            ),
-                        ),
-                        ft.Tab(
-                            text="Страховка",
-                            content=render_tab_container(
-                                insurance_content
-                            ),
-                        ),
-                        ft.Tab(
-                            text="Мед. карта",
-                            content=render_tab_container(
-                                med_card_content,
-                            )
-                        )
-                    ]
-                )
+                self._tabs,
             ],
             spacing=20,
         )
@@ -268,4 +304,60 @@ class DocumentsModal(ft.AlertDialog):
             )
         ]
         self.actions_alignment = ft.MainAxisAlignment.END
-        self.modal = True
\ No newline at end of file
+        self.modal = True
+
+    def build_tab(self, index: int) -> bool:
+        """
+        Строит содержимое вкладки, если оно еще не было построено.
+        :param index: Индекс вкладки
+        :return: была ли вкладка построена сейчас
+        """
+
+        tab = self._tabs.tabs[index]
+        if tab.content is not None:
+            return False
+
+        tab.content = render_tab_container(
+            self._tab_builders[index]()
+        )
+        return True
+
+    def handle_tab_change(self, event: ft.ControlEvent):
+        if self.build_tab(int(event.control.selected_index)):
+            self._tabs.update()
+
+
+class DocumentsModalCache:
+    """
+    LRU-кеш построенных окон документов по ID пациента и версии его документов.
+    """
+
+    def __init__(self, max_size: int = settings.DOCUMENTS_MODAL_CACHE_SIZE):
+        self._max_size = max_size
+        self._modals: OrderedDict[int, tuple[tuple[int, int], DocumentsModal]] = OrderedDict()
+
+    def get(self, patient: models.Patient) -> DocumentsModal:
+        """
+        Возвращает окно документов пациента из кеша или строит новое.
+        :param patient: Пациент с загруженными документами
+        :return: окно документов
+        """
+
+        version = get_patient_documents_version(patient)
+        cached = self._modals.get(patient.id)
+
+        if cached and cached[0] == version:
+            self._modals.move_to_end(patient.id)
+            return cached[1]
+
+        modal = DocumentsModal(patient=patient)
+        self._modals[patient.id] = (version, modal)
+        self._modals.move_to_end(patient.id)
+
+        while len(self._modals) > self._max_size:
+            self._modals.popitem(last=False)
+
+        return modal
+
+    def invalidate(self, patient_id: int) -> None:
+        self._modals.pop(patient_id, None)
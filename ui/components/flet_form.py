@@ -12,8 +12,7 @@ import datetime
 import pydantic_core
 from pydantic._internal._model_construction import ModelMetaclass
 from pydantic.fields import FieldInfo
-import settings
-from ui.components.documents_modal import value_font_style
+from event_loop import run_sync
 
 type ChoiceCallback = typing.Callable[[typing.Any], tuple[str, typing.Any]]
 type ChoicesType = tuple[list[typing.Any], ChoiceCallback]
@@ -554,7 +553,7 @@ class FletForm(ft.UserControl):
             if self.__handle_form_submit and not asyncio.iscoroutinefunction(self.__handle_form_submit):
                 return self.__handle_form_submit(self.__values.copy())
             elif asyncio.iscoroutinefunction(self.__handle_form_submit):
-                return settings.LOOP.run_until_complete(self.__handle_form_submit(self.__values.copy()))
+                return run_sync(self.__handle_form_submit(self.__values.copy()))
 
         except pydantic.ValidationError as validation_error:
             self.handle_field_errors(validation_error)
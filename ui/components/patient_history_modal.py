@@ -0,0 +1,113 @@
+import flet as ft
+
+import models
+from event_loop import run_sync
+from modules.read_models import get_patient_history, AppointmentRecord, HistoryCursor
+
+# Сколько приемов загружается за один раз
+HISTORY_PAGE_SIZE = 20
+
+STATUS_LABELS = {
+    models.AppointmentStatuses.IN_QUEUE: 'Ожидается',
+    models.AppointmentStatuses.COMPLETED: 'Завершен',
+    models.AppointmentStatuses.CANCELED: 'Отменен',
+    models.AppointmentStatuses.NOT_CAME: 'Не явился',
+    models.AppointmentStatuses.RECREATED: 'Перенесен',
+}
+
+
+def render_history_item(record: AppointmentRecord) -> ft.Control:
+    return ft.ListTile(
+        leading=ft.Icon(
+            ft.icons.EVENT_AVAILABLE_OUTLINED
+            if record.status == models.AppointmentStatuses.COMPLETED
+            else ft.icons.EVENT_OUTLINED
+        ),
+        title=ft.Text(record.date_to_come.strftime('%d.%m.%Y %H:%M')),
+        subtitle=ft.Text(
+            f"{record.diagnosis.name if record.diagnosis else 'Без диагноза'} · {STATUS_LABELS[record.status]}"
+        ),
+    )
+
+
+class PatientHistoryModal(ft.AlertDialog):
+    """
+    Окно истории приемов пациента (от новых к старым).
+    Приемы загружаются страницами по кнопке "Показать еще".
+    """
+
+    def __init__(self, patient: models.Patient, **kwargs):
+        super().__init__(**kwargs)
+
+        self.patient = patient
+        self.include_archive = False
+        self._cursor: HistoryCursor | None = None
+
+        self._items = ft.ListView(
+            width=400,
+            height=450,
+            spacing=5,
+        )
+        self._load_more_button = ft.TextButton(
+            text="Показать еще",
+            on_click=lambda *_: self.handle_load_more(),
+        )
+
+        self.title = ft.Text(
+            f"История приемов: {patient.last_name} {patient.first_name} {patient.surname or ''}",
+            size=16,
+        )
+        self.content = ft.Column(
+            tight=True,
+            controls=[
+                ft.Checkbox(
+                    label='Включая архив',
+                    value=self.include_archive,
+                    on_change=self.handle_include_archive_change,
+                ),
+                self._items,
+                self._load_more_button,
+            ],
+        )
+        self.actions = [
+            ft.OutlinedButton(
+                text="Закрыть",
+                on_click=lambda *_: self.page.close(self),
+            )
+        ]
+        self.actions_alignment = ft.MainAxisAlignment.END
+        self.modal = True
+
+        self.load_page()
+
+    def load_page(self) -> None:
+        """
+        Загружает следующую страницу истории и добавляет ее в список.
+        """
+
+        records, self._cursor = run_sync(
+            get_patient_history(
+                self.patient.id,
+                before=self._cursor,
+                limit=HISTORY_PAGE_SIZE,
+                include_archive=self.include_archive,
+            )
+        )
+
+        self._items.controls.extend(render_history_item(record) for record in records)
+        if not self._items.controls:
+            self._items.controls.append(ft.Text("Приемов пока не было."))
+
+        self._load_more_button.visible = self._cursor is not None
+
+    def handle_load_more(self):
+        self.load_page()
+        self.update()
+
+    def handle_include_archive_change(self, event: ft.ControlEvent):
+        self.include_archive = event.control.value
+        self._cursor = None
+        self._items.controls.clear()
+
+        self.load_page()
+        self.update()
@@ -1,5 +1,5 @@
 import typing
-from typing import Callable, Any
+from typing import Callable, Any, Sequence
 
 import flet as ft
 import pydantic
@@ -8,17 +8,136 @@ type RowAction = tuple[ft.Control | str, [Callable[[type[pydantic.BaseModel]], t
 
 
 class PydanticTable(ft.UserControl):
+    """
+    Таблица записей. Записью может быть модель pydantic/ormar
+    или любой объект с атрибутами столбцов (например, именованный кортеж).
+    """
+
     def __init__(self,
                  columns_by_keys: dict[str, str],
-                 dataset: list[pydantic.BaseModel],
+                 dataset: Sequence[pydantic.BaseModel | Any],
                  displays: dict[str, Callable[[Any], str | int]] = None,
                  actions: list[RowAction] = None,
+                 key: str = 'id',
                  ):
         super().__init__()
         self._columns_by_keys = columns_by_keys
         self._displays = displays or {}
         self._actions = actions or []
-        self._dataset: list[pydantic.BaseModel] = dataset
+        self._dataset: Sequence[pydantic.BaseModel | Any] = dataset
+        # Атрибут записи, по которому строки обновляются и удаляются
+        self._key = key
+        self._table: ft.DataTable | None = None
+        self._rows_by_key: dict[Any, ft.DataRow] = {}
+
+    def render_row(self, item: pydantic.BaseModel | Any) -> ft.DataRow:
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(
+                    content=ft.Text(
+                        value=getattr(item, key) if not self._displays.get(key) else self._displays[key](getattr(item, key))
+                    )
+                ) for key in self._columns_by_keys.keys()
+            ] + [
+                ft.DataCell(
+                    content=ft.PopupMenuButton(
+                        items=[
+                            ft.PopupMenuItem(
+                                text=action[0],
+                                on_click=lambda *_, record=item, cb=action[1]: cb(record),
+                            ) for action in self._actions
+                        ]
+                    )
+                ) if self._actions else ft.Container()
+            ]
+        )
+
+    def render_rows(self) -> list[ft.DataRow]:
+        self._rows_by_key = {}
+        rows = []
+        for item in self._dataset:
+            row = self.render_row(item)
+            self._rows_by_key[getattr(item, self._key, None)] = row
+            rows.append(row)
+
+        return rows
+
+    def set_rows(self, items: Sequence[pydantic.BaseModel | Any]) -> None:
+        """
+        Заменяет все записи таблицы, не перестраивая сам элемент (например, после перезагрузки данных страницы).
+        :param items: Записи
+        """
+
+        self._dataset = list(items)
+        if self._table is None:
+            return
+
+        self._table.rows = self.render_rows()
+        if self._table.page:
+            self._table.update()
+
+    def has_row(self, key: Any) -> bool:
+        """
+        Проверяет, показана ли в таблице запись с ключом.
+        :param key: Ключ записи
+        :return: True, если запись есть в таблице
+        """
+
+        if self._table is None:
+            return any(getattr(item, self._key) == key for item in self._dataset)
+
+        return key in self._rows_by_key
+
+    def upsert_rows(self, items: Sequence[pydantic.BaseModel | Any]) -> None:
+        """
+        Заменяет строки записей с теми же ключами, новые записи добавляет в конец таблицы.
+        Остальные строки не перестраиваются.
+        :param items: Новые или измененные записи
+        """
+
+        if self._table is None:
+            self._dataset = list(self._dataset)
+            by_key = {getattr(item, self._key): index for index, item in enumerate(self._dataset)}
+            for item in items:
+                index = by_key.get(getattr(item, self._key))
+                if index is None:
+                    self._dataset.append(item)
+                else:
+                    self._dataset[index] = item
+            return
+
+        for item in items:
+            row = self.render_row(item)
+            old_row = self._rows_by_key.get(getattr(item, self._key))
+            if old_row is None:
+                self._table.rows.append(row)
+            else:
+                self._table.rows[self._table.rows.index(old_row)] = row
+            self._rows_by_key[getattr(item, self._key)] = row
+
+        if self._table.page:
+            self._table.update()
+
+    def remove_rows(self, keys: Sequence[Any]) -> None:
+        """
+        Удаляет строки записей с указанными ключами.
+        :param keys: Ключи записей
+        """
+
+        keys = set(keys)
+        if self._table is None:
+            self._dataset = [item for item in self._dataset if getattr(item, self._key) not in keys]
+            return
+
+        removed = [self._rows_by_key.pop(key) for key in keys if key in self._rows_by_key]
+        if not removed:
+            return
+
+        removed_ids = {id(row) for row in removed}
+        self._table.rows = [row for row in self._table.rows if id(row) not in removed_ids]
+
+        if self._table.page:
+            self._table.update()
 
     def build(self):
         columns = [
@@ -30,28 +149,7 @@ class PydanticTable(ft.UserControl):
             ) for _, value in self._columns_by_keys.items()
         ]
 
-        rows = [
-            ft.DataRow(
-                cells=[
-                    ft.DataCell(
-                        content=ft.Text(
-                            value=getattr(item, key) if not self._displays.get(key) else self._displays[key](getattr(item, key))
-                        )
-                    ) for key in self._columns_by_keys.keys()
-                ] + [
-                    ft.DataCell(
-                        content=ft.PopupMenuButton(
-                            items=[
-                                ft.PopupMenuItem(
-                                    text=action[0],
-                                    on_click=lambda *_, record=item, cb=action[1]: cb(record),
-                                ) for action in self._actions
-                            ]
-                        )
-                    ) if self._actions else ft.Container()
-                ]
-            ) for item in self._dataset
-        ]
+        rows = self.render_rows()
 
         if self._actions:
             columns.append(
@@ -65,5 +163,6 @@ class PydanticTable(ft.UserControl):
             columns=columns,
             rows=rows
         )
+        self._table = table
         self._content = table
         return self._content
@@ -2,9 +2,10 @@ import flet as ft
 
 import models
 import serializers
-import settings
-from ui.base_page import BasePage
-from modules.diagnosis import create_diagnosis, get_diagnoses
+from event_loop import run_sync
+from ui.base_page import BasePage, UserControl
+from modules.diagnosis import create_diagnosis, get_diagnoses, remove_diagnosis
+from modules.events import event_bus, DiagnosesChanged, ChangeAction
 from ui.components import PydanticTable, FletForm
 
 
@@ -14,6 +15,25 @@ class DiagnosesPage(BasePage):
     """
 
     all_diagnoses: list[models.Diagnosis]
+    all_diagnoses_table: PydanticTable
+
+    def __init__(self, page: ft.Page, user_storage: UserControl):
+        super().__init__(page, user_storage)
+        event_bus.subscribe(DiagnosesChanged, self.handle_diagnoses_changed)
+
+    async def handle_diagnoses_changed(self, event: DiagnosesChanged):
+        if not self._rendered:
+            return
+
+        ids = set(event.ids)
+        self.all_diagnoses = [diagnosis for diagnosis in self.all_diagnoses if diagnosis.id not in ids]
+        if event.action == ChangeAction.DELETED:
+            self.all_diagnoses_table.remove_rows(ids)
+            return
+
+        diagnoses = await get_diagnoses(trusted=True, ids=list(ids))
+        self.all_diagnoses.extend(diagnoses)
+        self.all_diagnoses_table.upsert_rows(diagnoses)
 
     async def handle_create_diagnosis_form_submit(self, data):
         diagnosis = await create_diagnosis(
@@ -23,30 +43,29 @@ class DiagnosesPage(BasePage):
             f"Диагноз {diagnosis.name} успешно создан."
         )
 
-        await self.refresh_data()
-        self.page.go('/', skip_route_change_event=False)
-        self.page.go('/diagnoses', skip_route_change_event=False)
-
     async def refresh_data(self):
-        self.all_diagnoses = await get_diagnoses()
+        self.all_diagnoses = await get_diagnoses(trusted=True)
+
+    async def reload_data(self) -> bool:
+        await self.refresh_data()
+        self.all_diagnoses_table.set_rows(self.all_diagnoses)
+        return True
 
     async def delete_diagnosis(self, diagnosis: models.Diagnosis):
-        await diagnosis.delete()
-        self.page.go('/')
-        self.page.go('/diagnoses')
+        await remove_diagnosis(diagnosis)
         return self.create_success_message(f"Диагноз {diagnosis.name} успешно удален!")
 
     async def render(self) -> ft.Control:
         await self.refresh_data()
 
-        all_diagnoses_table = PydanticTable(
+        self.all_diagnoses_table = PydanticTable(
             dataset=self.all_diagnoses,
             columns_by_keys={
                 'id': 'ID',
                 'name': 'Название',
             },
             actions=[
-                ("Удалить", lambda record: settings.LOOP.run_until_complete(
+                ("Удалить", lambda record: run_sync(
                     self.delete_diagnosis(record)
                 ))
             ]
@@ -73,7 +92,7 @@ class DiagnosesPage(BasePage):
                         tabs=[
                             ft.Tab(
                                 content=ft.Container(
-                                    content=all_diagnoses_table,
+                                    content=self.all_diagnoses_table,
                                     alignment=ft.alignment.top_center,
                                 ),
                                 text='Все диагнозы',
@@ -11,6 +11,8 @@ class LoginPage(BasePage):
     Страница авторизации проекта
     """
 
+    stale_after = None
+
     async def handle_form_submit(self, data):
         user = await models.User.objects.get_or_none(username=data.get('username'))
         if not user:
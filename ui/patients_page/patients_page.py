@@ -4,57 +4,144 @@ import flet as ft
 
 import models
 import serializers
-import settings
-from ui.base_page import BasePage
-from ui.components import PydanticTable, FletForm, DocumentsModal
-from modules.patient import get_patients, create_patient
+from event_loop import run_sync
+from ui.base_page import BasePage, UserControl
+from ui.components import PydanticTable, FletForm, DocumentsModalCache, PatientHistoryModal
+from modules.patient import get_patients_list, create_patient, get_patient, remove_patient, SimilarPatientsExist
+from modules.search import search_patients
 from modules.diagnosis import get_diagnoses
+from modules.events import event_bus, PatientsChanged, ChangeAction
 
 
 class PatientsPage(BasePage):
     patients: list[models.Patient]
+    patients_table_container: ft.Container
+    patients_table: PydanticTable
+    search_query: str = ''
 
-    async def handle_create_patient_form_submit(self, data):
+    def __init__(self, page: ft.Page, user_storage: UserControl):
+        super().__init__(page, user_storage)
+        self.documents_modals = DocumentsModalCache()
+        event_bus.subscribe(PatientsChanged, self.handle_patients_changed)
+
+    async def handle_patients_changed(self, event: PatientsChanged):
+        """
+        Обновляет строки измененных пациентов (в том числе из других сессий) без перерисовки страницы.
+        """
+
+        if not self._rendered:
+            return
+
+        ids = set(event.ids)
+        for patient_id in ids:
+            self.documents_modals.invalidate(patient_id)
+
+        self.patients = [patient for patient in self.patients if patient.id not in ids]
+        if event.action == ChangeAction.DELETED:
+            self.patients_table.remove_rows(ids)
+            return
+
+        patients = await get_patients_list(ids=list(ids))
+        self.patients.extend(patients)
+
+        # В результатах поиска обновляем только уже показанных пациентов
+        if self.search_query:
+            patients = [patient for patient in patients if self.patients_table.has_row(patient.id)]
+
+        self.patients_table.upsert_rows(patients)
+
+    async def handle_create_patient_form_submit(self, data, allow_similar: bool = False):
         try:
             patient = await create_patient(
                 serializers.PatientFormSerializer(
                     **data,
-                )
+                ),
+                allow_similar=allow_similar,
             )
             self.create_success_message(
                 f"Запись пациента {patient.first_name} успешно создана."
             )
-
-            await self.refresh_data()
-            self.page.go('/', skip_route_change_event=False)
-            self.page.go('/patients', skip_route_change_event=False)
+        except SimilarPatientsExist as exception:
+            self.open_similar_patients_dialog(data, exception)
         except Exception as exception:
             self.create_error_message(str(exception))
 
+    def open_similar_patients_dialog(self, data: dict, exception: SimilarPatientsExist):
+        """
+        Предлагает подтвердить создание пациента, похожего на уже зарегистрированного.
+        """
+
+        def handle_confirm(*_):
+            self.page.close(dialog)
+            run_sync(self.handle_create_patient_form_submit(data, allow_similar=True))
+
+        dialog = ft.AlertDialog(
+            title=ft.Text("Возможный дубль пациента"),
+            modal=True,
+            content=ft.Text(
+                f"{exception}\n\nВсе равно создать нового пациента?"
+            ),
+            actions=[
+                ft.FilledButton(
+                    text="Создать",
+                    on_click=handle_confirm,
+                ),
+                ft.OutlinedButton(
+                    text="Отмена",
+                    style=ft.ButtonStyle(
+                        color=ft.colors.RED,
+                    ),
+                    on_click=lambda *_: self.page.close(dialog),
+                ),
+            ]
+        )
+
+        self.page.open(dialog)
+
     async def refresh_data(self):
-        self.patients = await get_patients()
+        self.patients = await get_patients_list()
 
-    async def handle_delete_patient(self, patient: models.Patient):
-        await patient.delete()
+    async def reload_data(self) -> bool:
+        await self.refresh_data()
+
+        # Результаты поиска остаются на экране, новый список покажется после очистки поиска
+        if not self.search_query:
+            self.patients_table.set_rows(self.patients)
 
-        self.page.go('/')
-        self.page.go('/patients')
+        return True
+
+    async def handle_delete_patient(self, patient: models.Patient):
+        await remove_patient(patient)
 
         return self.create_success_message(
             f"Пациент {patient.first_name} {patient.last_name} успешно удален!"
         )
 
     def render_documents_dialog(self, patient: models.Patient):
-        documents_dialog = DocumentsModal(
-            patient=patient,
+        patient = run_sync(
+            get_patient(patient.id)
         )
+        if not patient:
+            return self.create_error_message("Пациент не найден.")
+
+        documents_dialog = self.documents_modals.get(patient)
         self.page.open(documents_dialog)
 
-    async def render(self) -> ft.Control:
-        await self.refresh_data()
+    def render_history_dialog(self, patient: models.Patient):
+        self.page.open(PatientHistoryModal(patient=patient))
+
+    async def handle_search_change(self, event: ft.ControlEvent):
+        query = event.control.value or ''
+        patients = await search_patients(query, limit=50) if query.strip() else self.patients
+        self.search_query = query.strip()
+
+        self.patients_table = self.render_patients_table(patients)
+        self.patients_table_container.content = self.patients_table
+        self.patients_table_container.update()
 
-        all_patients_table = PydanticTable(
-            dataset=self.patients,
+    def render_patients_table(self, patients: list[models.Patient]) -> PydanticTable:
+        return PydanticTable(
+            dataset=patients,
             columns_by_keys={
                 'id': 'ID',
                 'first_name': 'Имя',
@@ -73,10 +160,28 @@ class PatientsPage(BasePage):
             actions=[
                 ("Госпитализация", lambda record: self.create_success_message(f'Госпитализация назначена для пациента {record.first_name}!')),
                 ("Документы", lambda record: self.render_documents_dialog(record)),
-                ("Удалить", lambda record: settings.LOOP.run_until_complete(self.handle_delete_patient(record))),
+                ("История приемов", lambda record: self.render_history_dialog(record)),
+                ("Удалить", lambda record: run_sync(self.handle_delete_patient(record))),
             ]
         )
 
+    async def render(self) -> ft.Control:
+        await self.refresh_data()
+        self.search_query = ''
+
+        self.patients_table = self.render_patients_table(self.patients)
+        self.patients_table_container = ft.Container(
+            content=self.patients_table,
+            alignment=ft.alignment.top_center,
+        )
+
+        search_field = ft.TextField(
+            label="Поиск: ФИО, телефон, паспорт или полис",
+            prefix_icon=ft.icons.SEARCH,
+            width=500,
+            on_change=lambda event: run_sync(self.handle_search_change(event)),
+        )
+
         create_patient_form = FletForm(
             model=serializers.PatientFormSerializer,
             handle_form_submit=self.handle_create_patient_form_submit,
@@ -104,9 +209,12 @@ class PatientsPage(BasePage):
                         tab_alignment=ft.TabAlignment.CENTER,
                         tabs=[
                             ft.Tab(
-                                content=ft.Container(
-                                    content=all_patients_table,
-                                    alignment=ft.alignment.top_center,
+                                content=ft.Column(
+                                    horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                                    controls=[
+                                        search_field,
+                                        self.patients_table_container,
+                                    ],
                                 ),
                                 text='Все пациенты',
                                 icon=ft.icons.BOOK_ONLINE_OUTLINED,
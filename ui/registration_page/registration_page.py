@@ -2,6 +2,7 @@ import flet as ft
 
 import models
 import serializers
+from modules.unique_keys import unique_keys, UniqueKeysFilter
 from ui.components.flet_form import FletForm
 from ui.base_page import BasePage
 
@@ -11,12 +12,17 @@ class RegistrationPage(BasePage):
     Страница авторизации проекта
     """
 
+    stale_after = None
+
     async def handle_form_submit(self, data):
-        user = await models.User.objects.get_or_none(
+        user_exists = unique_keys.might_exist(
+            UniqueKeysFilter.USERNAME,
+            data.get('username'),
+        ) and await models.User.objects.filter(
             username=data.get('username'),
-        )
+        ).exists()
 
-        if user:
+        if user_exists:
             return self.create_error_message(
                 'Пользователь с указанными данными уже существует.',
             )
@@ -24,6 +30,7 @@ class RegistrationPage(BasePage):
         created_user = await models.User.objects.create(
             **data,
         )
+        unique_keys.register(UniqueKeysFilter.USERNAME, created_user.username)
         self.user_storage.set_user(created_user)
         self.page.route = '/'
         self.page.update()
@@ -0,0 +1,208 @@
+"""
+Веб-режим приложения: несколько процессов-обработчиков за одним портом.
+
+Каждый процесс - обычное приложение (main.run_app) со своим циклом событий и
+своим пулом подключений к БД, слушающее порт WEB_PORT + 1 + номер процесса.
+На WEB_PORT работает TCP-прокси с привязкой клиента к процессу по хешу IP-адреса:
+сессия Flet живет в памяти процесса, поэтому все подключения клиента
+(в том числе переподключения websocket) должны попадать в один и тот же процесс.
+
+Кеши процессов (кеш строк, индекс поиска, занятость слотов) согласуются через
+брокер событий: если EVENT_BROKER_URL не задан, брокер запускается вместе с прокси.
+Фоновые задачи выполняются только в первом процессе.
+
+Запуск: python web.py [--workers 4] [--host 0.0.0.0] [--port 8550]
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import zlib
+from urllib.parse import urlsplit
+
+import settings
+from event_broker import run_broker
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд ждать, пока процесс начнет принимать подключения (первый процесс обновляет схему БД)
+WORKER_START_TIMEOUT = 120
+
+# Как часто (в секундах) проверяется, что процессы живы
+WORKER_CHECK_INTERVAL = 1
+
+# Размер буфера пересылки прокси
+PROXY_BUFFER_SIZE = 64 * 1024
+
+
+def run_worker(index: int, port: int, broker_url: str) -> None:
+    """
+    Точка входа процесса-обработчика.
+    :param index: Номер процесса
+    :param port: Порт веб-сервера процесса
+    :param broker_url: Адрес брокера событий
+    """
+
+    settings.EVENT_BROKER_URL = broker_url
+
+    # Импорт подключается к БД, поэтому выполняется уже в процессе-обработчике
+    from main import run_app
+
+    run_app(view=None, host='127.0.0.1', port=port, background_tasks=index == 0)
+
+
+def get_worker_ports(address: str, ports: list[int]) -> list[int]:
+    """
+    Порты процессов в порядке попыток подключения: сначала процесс, закрепленный за адресом клиента.
+    """
+
+    start = zlib.crc32(address.encode()) % len(ports)
+    return ports[start:] + ports[:start]
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while data := await reader.read(PROXY_BUFFER_SIZE):
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class StickyProxy:
+    """
+    TCP-прокси, направляющий все подключения одного IP-адреса в один процесс.
+    Если процесс недоступен (перезапускается), подключение уходит в следующий.
+    """
+
+    def __init__(self, ports: list[int]):
+        self.ports = ports
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        address = writer.get_extra_info('peername')[0]
+
+        for port in get_worker_ports(address, self.ports):
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection('127.0.0.1', port)
+                break
+            except OSError:
+                continue
+        else:
+            logger.error('Нет доступных процессов для подключения %s', address)
+            writer.close()
+            return
+
+        await asyncio.gather(
+            pipe(reader, upstream_writer),
+            pipe(upstream_reader, writer),
+        )
+
+
+class WorkerPool:
+    """
+    Процессы-обработчики веб-режима. Завершившиеся процессы перезапускаются.
+    """
+
+    def __init__(self, ports: list[int], broker_url: str):
+        self.ports = ports
+        self.broker_url = broker_url
+        self.processes: list[multiprocessing.Process | None] = [None] * len(ports)
+        # Чистый процесс без унаследованных подключений к БД и циклов событий
+        self._context = multiprocessing.get_context('spawn')
+
+    def start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self.ports[index], self.broker_url),
+            name=f'worker-{index}',
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info('Процесс %d запущен на порту %d (pid %d)', index, self.ports[index], process.pid)
+
+    async def start(self) -> None:
+        # Первый процесс создает и обновляет схему БД, остальные запускаются после него
+        self.start_worker(0)
+        await wait_for_port(self.ports[0], WORKER_START_TIMEOUT)
+
+        for index in range(1, len(self.ports)):
+            self.start_worker(index)
+
+    async def watch(self) -> None:
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive():
+                    logger.warning('Процесс %d завершился с кодом %s, перезапуск', index, process.exitcode)
+                    self.start_worker(index)
+
+    def stop(self) -> None:
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+
+        for process in self.processes:
+            if process is not None:
+                process.join(10)
+
+
+async def wait_for_port(port: int, timeout: float) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while True:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            if loop.time() > deadline:
+                raise Exception(f'Процесс на порту {port} не запустился за {timeout} с.')
+            await asyncio.sleep(0.5)
+
+
+async def serve(host: str, port: int, workers_count: int) -> None:
+    """
+    Запускает брокер событий, процессы-обработчики и прокси.
+    :param host: Адрес прокси
+    :param port: Порт прокси (процессы слушают следующие порты)
+    :param workers_count: Количество процессов
+    """
+
+    tasks = []
+    broker_url = settings.EVENT_BROKER_URL
+    if not broker_url:
+        broker_url = settings.WEB_EVENT_BROKER_URL
+        broker_address = urlsplit(broker_url)
+        tasks.append(asyncio.create_task(run_broker(broker_address.hostname, broker_address.port)))
+
+    workers = WorkerPool([port + 1 + index for index in range(workers_count)], broker_url)
+    try:
+        await workers.start()
+
+        proxy = StickyProxy(workers.ports)
+        server = await asyncio.start_server(proxy.handle_client, host, port)
+        logger.info('Веб-режим: %d процессов, подключения на %s:%d', workers_count, host, port)
+
+        async with server:
+            await asyncio.gather(server.serve_forever(), workers.watch(), *tasks)
+    finally:
+        workers.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default=settings.WEB_HOST)
+    parser.add_argument('--port', type=int, default=settings.WEB_PORT)
+    parser.add_argument('--workers', type=int, default=settings.WEB_WORKERS or os.cpu_count())
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=settings.LOG_LEVEL)
+    try:
+        asyncio.run(serve(arguments.host, arguments.port, arguments.workers))
+    except KeyboardInterrupt:
+        pass